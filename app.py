@@ -1,122 +1,206 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, jsonify, g, Response, stream_with_context, make_response, session, has_request_context
 import sqlite3
-from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_DOWN
+import hashlib
+import hmac
+import json
+import io
+from http.cookies import SimpleCookie
+from datetime import date, datetime, timedelta
 import os
+import time
 import logging
-from locale import setlocale, LC_ALL
-import locale
 from functools import wraps
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+import click
+from itsdangerous import BadSignature
+
+from errors import DatabaseError, NotFoundError, ValidationError, InsufficientFundsError, DateValidationError
+from validators import format_currency, validate_amount, validate_date
+from cache import ResponseCache, data_version
+from db import DATABASE, pooled_connection, release_connection
+from archive import archive_before, clear_ledger, enable_incremental_vacuum, incremental_vacuum
+from importer import decode_lines, detect_format, read_rows, import_expenses
+from export import FORMATS as EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES, TABLES as EXPORT_TABLES, check_export, export_table, filename as export_filename
+from dashboard import FRAGMENTS, dashboard_snapshot, fragment_json, snapshot_json
+from forecast import available as forecast_available, check_forecast, forecast_goal, forecast_json
+from listing import build_query, fetch_page, iter_rows, parse_limit, serialize_expense, serialize_investment
+from metrics import REGISTRY, RequestStats
+from migrations import migrate, schema_version
+from precompile import COMPILED_TEMPLATES, compile_templates, compiled_loader
+from tenants import DEFAULT_TENANT, LEDGER_DIR, TENANT_HEADER, TRUST_TENANT_HEADER, iter_ledgers, ledger_key, ledger_path, normalize_tenant, tenant_connection
+from recurring import add_rule, delete_rule, list_rules, materialize_due, resume_rule, serialize_rule
+from scheduler import RECURRING_INTERVAL, start_scheduler
+from search import SEARCH_SCHEMA, rebuild_index, search_expenses
+from broker import get_broker
+from reports import GRAINS, bucket_start, shift as shift_period, summary, refresh as refresh_rollups, verify_rollups, SOURCES as ROLLUP_SOURCES
+from totals import TOTALS_SCHEMA, rebuild_totals, verify_totals
+from storage import SQLiteStorage
+from valuation import PRICES_DIR, PriceStore, check_valuation, performance, performance_json
+
 logger = logging.getLogger(__name__)
 
-# Create Flask app
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Required for flash messages
+# Investment types accepted by the forms and recurring rules
+INVESTMENT_TYPES = ["Stocks", "Bonds", "Mutual Funds", "Real Estate", "Other"]
 
-# Set locale to Indian English for proper currency formatting
-try:
-    setlocale(LC_ALL, 'en_IN.UTF-8')
-except:
-    try:
-        setlocale(LC_ALL, 'en_IN')
-    except:
-        setlocale(LC_ALL, '')  # Fallback to system default
+# Routes, hooks and CLI commands; create_app() registers them on a new app
+bp = Blueprint('finance', __name__, cli_group=None)
 
-# Database configuration
-DATABASE = 'finance.db'
+def create_app(config: dict = None) -> Flask:
+    """Build the web app.
 
-# Ensure directories exist
-os.makedirs("static", exist_ok=True)
-os.makedirs("templates", exist_ok=True)
+    Nothing here touches the filesystem or the database: each ledger's schema
+    is created or migrated on its first connection (tenants.tenant_connection),
+    and templates are loaded from the modules written by
+    'flask compile-templates' when those are present and current.
+    """
+    logging.basicConfig(level=logging.INFO)
+    # The templates ship next to this module; there are no static files
+    app = Flask(__name__, template_folder='.', static_folder=None)
+    # Required for flash messages, the selected ledger and ledger keys; set it so every worker shares them
+    app.secret_key = os.environ.get('FINANCE_SECRET_KEY') or os.urandom(24)
+    app.config['TRUST_TENANT_HEADER'] = TRUST_TENANT_HEADER
+    app.config['DATABASE'] = DATABASE
+    app.config['LEDGER_DIR'] = LEDGER_DIR
+    app.config['COMPILED_TEMPLATES'] = os.path.join(app.root_path, COMPILED_TEMPLATES)
+    app.config['PRICES_DIR'] = PRICES_DIR
+    app.config['RECURRING_INTERVAL'] = RECURRING_INTERVAL
+    if config:
+        app.config.update(config)
 
-# Custom exceptions
-class DatabaseError(Exception):
-    pass
+    loader = compiled_loader(app.config['COMPILED_TEMPLATES'], app.root_path)
+    if loader is not None:
+        # Replaces Flask's dispatching loader, which needs template sources
+        app.jinja_env.loader = loader
+    # Per-worker cache of dashboard view models and /api/* bodies, invalidated by data_version
+    app.extensions['response_cache'] = ResponseCache(maxsize=256, ttl=300)
+    # Price files are only read when an investment is first valued
+    app.extensions['price_store'] = PriceStore(app.config['PRICES_DIR'])
+    app.register_blueprint(bp)
+    app.teardown_appcontext(release_db)
+    return app
 
-class ValidationError(Exception):
-    pass
+def get_response_cache() -> ResponseCache:
+    return current_app.extensions['response_cache']
 
-class InsufficientFundsError(Exception):
-    pass
+def current_tenant() -> str:
+    """The ledger this request or command works on.
 
-class DateValidationError(Exception):
-    pass
+    Taken from the X-Tenant header when TRUST_TENANT_HEADER says an
+    authenticating proxy sets it, else the ledger this browser session
+    unlocked with its key (switch_ledger), else the default ledger.
+    """
+    if 'tenant' not in g:
+        tenant = DEFAULT_TENANT
+        if has_request_context():
+            header = request.headers.get(TENANT_HEADER) if current_app.config['TRUST_TENANT_HEADER'] else None
+            tenant = normalize_tenant(header or session.get('tenant') or DEFAULT_TENANT)
+        g.tenant = tenant
+    return g.tenant
 
-def get_db():
-    """Get database connection with improved error handling."""
+def session_tenant(app: Flask, cookie_header: str):
+    """The ledger unlocked with POST /ledger/<name>, read from a Cookie header outside a request.
+
+    asgi.py serves part of the API without Flask's request handling; this
+    decodes the session cookie with the app's own serializer, so both tiers
+    agree on a browser's ledger. None when there is no valid session.
+    """
+    morsel = SimpleCookie(cookie_header or '').get(app.config['SESSION_COOKIE_NAME'])
+    serializer = app.session_interface.get_signing_serializer(app)
+    if morsel is None or serializer is None:
+        return None
     try:
-        db = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-        return db
-    except Exception as e:
-        logger.error(f"Failed to connect to database: {str(e)}")
-        raise DatabaseError("Failed to connect to database")
+        data = serializer.loads(morsel.value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('tenant')
+
+def get_db():
+    """Get the pooled connection to the current ledger's database, bound to the app context.
+
+    Requests never create a ledger other than the default one; naming a
+    missing ledger raises NotFoundError, answered with a 404.
+    """
+    if 'db' not in g:
+        tenant = current_tenant()
+        path = ledger_path(tenant, current_app.config['DATABASE'], current_app.config['LEDGER_DIR'])
+        try:
+            g.db = tenant_connection(path, create=tenant == DEFAULT_TENANT or not has_request_context())
+            g.db.stats = g.get('request_stats')
+        except NotFoundError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to connect to database: {str(e)}")
+            raise DatabaseError("Failed to connect to database")
+    return g.db
+
+def get_storage() -> SQLiteStorage:
+    """The current ledger's storage backend, bound to the app context."""
+    if 'storage' not in g:
+        g.storage = SQLiteStorage(get_db())
+    return g.storage
+
+def release_db(exception):
+    """Return the request's connection to the pool."""
+    g.pop('storage', None)
+    db = g.pop('db', None)
+    if db is not None:
+        db.stats = None
+        release_connection(db)
+
+@bp.before_app_request
+def start_request_metrics():
+    """Start timing the request and counting the queries it issues."""
+    g.request_stats = RequestStats(request.url_rule.rule if request.url_rule else 'unmatched')
+    g.request_started = time.perf_counter()
+
+@bp.before_app_request
+def start_recurring_scheduler():
+    """Start this worker's recurring-transaction scheduler with its first request.
+
+    Not under TESTING (or with RECURRING_INTERVAL 0): test clients write and
+    migrate ledgers themselves, and a background pass would race them.
+    """
+    if current_app.testing or not current_app.config['RECURRING_INTERVAL']:
+        return
+    if 'recurring_scheduler' not in current_app.extensions:
+        current_app.extensions['recurring_scheduler'] = start_scheduler(
+            current_app.config['DATABASE'], current_app.config['LEDGER_DIR'],
+            current_app.config['RECURRING_INTERVAL'])
+
+@bp.after_app_request
+def record_request_metrics(response):
+    """Record the request's latency and query count under its route."""
+    stats = g.get('request_stats')
+    if stats is not None:
+        REGISTRY.observe_request(stats.route, request.method, response.status_code,
+                                 time.perf_counter() - g.request_started, stats)
+    return response
 
 def init_db():
-    """Initialize database tables."""
+    """Create the database tables or migrate an existing database to the current schema."""
     try:
-        db = get_db()
-        with app.open_resource('schema.sql', mode='r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
-        logger.info("Database initialized successfully")
+        version = migrate(get_db())
+        logger.info(f"Database initialized successfully (schema version {version})")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise DatabaseError("Failed to initialize database")
-    finally:
-        db.close()
 
-def format_currency(amount: float) -> str:
-    """Format amount as Indian Rupees with proper formatting."""
-    try:
-        return f"₹{amount:,.2f}"
-    except:
-        return f"₹{amount:.2f}"
+bp.app_template_filter('currency')(format_currency)
 
-def validate_amount(amount: float) -> float:
-    """Validate and format amount to 2 decimal places."""
-    try:
-        amount = float(amount)
-        if amount <= 0:
-            raise ValidationError("Amount must be positive")
-        return float(Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_DOWN))
-    except (ValueError, TypeError):
-        raise ValidationError("Invalid amount format")
-
-def validate_date(date_str: str) -> datetime:
-    """Validate and parse date string."""
-    try:
-        return datetime.strptime(date_str, '%Y-%m-%d')
-    except ValueError:
-        raise ValidationError("Invalid date format. Use YYYY-MM-DD")
-
-def get_total_allocations() -> float:
+def get_total_allocations() -> int:
     """Calculate total allocations (expenses + investments + budgets)."""
     try:
-        db = get_db()
-        expenses = db.execute('SELECT COALESCE(SUM(amount), 0) FROM expenses').fetchone()[0]
-        investments = db.execute('SELECT COALESCE(SUM(amount), 0) FROM investments').fetchone()[0]
-        budgets = db.execute('SELECT COALESCE(SUM(amount), 0) FROM budget').fetchone()[0]
-        return expenses + investments + budgets
+        return get_storage().allocation_total()
     except Exception as e:
         logger.error(f"Error calculating total allocations: {str(e)}")
         raise DatabaseError("Failed to calculate total allocations")
-    finally:
-        db.close()
 
-def check_income_set() -> float:
+def check_income_set() -> int:
     """Check if income is set and return the latest income."""
-    try:
-        db = get_db()
-        income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
-        if not income:
-            raise ValidationError("Please set your income first")
-        return income[0]
-    finally:
-        db.close()
+    income = get_storage().latest_income()
+    if income is None:
+        raise ValidationError("Please set your income first")
+    return income
 
 def handle_database_error(f):
     """Decorator to handle database errors with improved error handling."""
@@ -128,6 +212,8 @@ def handle_database_error(f):
             logger.warning(f"Validation error in {f.__name__}: {str(e)}")
             flash(str(e), "warning")
             return render_template('error.html', error=str(e)), 400
+        except NotFoundError as e:
+            return render_template('error.html', error=str(e)), 404
         except InsufficientFundsError as e:
             logger.warning(f"Insufficient funds error in {f.__name__}: {str(e)}")
             flash(str(e), "warning")
@@ -142,422 +228,830 @@ def handle_database_error(f):
             return render_template('error.html', error="Unexpected error occurred"), 500
     return decorated_function
 
+def cached_response(f=None, *, daily: bool = False):
+    """Serve a GET view from the response cache, with ETag/Last-Modified revalidation.
+
+    Bodies are cached per URL and data version; a request whose validators
+    still match costs one version lookup and gets a 304. With daily, for
+    views whose figures move with the calendar (forecasts, report windows),
+    today's date is part of the key and the validators as well, so a new
+    day gets a fresh body even when nothing was written.
+    """
+    if f is None:
+        return lambda f: cached_response(f, daily=daily)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        version, modified_at = data_version(get_db())
+        day = datetime.utcnow().date() if daily else None
+        unchanged = not_modified(version, modified_at, day)
+        if unchanged:
+            return unchanged
+        key = (current_tenant(), f.__name__, request.full_path, day)
+        cached = get_response_cache().get(key, version)
+        if cached is None:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            cached = (response.get_data(), response.mimetype)
+            get_response_cache().set(key, version, cached)
+        body, mimetype = cached
+        response = Response(body, mimetype=mimetype)
+        set_validators(response, version, modified_at, day)
+        return response.make_conditional(request)
+    return decorated_function
+
+def set_validators(response, version: int, modified_at: float, day: date = None) -> None:
+    """Attach the data-version ETag and Last-Modified headers, requiring revalidation.
+
+    With day, both also change when that day starts.
+    """
+    last_modified = datetime.utcfromtimestamp(modified_at)
+    etag = f"{current_tenant()}.v{version}"
+    if day is not None:
+        etag = f"{etag}.{day.isoformat()}"
+        last_modified = max(last_modified, datetime.combine(day, datetime.min.time()))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+
+def not_modified(version: int, modified_at: float, day: date = None):
+    """Return a 304 response if the client's validators still match, else None."""
+    response = Response()
+    set_validators(response, version, modified_at, day)
+    response = response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
 # Routes with improved error handling
-@app.route('/')
+@bp.route('/')
 def home():
     """Home route that renders dashboard directly instead of redirecting."""
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('finance.dashboard'))
+
+@bp.route('/ledger/<name>', methods=['POST'])
+@handle_database_error
+def switch_ledger(name):
+    """Work on another household's ledger for the rest of this browser session.
 
-@app.route('/dashboard')
+    The form's key field must hold the ledger's key ('flask create-ledger'
+    prints it); the default ledger needs none.
+    """
+    tenant = normalize_tenant(name)
+    if tenant != DEFAULT_TENANT:
+        if not hmac.compare_digest(request.form.get('key', ''), ledger_key(current_app.secret_key, tenant)):
+            raise ValidationError("Invalid key for this ledger")
+        if not os.path.exists(ledger_path(tenant, current_app.config['DATABASE'], current_app.config['LEDGER_DIR'])):
+            raise NotFoundError("No such ledger")
+    session['tenant'] = tenant
+    flash(f"Switched to ledger '{tenant}'", "success")
+    return redirect(url_for('finance.dashboard'))
+
+@bp.route('/dashboard')
 @handle_database_error
 def dashboard():
-    """Main dashboard view with improved error handling."""
-    db = None
+    """Dashboard page shell; the figures load from /dashboard/fragments/<name>.
+
+    The shell holds no ledger data, so unless flash messages are pending it
+    is rendered once and served from the cache.
+    """
     try:
-        db = get_db()
-        
-        # Get latest income with proper error handling
-        income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
-        total_income = income[0] if income else 0
+        # Pending flash messages are part of the page, so only cache the shell without them
+        if session.get('_flashes'):
+            response = make_response(render_template('index.html'))
+            response.cache_control.no_cache = True
+            return response
+        cached = get_response_cache().get(('dashboard-shell',), 0)
+        if cached is None:
+            body = render_template('index.html').encode()
+            cached = (body, content_etag('shell', body))
+            get_response_cache().set(('dashboard-shell',), 0, cached)
+        body, etag = cached
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Error in dashboard route: {str(e)}")
+        flash("An error occurred while loading the dashboard.", "error")
+        return render_template('error.html', error="Failed to load dashboard"), 500
 
-        # Get total expenses with error handling
-        try:
-            expenses = db.execute('SELECT COALESCE(SUM(amount), 0) FROM expenses').fetchone()[0]
-        except Exception as e:
-            logger.error(f"Error fetching expenses: {str(e)}")
-            expenses = 0
+def content_etag(name: str, body: bytes) -> str:
+    """ETag derived from a body's content, so a part whose output did not change keeps its tag."""
+    return f"{name}.{hashlib.sha1(body).hexdigest()[:16]}"
 
-        # Get total investments with error handling
-        try:
-            investments = db.execute('SELECT COALESCE(SUM(amount), 0) FROM investments').fetchone()[0]
-        except Exception as e:
-            logger.error(f"Error fetching investments: {str(e)}")
-            investments = 0
+def dashboard_part(db, version: int, kind: str, name: str) -> tuple:
+    """A dashboard fragment as (body, etag), kind 'html' or 'json', rendered at most once per data version.
 
-        # Get savings goal with error handling
-        try:
-            savings_goal = db.execute('SELECT amount FROM savings_goals ORDER BY date DESC LIMIT 1').fetchone()
-            savings_target = savings_goal[0] if savings_goal else 0
-        except Exception as e:
-            logger.error(f"Error fetching savings goal: {str(e)}")
-            savings_target = 0
+    The tags hash the output, so after a write only the fragments it changed get new ones.
+    """
+    key = (current_tenant(), 'dashboard-parts')
+    parts = get_response_cache().get(key, version)
+    if parts is None:
+        parts = {'data': snapshot_json(dashboard_snapshot(db))}
+        get_response_cache().set(key, version, parts)
+    part = parts.get((kind, name))
+    if part is None:
+        # The forecast is simulated separately, so the other sections never wait for it
+        data = {'forecast': savings_forecast(db, version)} if name == 'forecast' else parts['data']
+        if kind == 'html':
+            body = render_template(f'dashboard_{name}.html', **data).encode()
+        else:
+            body = json.dumps(fragment_json(data, name)).encode()
+        part = parts[kind, name] = (body, content_etag(f"{current_tenant()}.{name}-{kind}", body))
+    return part
 
-        # Calculate savings
-        savings = total_income - expenses
+def serve_dashboard_part(kind: str, name: str, mimetype: str):
+    if name not in FRAGMENTS:
+        return jsonify({"error": f"Unknown fragment; use one of {', '.join(FRAGMENTS)}"}), 404
+    db = get_db()
+    version, _ = data_version(db)
+    body, etag = dashboard_part(db, version, kind, name)
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-        # Get recent transactions with error handling
-        try:
-            recent_expenses = db.execute('''
-                SELECT amount, category, description, date 
-                FROM expenses 
-                ORDER BY date DESC LIMIT 5
-            ''').fetchall()
-        except Exception as e:
-            logger.error(f"Error fetching recent expenses: {str(e)}")
-            recent_expenses = []
+def savings_forecast(db, version: int, goal_id: int = None):
+    """forecast_json() of a savings goal (the latest by default), simulated at most once per goal, data version and day.
 
-        try:
-            recent_investments = db.execute('''
-                SELECT amount, type, date 
-                FROM investments 
-                ORDER BY date DESC LIMIT 5
-            ''').fetchall()
-        except Exception as e:
-            logger.error(f"Error fetching recent investments: {str(e)}")
-            recent_investments = []
+    None when there is no goal or income yet, or numpy is not installed.
+    """
+    if not forecast_available():
+        return None
+    key = (current_tenant(), 'forecast', goal_id, datetime.utcnow().date())
+    cached = get_response_cache().get(key, version)
+    if cached is None:
+        result = forecast_goal(db, goal_id)
+        # Cached as a 1-tuple so "no forecast" is cached too
+        cached = (forecast_json(result) if result else None,)
+        get_response_cache().set(key, version, cached)
+    return cached[0]
+
+@bp.route('/dashboard/fragments/<name>')
+@handle_database_error
+def dashboard_fragment(name):
+    """One dashboard section (totals, forecast, recent or budgets) as an HTML fragment."""
+    return serve_dashboard_part('html', name, 'text/html')
+
+@bp.route('/api/dashboard')
+@handle_database_error
+@cached_response
+def dashboard_data():
+    """Dashboard figures as JSON."""
+    return jsonify(snapshot_json(dashboard_snapshot(get_db())))
 
-        # Get budget overview with error handling
+@bp.route('/api/events')
+@handle_database_error
+def live_events():
+    """Server-sent events: budget threshold crossings, new transactions and totals as they are committed.
+
+    Each client holds a request thread here; serve many clients through asgi.py.
+    """
+    path = ledger_path(current_tenant(), current_app.config['DATABASE'], current_app.config['LEDGER_DIR'])
+    broker = get_broker()
+    subscription = broker.subscribe(get_db(), path, request.headers.get('Last-Event-ID'))
+
+    def generate():
         try:
-            budgets = db.execute('''
-                SELECT category, amount 
-                FROM budget 
-                ORDER BY category
-            ''').fetchall()
-            
-            budget_data = []
-            for budget in budgets:
-                try:
-                    spent = db.execute('''
-                        SELECT COALESCE(SUM(amount), 0) 
-                        FROM expenses 
-                        WHERE category = ?
-                    ''', (budget['category'],)).fetchone()[0]
-                    
-                    budget_data.append({
-                        'category': budget['category'],
-                        'total': budget['amount'],
-                        'spent': spent,
-                        'remaining': budget['amount'] - spent,
-                        'percentage': (spent / budget['amount'] * 100) if budget['amount'] > 0 else 0
-                    })
-                except Exception as e:
-                    logger.error(f"Error processing budget {budget['category']}: {str(e)}")
-                    continue
-        except Exception as e:
-            logger.error(f"Error fetching budgets: {str(e)}")
-            budget_data = []
-
-        return render_template('index.html',
-                             total_income=format_currency(total_income),
-                             total_expenses=format_currency(expenses),
-                             total_investments=format_currency(investments),
-                             savings=format_currency(savings),
-                             savings_target=format_currency(savings_target),
-                             recent_expenses=[(e, format_currency(e['amount'])) for e in recent_expenses],
-                             recent_investments=[(i, format_currency(i['amount'])) for i in recent_investments],
-                             budget_data=budget_data,
-                             has_income=income is not None)
-    except Exception as e:
-        logger.error(f"Error in dashboard route: {str(e)}")
-        flash("An error occurred while loading the dashboard.", "error")
-        return render_template('error.html', error="Failed to load dashboard"), 500
-    finally:
-        if db:
-            db.close()
+            while True:
+                message = subscription.get()
+                if message is None:
+                    break
+                yield message
+        finally:
+            broker.unsubscribe(subscription)
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/dashboard/<name>')
+@handle_database_error
+def dashboard_fragment_data(name):
+    """The figures of one dashboard section as JSON."""
+    return serve_dashboard_part('json', name, 'application/json')
+
+@bp.route('/api/forecast')
+@handle_database_error
+@cached_response(daily=True)
+def savings_forecast_data():
+    """Monte Carlo forecast of reaching a savings goal (?goal=<id>, default the latest)."""
+    check_forecast()
+    goal = request.args.get('goal')
+    if goal is not None and not goal.isdigit():
+        raise ValidationError("Goal must be a savings goal id")
+    db = get_db()
+    version, _ = data_version(db)
+    forecast = savings_forecast(db, version, int(goal) if goal is not None else None)
+    if forecast is None:
+        return jsonify({"error": "No such savings goal, or no income set yet"}), 404
+    return jsonify(forecast)
 
-@app.route('/set_income', methods=['GET', 'POST'])
+@bp.route('/set_income', methods=['GET', 'POST'])
 @handle_database_error
 def set_income():
     if request.method == 'POST':
-        amount = validate_amount(float(request.form['amount']))
-        
-        # Check if new income would be less than current allocations
-        current_allocations = get_total_allocations()
-        
-        if amount < current_allocations:
-            raise InsufficientFundsError("New income cannot be less than current allocations")
+        amount = validate_amount(request.form['amount'])
         
-        db = get_db()
-        try:
-            db.execute('INSERT INTO income (amount, date) VALUES (?, ?)',
-                      (amount, datetime.utcnow()))
-            db.commit()
-            flash("Income set successfully", "success")
-            return redirect(url_for('dashboard'))
-        finally:
-            db.close()
+        storage = get_storage()
+        with storage.transaction():
+            # Check if new income would be less than current allocations
+            current_allocations = get_total_allocations()
+            
+            if amount < current_allocations:
+                raise InsufficientFundsError("New income cannot be less than current allocations")
+            
+            storage.set_income(amount)
+        flash("Income set successfully", "success")
+        return redirect(url_for('finance.dashboard'))
     
     return render_template('set_income.html')
 
-@app.route('/set_budget', methods=['GET', 'POST'])
+@bp.route('/set_budget', methods=['GET', 'POST'])
 @handle_database_error
 def set_budget():
     if request.method == 'POST':
-        amount = validate_amount(float(request.form['amount']))
+        amount = validate_amount(request.form['amount'])
         category = request.form['category'].strip()
         
         if not category:
             raise ValidationError("Category cannot be empty")
         
-        # Check if budget exceeds available funds
-        income = check_income_set()
-        current_allocations = get_total_allocations()
-        
-        if current_allocations + amount > income:
-            raise InsufficientFundsError("Total allocations cannot exceed your income")
-        
-        # Check if category already has a budget
-        db = get_db()
-        try:
-            existing = db.execute('SELECT 1 FROM budget WHERE category = ?', (category,)).fetchone()
-            if existing:
+        storage = get_storage()
+        with storage.transaction():
+            # Check if budget exceeds available funds
+            income = check_income_set()
+            current_allocations = get_total_allocations()
+            
+            if current_allocations + amount > income:
+                raise InsufficientFundsError("Total allocations cannot exceed your income")
+            
+            # Check if category already has a budget
+            if storage.budget(category) is not None:
                 raise ValidationError(f"Budget already exists for category: {category}")
             
-            db.execute('INSERT INTO budget (amount, category, date) VALUES (?, ?, ?)',
-                      (amount, category, datetime.utcnow()))
-            db.commit()
-            flash("Budget set successfully", "success")
-            return redirect(url_for('dashboard'))
-        finally:
-            db.close()
+            storage.set_budget(category, amount)
+        flash("Budget set successfully", "success")
+        return redirect(url_for('finance.dashboard'))
     
     # Check if income is set
     db = get_db()
-    try:
-        if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
-            flash("Please set your income first", "error")
-            return redirect(url_for('set_income'))
-    finally:
-        db.close()
+    if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
+        flash("Please set your income first", "error")
+        return redirect(url_for('finance.set_income'))
     
     return render_template('set_budget.html')
 
-@app.route('/set_savings_goal', methods=['GET', 'POST'])
+@bp.route('/set_savings_goal', methods=['GET', 'POST'])
 @handle_database_error
 def set_savings_goal():
     if request.method == 'POST':
-        amount = validate_amount(float(request.form['amount']))
+        amount = validate_amount(request.form['amount'])
         target_date = validate_date(request.form['target_date'])
         
-        # Check if savings goal exceeds available funds
-        income = check_income_set()
-        current_allocations = get_total_allocations()
-        
-        if current_allocations + amount > income:
-            raise InsufficientFundsError("Total allocations cannot exceed your income")
-        
         # Check if target date is too far in the future
         if target_date > datetime.now() + timedelta(days=5*365):
             raise DateValidationError("Target date cannot be more than 5 years in the future")
         
-        db = get_db()
-        try:
-            db.execute('INSERT INTO savings_goals (amount, target_date, date) VALUES (?, ?, ?)',
-                      (amount, target_date, datetime.utcnow()))
-            db.commit()
-            flash("Savings goal set successfully", "success")
-            return redirect(url_for('dashboard'))
-        finally:
-            db.close()
+        storage = get_storage()
+        with storage.transaction():
+            # Check if savings goal exceeds available funds
+            income = check_income_set()
+            current_allocations = get_total_allocations()
+            
+            if current_allocations + amount > income:
+                raise InsufficientFundsError("Total allocations cannot exceed your income")
+            
+            storage.set_savings_goal(amount, target_date)
+        flash("Savings goal set successfully", "success")
+        return redirect(url_for('finance.dashboard'))
     
     # Check if income is set
     db = get_db()
-    try:
-        if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
-            flash("Please set your income first", "error")
-            return redirect(url_for('set_income'))
-    finally:
-        db.close()
+    if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
+        flash("Please set your income first", "error")
+        return redirect(url_for('finance.set_income'))
     
     return render_template('set_savings_goal.html')
 
-@app.route('/add_expense', methods=['GET', 'POST'])
+@bp.route('/add_expense', methods=['GET', 'POST'])
 @handle_database_error
 def add_expense():
     if request.method == 'POST':
-        amount = validate_amount(float(request.form['amount']))
+        amount = validate_amount(request.form['amount'])
         category = request.form['category'].strip()
         description = request.form['description'].strip()
         
         if not category:
             raise ValidationError("Category cannot be empty")
         
-        # Check if expense exceeds available funds
-        income = check_income_set()
-        current_allocations = get_total_allocations()
-        
-        if current_allocations + amount > income:
-            raise InsufficientFundsError("Total allocations cannot exceed your income")
-        
-        db = get_db()
-        try:
+        storage = get_storage()
+        with storage.transaction():
+            # Check if expense exceeds available funds
+            income = check_income_set()
+            current_allocations = get_total_allocations()
+            
+            if current_allocations + amount > income:
+                raise InsufficientFundsError("Total allocations cannot exceed your income")
+            
             # Check if expense exceeds budget for category
-            budget = db.execute('SELECT amount FROM budget WHERE category = ?', (category,)).fetchone()
-            if budget:
-                category_expenses = db.execute('''
-                    SELECT COALESCE(SUM(amount), 0) 
-                    FROM expenses 
-                    WHERE category = ?
-                ''', (category,)).fetchone()[0]
-                if category_expenses + amount > budget[0]:
+            budget = storage.budget(category)
+            if budget is not None:
+                category_expenses = storage.category_total('expenses', category)
+                if category_expenses + amount > budget:
                     raise InsufficientFundsError(f"Expense exceeds budget for category: {category}")
             
-            db.execute('''
-                INSERT INTO expenses (amount, category, description, date) 
-                VALUES (?, ?, ?, ?)
-            ''', (amount, category, description, datetime.utcnow()))
-            db.commit()
-            flash("Expense added successfully", "success")
-            return redirect(url_for('dashboard'))
-        finally:
-            db.close()
+            storage.add_expense(amount, category, description)
+        flash("Expense added successfully", "success")
+        return redirect(url_for('finance.dashboard'))
     
     # Check if income is set
     db = get_db()
-    try:
-        if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
-            flash("Please set your income first", "error")
-            return redirect(url_for('set_income'))
-    finally:
-        db.close()
+    if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
+        flash("Please set your income first", "error")
+        return redirect(url_for('finance.set_income'))
     
     return render_template('add_expense.html')
 
-@app.route('/add_investment', methods=['GET', 'POST'])
+@bp.route('/add_investment', methods=['GET', 'POST'])
 @handle_database_error
 def add_investment():
     if request.method == 'POST':
-        amount = validate_amount(float(request.form['amount']))
+        amount = validate_amount(request.form['amount'])
         type = request.form['type'].strip()
         
         if not type:
             raise ValidationError("Investment type cannot be empty")
         
-        # Check if investment exceeds available funds
-        income = check_income_set()
-        current_allocations = get_total_allocations()
-        
-        if current_allocations + amount > income:
-            raise InsufficientFundsError("Total allocations cannot exceed your income")
-        
         # Check if investment type is valid
-        valid_types = ["Stocks", "Bonds", "Mutual Funds", "Real Estate", "Other"]
-        if type not in valid_types:
-            raise ValidationError(f"Invalid investment type. Must be one of: {', '.join(valid_types)}")
+        if type not in INVESTMENT_TYPES:
+            raise ValidationError(f"Invalid investment type. Must be one of: {', '.join(INVESTMENT_TYPES)}")
         
-        db = get_db()
-        try:
-            db.execute('INSERT INTO investments (amount, type, date) VALUES (?, ?, ?)',
-                      (amount, type, datetime.utcnow()))
-            db.commit()
-            flash("Investment added successfully", "success")
-            return redirect(url_for('dashboard'))
-        finally:
-            db.close()
+        storage = get_storage()
+        with storage.transaction():
+            # Check if investment exceeds available funds
+            income = check_income_set()
+            current_allocations = get_total_allocations()
+            
+            if current_allocations + amount > income:
+                raise InsufficientFundsError("Total allocations cannot exceed your income")
+            
+            storage.add_investment(amount, type)
+        flash("Investment added successfully", "success")
+        return redirect(url_for('finance.dashboard'))
     
     # Check if income is set
     db = get_db()
-    try:
-        if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
-            flash("Please set your income first", "error")
-            return redirect(url_for('set_income'))
-    finally:
-        db.close()
+    if not db.execute('SELECT 1 FROM income LIMIT 1').fetchone():
+        flash("Please set your income first", "error")
+        return redirect(url_for('finance.set_income'))
     
     return render_template('add_investment.html')
 
-@app.route('/api/expenses')
+def list_rows(table: str, filter_arg: str, serialize):
+    """Serve one page of a listing, or every row as NDJSON when ?format=ndjson."""
+    filters = {
+        'category': request.args.get(filter_arg, '').strip() or None,
+        'start': request.args.get('start'),
+        'end': request.args.get('end'),
+        'cursor': request.args.get('cursor'),
+    }
+    try:
+        # Validate the filters up front so streaming never fails mid-response
+        build_query(table, **filters)
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        raise ValidationError(str(e))
+
+    db = get_db()
+    if request.args.get('format') == 'ndjson':
+        def generate():
+            for row in iter_rows(db, table, **filters):
+                yield json.dumps(serialize(row), ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    rows, next_cursor = fetch_page(db, table, limit, **filters)
+    return jsonify({
+        "items": [serialize(row) for row in rows],
+        "next_cursor": next_cursor
+    })
+
+@bp.route('/api/expenses')
 @handle_database_error
+@cached_response
 def get_expenses():
-    db = get_db()
+    return list_rows('expenses', 'category', serialize_expense)
+
+@bp.route('/api/expenses/search')
+@handle_database_error
+@cached_response
+def search_expenses_api():
+    """Expenses whose description or category matches ?q=, by relevance or newest first, one page at a time."""
     try:
-        expenses = db.execute('''
-            SELECT amount, category, description, date 
-            FROM expenses 
-            ORDER BY date DESC
-        ''').fetchall()
-        return jsonify([{
-            "amount": format_currency(expense['amount']),
-            "category": expense['category'],
-            "description": expense['description'],
-            "date": expense['date']
-        } for expense in expenses])
-    finally:
-        db.close()
-
-@app.route('/api/investments')
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        raise ValidationError(str(e))
+    rows, next_cursor = search_expenses(
+        get_db(), request.args.get('q', ''), limit,
+        order=request.args.get('order', 'rank'),
+        category=request.args.get('category', '').strip() or None,
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        cursor=request.args.get('cursor'))
+    return jsonify({
+        "items": [serialize_expense(row) for row in rows],
+        "next_cursor": next_cursor
+    })
+
+@bp.route('/api/investments')
 @handle_database_error
+@cached_response
 def get_investments():
-    db = get_db()
+    return list_rows('investments', 'type', serialize_investment)
+
+@bp.route('/api/recurring')
+@handle_database_error
+@cached_response
+def get_recurring_rules():
+    """Every recurring rule with its progress."""
+    return jsonify({"rules": [serialize_rule(rule) for rule in list_rules(get_db())]})
+
+@bp.route('/api/recurring', methods=['POST'])
+@handle_database_error
+def create_recurring_rule():
+    """Add a recurring expense, investment or income (JSON or form fields) and insert what is already due."""
+    data = request.get_json(silent=True) or request.form
+    kind = str(data.get('kind', '')).strip()
+    category = str(data.get('category') or data.get('type') or '').strip()
+    if kind == 'investment' and category not in INVESTMENT_TYPES:
+        raise ValidationError(f"Invalid investment type. Must be one of: {', '.join(INVESTMENT_TYPES)}")
     try:
-        investments = db.execute('''
-            SELECT amount, type, date 
-            FROM investments 
-            ORDER BY date DESC
-        ''').fetchall()
-        return jsonify([{
-            "amount": format_currency(investment['amount']),
-            "type": investment['type'],
-            "date": investment['date']
-        } for investment in investments])
-    finally:
-        db.close()
-
-@app.route('/clear_all', methods=['POST'])
+        every = int(data.get('every', 1))
+    except (TypeError, ValueError):
+        raise ValidationError("every must be a whole number")
+    start = data.get('start_date')
+    end = data.get('end_date')
+
+    db = get_db()
+    rule_id = add_rule(db, kind, validate_amount(data.get('amount')), str(data.get('frequency', '')).strip(),
+                       validate_date(start).date() if start else datetime.utcnow().date(),
+                       category=category, description=str(data.get('description') or '').strip(),
+                       every=every, end=validate_date(end).date() if end else None)
+    report = materialize_due(db)
+    rule = next(rule for rule in list_rules(db) if rule['id'] == rule_id)
+    return jsonify({"rule": serialize_rule(rule), "materialized": report['materialized']}), 201
+
+@bp.route('/api/recurring/<int:rule_id>', methods=['DELETE'])
+@handle_database_error
+def delete_recurring_rule(rule_id):
+    """Stop a rule; the transactions it already inserted stay."""
+    if not delete_rule(get_db(), rule_id):
+        return jsonify({"error": "No such recurring rule"}), 404
+    return '', 204
+
+@bp.route('/api/recurring/<int:rule_id>/resume', methods=['POST'])
+@handle_database_error
+def resume_recurring_rule(rule_id):
+    """Reactivate a rule paused by a failed check and retry its pending occurrences."""
+    db = get_db()
+    if not resume_rule(db, rule_id):
+        return jsonify({"error": "No such recurring rule"}), 404
+    report = materialize_due(db)
+    return jsonify({"materialized": report['materialized'], "paused": report['paused']})
+
+@bp.route('/api/investments/performance')
+@handle_database_error
+def investment_performance():
+    """Cost, market value and time-weighted return of the investments between start and end."""
+    check_valuation()
+    start = request.args.get('start')
+    end = request.args.get('end')
+    start = validate_date(start).date() if start else None
+    end = validate_date(end).date() if end else None
+    if start and end and start > end:
+        raise ValidationError("Start date must not be after end date")
+
+    db = get_db()
+    store = current_app.extensions['price_store']
+    version, _ = data_version(db)
+    types = [row[0] for row in db.execute("SELECT category FROM totals WHERE source = 'investments' AND category != ''")]
+    # Prices change without a data version bump, so their file times are part of the key
+    key = (current_tenant(), 'performance', start, end, store.stamp(types))
+    cached = get_response_cache().get(key, version)
+    if cached is None:
+        body = json.dumps(performance_json(performance(db, store, start, end))).encode()
+        cached = (body, content_etag(f"{current_tenant()}.performance", body))
+        get_response_cache().set(key, version, cached)
+    body, etag = cached
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def serialize_figures(figures: dict, breakdown_key: str) -> dict:
+    """JSON form of one source's totals within a report period."""
+    return {
+        "total": format_currency(figures['total']),
+        "total_paise": figures['total'],
+        "entries": figures['entries'],
+        breakdown_key: figures['breakdown']
+    }
+
+@bp.route('/api/reports/summary')
+@handle_database_error
+@cached_response(daily=True)
+def report_summary():
+    """Spending and investment rollups per day, week or month over a date range."""
+    period = request.args.get('period', 'month')
+    if period not in GRAINS:
+        raise ValidationError(f"Invalid period. Must be one of: {', '.join(GRAINS)}")
+    start = request.args.get('start')
+    end = request.args.get('end')
+    start = validate_date(start).date() if start else None
+    end = validate_date(end).date() if end else None
+    if start and end and start > end:
+        raise ValidationError("Start date must not be after end date")
+
+    periods = summary(get_db(), period, start, end)
+    return jsonify({
+        "period": period,
+        "periods": [{
+            "start": p['period'],
+            "expenses": serialize_figures(p['expenses'], 'by_category'),
+            "investments": serialize_figures(p['investments'], 'by_type')
+        } for p in periods]
+    })
+
+@bp.route('/api/expenses/import', methods=['POST'])
+@handle_database_error
+def import_expenses_api():
+    """Bulk-load expenses from a CSV or NDJSON body (or a 'file' upload)."""
+    upload = request.files.get('file')
+    fmt = detect_format(request.args.get('format'),
+                        request.mimetype,
+                        upload.filename if upload else None)
+    lines = decode_lines(upload.stream if upload else io.BufferedReader(request.stream))
+    report = import_expenses(get_db(), read_rows(lines, fmt),
+                             dry_run=request.args.get('dry_run') in ('1', 'true'))
+    return jsonify(report)
+
+@bp.route('/api/export/<table>')
+@handle_database_error
+def export_api(table):
+    """Stream a whole table as CSV, NDJSON or Parquet, optionally date-filtered and gzipped."""
+    fmt = request.args.get('format', 'csv')
+    start, end = request.args.get('start'), request.args.get('end')
+    compress = request.args.get('gzip') in ('1', 'true')
+    check_export(table, fmt, compress, start, end)
+    chunks = export_table(get_db(), table, fmt, start, end, compress)
+    response = Response(stream_with_context(chunks),
+                        mimetype='application/gzip' if compress else EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(table, fmt, compress)}"'
+    return response
+
+@bp.route('/clear_all', methods=['POST'])
 @handle_database_error
 def clear_all():
     """Clear all financial data from the database."""
-    db = get_db()
     try:
-        db.execute('DELETE FROM income')
-        db.execute('DELETE FROM expenses')
-        db.execute('DELETE FROM investments')
-        db.execute('DELETE FROM budget')
-        db.execute('DELETE FROM savings_goals')
-        db.commit()
+        # Deleted in small batches so other writers to this ledger never wait long
+        clear_ledger(get_db())
         flash("All data has been cleared successfully", "success")
     except Exception as e:
-        db.rollback()
         logger.error(f"Error clearing data: {str(e)}")
         flash("Failed to clear data", "error")
-    finally:
-        db.close()
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('finance.dashboard'))
+
+@bp.route('/metrics')
+def metrics():
+    """Request, query and slow-query metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/metrics/slow-queries')
+def slow_queries():
+    """The most recent slow statements with their query plans, newest first."""
+    return jsonify({"slow_queries": REGISTRY.slow_log()})
+
+# Maintenance commands
+def tenant_option(f):
+    """Add a --tenant option selecting the ledger a command operates on."""
+    @click.option('--tenant', default=DEFAULT_TENANT, show_default=True, help='Ledger to operate on.')
+    @wraps(f)
+    def decorated_function(*args, tenant, **kwargs):
+        try:
+            g.tenant = normalize_tenant(tenant)
+        except ValidationError as e:
+            raise click.BadParameter(str(e), param_hint='--tenant')
+        return f(*args, **kwargs)
+    return decorated_function
+
+@bp.cli.command('compile-templates')
+def compile_templates_command():
+    """Compile the templates to Python modules so workers skip compiling them on first render."""
+    target = current_app.config['COMPILED_TEMPLATES']
+    names = compile_templates(current_app.jinja_env, current_app.root_path, target)
+    click.echo(f"Compiled {len(names)} templates into {target}")
+
+@bp.cli.command('init-db')
+@tenant_option
+def init_db_command():
+    """Create the database or migrate it to the current schema."""
+    init_db()
+    click.echo(f"Database is at schema version {schema_version(get_db())}")
+
+@bp.cli.command('rebuild-totals')
+@tenant_option
+def rebuild_totals_command():
+    """Recompute the running totals table from the raw rows."""
+    db = get_db()
+    with current_app.open_resource(TOTALS_SCHEMA, mode='r') as f:
+        db.cursor().executescript(f.read())
+    rows = rebuild_totals(db)
+    click.echo(f"Rebuilt {rows} totals rows")
+
+@bp.cli.command('rebuild-search-index')
+@tenant_option
+def rebuild_search_index_command():
+    """Rebuild the full-text search index over expenses from the raw rows."""
+    db = get_db()
+    with current_app.open_resource(SEARCH_SCHEMA, mode='r') as f:
+        db.cursor().executescript(f.read())
+    rows = rebuild_index(db)
+    click.echo(f"Indexed {rows} expenses for search")
+
+@bp.cli.command('materialize-recurring')
+@click.option('--today', help='Treat this YYYY-MM-DD as today (default: the current UTC date).')
+@tenant_option
+def materialize_recurring_command(today):
+    """Insert the recurring transactions that have come due."""
+    report = materialize_due(get_db(), validate_date(today).date() if today else None)
+    click.echo(f"Inserted {report['materialized']} transactions in {report['batches']} batches")
+    for rule_id in report['paused']:
+        click.echo(f"Paused rule {rule_id}; see /api/recurring for the reason", err=True)
+
+@bp.cli.command('import-expenses')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format; guessed from the file extension by default.')
+@click.option('--dry-run', is_flag=True, help='Validate and check limits without writing.')
+@tenant_option
+def import_expenses_command(path, fmt, dry_run):
+    """Bulk-load expenses from a CSV or NDJSON bank statement."""
+    try:
+        fmt = detect_format(fmt, filename=path)
+        with open(path, 'rb') as f:
+            report = import_expenses(get_db(), read_rows(decode_lines(f), fmt), dry_run=dry_run)
+    except ValidationError as e:
+        raise click.ClickException(str(e))
+    for error in report['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {report['imported']} expenses, rejected {report['rejected']}"
+               f"{' (dry run)' if dry_run else ''}")
+
+@bp.cli.command('export')
+@click.argument('tables', nargs=-1, type=click.Choice(list(EXPORT_TABLES)))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--start', help='First date to include (YYYY-MM-DD).')
+@click.option('--end', help='Last date to include (YYYY-MM-DD).')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the CSV or NDJSON output.')
+@click.option('--output-dir', default='.', show_default=True, type=click.Path(file_okay=False),
+              help='Directory to write one file per table into.')
+@tenant_option
+def export_command(tables, fmt, start, end, compress, output_dir):
+    """Export tables (default: all) to files, streaming them in chunks."""
+    try:
+        for table in tables or EXPORT_TABLES:
+            check_export(table, fmt, compress, start, end)
+    except ValidationError as e:
+        raise click.ClickException(str(e))
+    os.makedirs(output_dir, exist_ok=True)
+    for table in tables or EXPORT_TABLES:
+        path = os.path.join(output_dir, export_filename(table, fmt, compress))
+        with open(path, 'wb') as f:
+            for chunk in export_table(get_db(), table, fmt, start, end, compress):
+                f.write(chunk)
+        click.echo(f"Wrote {path} ({os.path.getsize(path)} bytes)")
+
+@bp.cli.command('refresh-rollups')
+@tenant_option
+def refresh_rollups_command():
+    """Materialize report rollups for every closed period."""
+    db = get_db()
+    for grain in GRAINS:
+        for source in ROLLUP_SOURCES:
+            refresh_rollups(db, grain, source)
+    click.echo("Rollups are up to date")
+
+@bp.cli.command('archive')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Archive rows dated before this day (rounded down to a month start).')
+@click.option('--keep-months', type=click.IntRange(min=1), default=24, show_default=True,
+              help='Months of history to keep live when --before is not given.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=None,
+              help='Rows moved per transaction.')
+@tenant_option
+def archive_command(before, keep_months, batch_size):
+    """Move old expenses and investments into compressed archive chunks."""
+    today = datetime.utcnow().date()
+    cutoff = before.date() if before else shift_period(bucket_start(today, 'month'), 'month', -keep_months)
+    kwargs = {'batch_size': batch_size} if batch_size else {}
+    report = archive_before(get_db(), cutoff, **kwargs)
+    for source, rows in report['archived'].items():
+        click.echo(f"{source}: archived {rows} rows dated before {report['cutoff']}")
+    click.echo(f"Freed {report['freed_pages']} pages")
+
+@bp.cli.command('vacuum')
+@click.option('--full', is_flag=True,
+              help='Rewrite the file once to enable incremental vacuum on an older database.')
+@tenant_option
+def vacuum_command(full):
+    """Return free pages to the filesystem."""
+    db = get_db()
+    if full:
+        enable_incremental_vacuum(db)
+        click.echo("Database rewritten with incremental vacuum enabled")
+    else:
+        click.echo(f"Freed {incremental_vacuum(db)} pages")
+
+@bp.cli.command('verify-totals')
+@tenant_option
+def verify_totals_command():
+    """Check the running totals and report rollups against the raw and archived rows."""
+    db = get_db()
+    mismatches = verify_totals(db)
+    for source, category, stored, actual in mismatches:
+        click.echo(f"{source}/{category or '*'}: stored {stored}, actual {actual}")
+    rollup_mismatches = verify_rollups(db)
+    for grain, source, bucket, category, stored, actual in rollup_mismatches:
+        click.echo(f"{grain} {bucket} {source}/{category}: stored {stored}, actual {actual}")
+    if mismatches or rollup_mismatches:
+        raise SystemExit(1)
+    click.echo("Totals and rollups are consistent")
+
+@bp.cli.command('create-ledger')
+@click.argument('name')
+def create_ledger_command(name):
+    """Create a household's ledger and print the key that unlocks it in a browser."""
+    try:
+        g.tenant = normalize_tenant(name)
+    except ValidationError as e:
+        raise click.BadParameter(str(e), param_hint='NAME')
+    init_db()
+    if not os.environ.get('FINANCE_SECRET_KEY'):
+        click.echo("FINANCE_SECRET_KEY is not set, so the key below changes with every restart", err=True)
+    click.echo(f"Ledger '{g.tenant}' is ready; key: {ledger_key(current_app.secret_key, g.tenant)}")
+
+@bp.cli.command('migrate-ledgers')
+def migrate_ledgers_command():
+    """Bring every per-household ledger file up to the current schema."""
+    count = 0
+    for tenant, path in iter_ledgers(current_app.config['LEDGER_DIR']):
+        db = pooled_connection(path)
+        try:
+            version = migrate(db)
+        finally:
+            release_connection(db)
+        click.echo(f"{tenant}: schema version {version}")
+        count += 1
+    click.echo(f"Migrated {count} ledgers")
 
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('error.html', error="Page not found"), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     return render_template('error.html', error="Internal server error"), 500
 
-@app.errorhandler(ValidationError)
+@bp.app_errorhandler(NotFoundError)
+def ledger_not_found_error(error):
+    return render_template('error.html', error=str(error)), 404
+
+@bp.app_errorhandler(ValidationError)
 def validation_error(error):
     flash(str(error), "error")
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('finance.dashboard'))
 
-@app.errorhandler(InsufficientFundsError)
+@bp.app_errorhandler(InsufficientFundsError)
 def insufficient_funds_error(error):
     flash(str(error), "error")
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('finance.dashboard'))
 
-@app.errorhandler(DateValidationError)
+@bp.app_errorhandler(DateValidationError)
 def date_validation_error(error):
     flash(str(error), "error")
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('finance.dashboard'))
 
-if __name__ == '__main__':
-    # Initialize database if it doesn't exist
-    if not os.path.exists(DATABASE):
-        try:
-            init_db()
-            logger.info("Database initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize database: {str(e)}")
-            raise
+def __getattr__(name):
+    # 'app:app' (gunicorn, flask run) and 'from app import app' get a default app, built on first use
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    # Try ports in sequence until one works
-    ports = [3000, 3001, 3002, 3003, 3004, 3005]
-    
-    for port in ports:
-        try:
-            app.run(debug=True, port=port)
-            break
-        except OSError as e:
-            if port == ports[-1]:
-                print(f"Could not find an available port in range {ports[0]}-{ports[-1]}")
-                raise e
-            print(f"Port {port} is in use, trying next port...")
-            continue
+if __name__ == '__main__':
+    # Ledgers are created or migrated on first use, so there is nothing to prepare here
+    create_app().run(debug=os.environ.get('FLASK_DEBUG', '1') == '1',
+                     port=int(os.environ.get('PORT', 3000)))
@@ -0,0 +1,166 @@
+import json
+import sqlite3
+import logging
+import zlib
+from datetime import date, datetime
+
+from cache import bump_version
+from db import write_transaction
+from listing import LISTINGS
+from reports import GRAINS, SOURCES, bucket_start, shift
+from totals import write_totals
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = 'archive.sql'
+
+# Rows moved or deleted per write transaction, so no writer waits on the lock for long
+BATCH_SIZE = 5000
+
+# Free pages handed back to the filesystem per incremental_vacuum step
+VACUUM_STEP_PAGES = 1024
+
+# Tables emptied by clear_ledger(), in order; everything derived from them is reset afterwards
+CLEAR_TABLES = ('expenses', 'investments', 'budget', 'income', 'savings_goals', 'recurring_rules', 'budget_alerts',
+                'archive_chunks')
+
+def archive_cutoff(before: date, today: date = None) -> date:
+    """Align a cutoff down to a month start that is not inside the current week or month.
+
+    The open period of every grain is aggregated from live rows only, so
+    archiving must never reach into it.
+    """
+    today = today or datetime.utcnow().date()
+    cutoff = bucket_start(before, 'month')
+    open_start = min(bucket_start(today, 'week'), bucket_start(today, 'month'))
+    while cutoff > open_start:
+        cutoff = shift(cutoff, 'month', -1)
+    return cutoff
+
+def archive_before(db: sqlite3.Connection, before: date, batch_size: int = BATCH_SIZE,
+                   today: date = None) -> dict:
+    """Move expenses and investments dated before the aligned cutoff into archive_chunks.
+
+    Rows move oldest first, batch_size per transaction; reports and running
+    totals keep counting them through archived_rollups.
+    """
+    cutoff = archive_cutoff(before, today).isoformat()
+    archived = {}
+    for source in SOURCES:
+        archived[source] = 0
+        while True:
+            moved = _archive_chunk(db, source, cutoff, batch_size)
+            if not moved:
+                break
+            archived[source] += moved
+    freed = incremental_vacuum(db) if any(archived.values()) else 0
+    logger.info(f"Archived {archived} rows dated before {cutoff}, freed {freed} pages")
+    return {"cutoff": cutoff, "archived": archived, "freed_pages": freed}
+
+def _archive_chunk(db: sqlite3.Connection, source: str, cutoff: str, batch_size: int) -> int:
+    column, columns = SOURCES[source], LISTINGS[source][1]
+    with write_transaction(db):
+        rows = db.execute(f'''
+            SELECT {columns}
+            FROM {source}
+            WHERE date < ?
+            ORDER BY date, id
+            LIMIT ?
+        ''', (cutoff, batch_size)).fetchall()
+        if not rows:
+            return 0
+        # Everything up to and including the last row in (date, id) order
+        last = (rows[-1]['date'], rows[-1]['id'])
+        payload = ''.join(json.dumps(dict(row), ensure_ascii=False) + '\n' for row in rows)
+        db.execute('''
+            INSERT INTO archive_chunks (source, first_date, last_date, entries, payload)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (source, rows[0]['date'], last[0], len(rows), zlib.compress(payload.encode())))
+        for grain, bucket in GRAINS.items():
+            db.execute(f'''
+                INSERT INTO archived_rollups (grain, source, bucket, category, amount, entries)
+                SELECT ?, ?, {bucket} AS bucket, {column}, SUM(amount), COUNT(*)
+                FROM {source}
+                WHERE (date, id) <= (?, ?)
+                GROUP BY bucket, {column}
+                ON CONFLICT (grain, source, bucket, category) DO UPDATE
+                SET amount = amount + excluded.amount, entries = entries + excluded.entries
+            ''', (grain, source, *last))
+
+        # Archiving moves rows without changing any figure, so put back the running
+        # totals and rollup watermarks that the delete triggers are about to adjust
+        totals = db.execute('SELECT category, amount, entries FROM totals WHERE source = ?',
+                            (source,)).fetchall()
+        watermarks = db.execute('SELECT grain, closed_through FROM rollup_watermarks WHERE source = ?',
+                                (source,)).fetchall()
+        db.execute(f'DELETE FROM {source} WHERE (date, id) <= (?, ?)', last)
+        db.executemany('UPDATE totals SET amount = ?, entries = ? WHERE source = ? AND category = ?',
+                       [(row['amount'], row['entries'], source, row['category']) for row in totals])
+        db.executemany('UPDATE rollup_watermarks SET closed_through = ? WHERE grain = ? AND source = ?',
+                       [(row['closed_through'], row['grain'], source) for row in watermarks])
+        bump_version(db)
+    return len(rows)
+
+def read_archive(db: sqlite3.Connection, source: str, start: str = None, end: str = None):
+    """Yield archived rows of source as dicts, oldest first, optionally limited to chunks overlapping start..end."""
+    clauses, params = ['source = ?'], [source]
+    if start:
+        clauses.append('last_date >= ?')
+        params.append(start)
+    if end:
+        clauses.append('first_date < ?')
+        params.append(end)
+    for (payload,) in db.execute(f'''
+        SELECT payload FROM archive_chunks WHERE {' AND '.join(clauses)} ORDER BY first_date, id
+    ''', params):
+        for line in zlib.decompress(payload).decode().splitlines():
+            yield json.loads(line)
+
+def clear_ledger(db: sqlite3.Connection, batch_size: int = BATCH_SIZE) -> int:
+    """Delete every row of the ledger batch_size rows per transaction, then reclaim the space."""
+    deleted = 0
+    for table in CLEAR_TABLES:
+        while True:
+            with write_transaction(db):
+                count = db.execute(f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} LIMIT ?)',
+                                   (batch_size,)).rowcount
+                bump_version(db)
+            deleted += count
+            if count < batch_size:
+                break
+    with write_transaction(db):
+        for table in ('archived_rollups', 'rollups', 'rollup_watermarks'):
+            db.execute(f'DELETE FROM {table}')
+        write_totals(db)
+        bump_version(db)
+    freed = incremental_vacuum(db)
+    logger.info(f"Cleared {deleted} rows, freed {freed} pages")
+    return deleted
+
+def incremental_vacuum(db: sqlite3.Connection, step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """Return free pages to the filesystem step_pages at a time; returns pages freed.
+
+    A no-op unless the database uses auto_vacuum=INCREMENTAL, which new
+    databases do; enable_incremental_vacuum() converts an older one.
+    """
+    if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    if db.in_transaction:
+        db.commit()
+    freed = 0
+    while True:
+        free = db.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        step = min(free, step_pages)
+        # executescript() steps the pragma to completion; execute() would free a single page
+        db.executescript(f'PRAGMA incremental_vacuum({step})')
+        freed += step
+    return freed
+
+def enable_incremental_vacuum(db: sqlite3.Connection) -> None:
+    """Switch an existing database to auto_vacuum=INCREMENTAL; rewrites the whole file once."""
+    if db.in_transaction:
+        db.commit()
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute('VACUUM')
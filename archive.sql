@@ -0,0 +1,24 @@
+-- Rows moved out of the live expenses/investments tables by archive.py. Each chunk
+-- holds up to one batch of rows as zlib-compressed NDJSON, oldest first.
+CREATE TABLE IF NOT EXISTS archive_chunks (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_archive_chunks_source ON archive_chunks (source, first_date);
+
+-- Per-period sums of archived rows, shaped like rollups. Rollup refreshes add these
+-- back in, so reports and running totals still cover archived periods.
+CREATE TABLE IF NOT EXISTS archived_rollups (
+    grain TEXT NOT NULL,
+    source TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    PRIMARY KEY (grain, source, bucket, category)
+) WITHOUT ROWID;
@@ -0,0 +1,337 @@
+"""ASGI entry point serving the JSON read endpoints without blocking the event loop.
+
+/api/expenses, /api/investments and /api/dashboard are answered here; every
+SQLite call runs on a bounded thread pool, each thread using its own pooled
+connection to the ledger named by a trusted X-Tenant header (or unlocked in
+the browser's Flask session), so a slow query holds an executor slot rather than the loop and
+thousands of idle keep-alive connections cost nothing. The /api/events
+stream is held open here too, as a queue per client that broker.py fills.
+Any other path is handed to the Flask app through asgiref, which must be installed. Flask itself
+is only imported once the worker is up, off the event loop, so the API is
+answering before the rest of the app has loaded.
+
+    uvicorn asgi:application --workers 4
+"""
+import asyncio
+import contextvars
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import parse_qs
+
+from cache import ResponseCache, data_version
+from dashboard import dashboard_snapshot, snapshot_json
+from db import DATABASE, release_connection
+from errors import NotFoundError, ValidationError
+from metrics import REGISTRY, RequestStats
+from scheduler import start_scheduler
+from broker import get_broker
+from listing import STREAM_CHUNK_SIZE, build_query, fetch_page, parse_limit, serialize_expense, serialize_investment
+from tenants import DEFAULT_TENANT, LEDGER_DIR, TENANT_HEADER, TRUST_TENANT_HEADER, ledger_path, normalize_tenant, tenant_connection
+
+logger = logging.getLogger(__name__)
+
+# Threads running SQLite work; bounds concurrent queries (and open connections) per worker process
+DB_THREADS = int(os.environ.get('FINANCE_DB_THREADS', min(32, (os.cpu_count() or 1) * 4)))
+
+# Listable endpoints: table, the query parameter filtering its category column, row serializer
+LISTING_ROUTES = {
+    '/api/expenses': ('expenses', 'category', serialize_expense),
+    '/api/investments': ('investments', 'type', serialize_investment),
+}
+
+# Server-sent events; held open, so not timed like the other routes
+EVENTS_ROUTE = '/api/events'
+
+# Stats of the request the current task is serving, handed to the executor with each query
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class FinanceASGI:
+    """Async front for the read API, falling back to the WSGI app for everything else.
+
+    fallback is a callable returning the ASGI app for other paths (or None);
+    it is called once, on first need or in the background after startup.
+    requires names the modules it imports; startup fails when one is missing,
+    rather than the first page request.
+    """
+
+    def __init__(self, database: str, ledger_dir: str, fallback=None, threads: int = DB_THREADS,
+                 trust_tenant_header: bool = TRUST_TENANT_HEADER, requires: tuple = ()):
+        self.database = database
+        self.requires = requires
+        self.ledger_dir = ledger_dir
+        self.trust_tenant_header = trust_tenant_header
+        self.fallback_factory = fallback
+        self.fallback = None
+        self._fallback_lock = threading.Lock()
+        self._fallback_loaded = fallback is None
+        self.threads = threads
+        self.executor = None
+        self.response_cache = ResponseCache(maxsize=256, ttl=300)
+        # Recurring transactions; started with the lifespan, like the executor
+        self.scheduler = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        route = scope['path'].rstrip('/') or '/'
+        if route == EVENTS_ROUTE:
+            return await self.stream_events(scope, receive, send)
+        if route == '/api/dashboard' or route in LISTING_ROUTES:
+            return await self.serve(route, scope, send)
+        fallback = self.fallback if self._fallback_loaded else self.load_fallback()
+        if fallback is None:
+            return await self.send_json(send, 404, {"error": "Not found"})
+        await fallback(scope, receive, send)
+
+    async def serve(self, route: str, scope, send):
+        """Answer one API request, recording its latency and query count."""
+        stats = RequestStats(route)
+        _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+        async def send_tracked(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+        try:
+            if scope['method'] not in ('GET', 'HEAD'):
+                await self.send_json(send_tracked, 405, {"error": "Method not allowed"})
+            else:
+                await self.handle(route, scope, send_tracked)
+        except HTTPError as e:
+            await self.send_json(send_tracked, e.status, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"Unexpected error serving {route}: {str(e)}")
+            await self.send_json(send_tracked, 500, {"error": "Unexpected error occurred"})
+        finally:
+            REGISTRY.observe_request(route, scope['method'], status, time.perf_counter() - started, stats)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                missing = [name for name in self.requires if importlib.util.find_spec(name) is None]
+                if missing:
+                    await send({'type': 'lifespan.startup.failed',
+                                'message': f"{', '.join(missing)} not installed; run 'pip install {' '.join(missing)}'"
+                                           " to serve the Flask pages through asgi.py"})
+                    return
+                self.start()
+                self.scheduler = start_scheduler(self.database, self.ledger_dir)
+                await send({'type': 'lifespan.startup.complete'})
+                if not self._fallback_loaded:
+                    threading.Thread(target=self.load_fallback, name='finance-fallback', daemon=True).start()
+            elif message['type'] == 'lifespan.shutdown':
+                # Ends every event stream, so the server is not left waiting on them
+                get_broker().stop()
+                self.stop()
+                if self.scheduler is not None:
+                    self.scheduler.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def load_fallback(self):
+        with self._fallback_lock:
+            if not self._fallback_loaded:
+                try:
+                    self.fallback = self.fallback_factory()
+                finally:
+                    self._fallback_loaded = True
+        return self.fallback
+
+    def start(self) -> None:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='finance-db')
+
+    def stop(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run_db(self, tenant: str, fn, *args, **kwargs):
+        """Run fn(db, *args, **kwargs) on the executor with that thread's connection to tenant's ledger."""
+        self.start()
+        path = ledger_path(tenant, self.database, self.ledger_dir)
+        stats = _request_stats.get()
+        def call():
+            # Only the default ledger is created on demand; a missing named one is a 404
+            try:
+                db = tenant_connection(path, create=tenant == DEFAULT_TENANT)
+            except NotFoundError as e:
+                raise HTTPError(404, str(e))
+            db.stats = stats
+            try:
+                return fn(db, *args, **kwargs)
+            finally:
+                db.stats = None
+                release_connection(db)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def resolve_tenant(self, headers: dict) -> str:
+        """The request's ledger, as app.current_tenant picks it: a trusted X-Tenant, the browser's session, the default."""
+        name = headers.get(TENANT_HEADER.lower()) if self.trust_tenant_header else None
+        if not name and 'cookie' in headers:
+            name = await asyncio.get_running_loop().run_in_executor(
+                None, self.session_tenant, headers['cookie'])
+        try:
+            return normalize_tenant(name or DEFAULT_TENANT)
+        except ValidationError as e:
+            raise HTTPError(400, str(e))
+
+    def session_tenant(self, cookie_header: str):
+        # The session belongs to the Flask app; load it if a browser got here first
+        fallback = self.load_fallback()
+        app = getattr(fallback, 'wsgi_application', None)
+        if app is None:
+            return None
+        from app import session_tenant
+        return session_tenant(app, cookie_header)
+
+    async def handle(self, route: str, scope, send):
+        query = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        headers = {key.decode().lower(): value.decode() for key, value in scope['headers']}
+        tenant = await self.resolve_tenant(headers)
+        version, modified_at = await self.run_db(tenant, data_version)
+        etag = f'"{tenant}.v{version}"'
+        validators = [
+            (b'etag', etag.encode()),
+            (b'last-modified', format_datetime(datetime.fromtimestamp(modified_at, timezone.utc), usegmt=True).encode()),
+            (b'cache-control', b'no-cache'),
+        ]
+        if _etag_matches(headers.get('if-none-match'), etag):
+            return await self.send(send, 304, b'', validators)
+
+        if route in LISTING_ROUTES and query.get('format') == 'ndjson':
+            return await self.stream_rows(send, tenant, route, query)
+
+        key = (tenant, route, scope['query_string'])
+        body = self.response_cache.get(key, version)
+        if body is None:
+            if route == '/api/dashboard':
+                payload = snapshot_json(await self.run_db(tenant, dashboard_snapshot))
+            else:
+                payload = await self.list_page(tenant, route, query)
+            body = json.dumps(payload, ensure_ascii=False).encode()
+            self.response_cache.set(key, version, body)
+        await self.send(send, 200, b'' if scope['method'] == 'HEAD' else body,
+                        [(b'content-type', b'application/json')] + validators)
+
+    async def list_page(self, tenant: str, route: str, query: dict) -> dict:
+        table, filter_arg, serialize = LISTING_ROUTES[route]
+        filters, limit = _listing_args(table, filter_arg, query)
+        rows, next_cursor = await self.run_db(tenant, fetch_page, table, limit, **filters)
+        return {"items": [serialize(row) for row in rows], "next_cursor": next_cursor}
+
+    async def stream_rows(self, send, tenant: str, route: str, query: dict):
+        """Send every matching row as NDJSON, one keyset page per executor call.
+
+        Each chunk is a fresh fetch_page() resumed from the previous cursor, so
+        no SQLite cursor stays open across awaits and any thread can serve it.
+        """
+        table, filter_arg, serialize = LISTING_ROUTES[route]
+        filters, _ = _listing_args(table, filter_arg, query)
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/x-ndjson')]})
+        while True:
+            rows, filters['cursor'] = await self.run_db(tenant, fetch_page, table, STREAM_CHUNK_SIZE, **filters)
+            chunk = ''.join(json.dumps(serialize(row), ensure_ascii=False) + '\n' for row in rows)
+            more = filters['cursor'] is not None
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': more})
+            if not more:
+                break
+
+    async def stream_events(self, scope, receive, send):
+        """Hold a server-sent events stream open, sending what the broker queues for it.
+
+        A waiting client costs a queue and a suspended task, not a thread, so
+        one worker can hold thousands of them.
+        """
+        if scope['method'] != 'GET':
+            return await self.send_json(send, 405, {"error": "Method not allowed"})
+        headers = {key.decode().lower(): value.decode() for key, value in scope['headers']}
+        broker = get_broker()
+        try:
+            tenant = await self.resolve_tenant(headers)
+            path = ledger_path(tenant, self.database, self.ledger_dir)
+            subscription = await self.run_db(tenant, broker.subscribe, path, headers.get('last-event-id'),
+                                             asyncio.get_running_loop())
+        except HTTPError as e:
+            return await self.send_json(send, e.status, {"error": str(e)})
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            subscription.close()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            while True:
+                message = await subscription.next()
+                if message is None:
+                    break
+                await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            # The client went away mid-send
+            pass
+        finally:
+            watcher.cancel()
+            broker.unsubscribe(subscription)
+
+    async def send(self, send, status: int, body: bytes, headers: list):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers + [(b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_json(self, send, status: int, payload: dict):
+        await self.send(send, status, json.dumps(payload).encode(),
+                        [(b'content-type', b'application/json')])
+
+def _listing_args(table: str, filter_arg: str, query: dict) -> tuple:
+    """Validate listing query parameters up front; returns (filters, limit)."""
+    filters = {
+        'category': query.get(filter_arg, '').strip() or None,
+        'start': query.get('start'),
+        'end': query.get('end'),
+        'cursor': query.get('cursor'),
+    }
+    try:
+        build_query(table, **filters)
+        limit = parse_limit(query.get('limit'))
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    return filters, limit
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
+def flask_fallback():
+    """The Flask app wrapped for ASGI."""
+    from asgiref.wsgi import WsgiToAsgi
+    from app import create_app
+    return WsgiToAsgi(create_app())
+
+application = FinanceASGI(DATABASE, LEDGER_DIR, fallback=flask_fallback, requires=('asgiref',))
@@ -0,0 +1,116 @@
+"""Run one workload against every storage backend and compare per-operation latency.
+
+The SQLite ledger is generated with the deterministic generator; the memory
+and journal backends are seeded with the same rows, income, budgets and goal.
+Each backend then runs the same operations, timed one call at a time:
+
+  * add_expense: a write inside transaction(), as the web routes and CLI do;
+  * latest_income, total, category_total, allocation_total: the hot reads;
+  * category_totals: the per-category breakdown;
+  * rows: one full pass over the expenses, oldest first;
+  * load (journal only): reopening from the compacted snapshot.
+
+    python benchmarks/backends.py --size 100k
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import connect
+from generate import generate, parse_size
+from run import peak_rss_mb, summarize
+from storage import JournalStorage, MemoryStorage, SQLiteStorage
+
+def copy_ledger(source: SQLiteStorage, target: MemoryStorage) -> None:
+    """Seed target with everything in source, bypassing any journal."""
+    for row in source.rows('expenses'):
+        MemoryStorage.add_expense(target, row['amount'], row['category'], row['description'], row['date'])
+    for row in source.rows('investments'):
+        MemoryStorage.add_investment(target, row['amount'], row['type'], row['date'])
+    for category, amount in source.budgets().items():
+        MemoryStorage.set_budget(target, category, amount)
+    MemoryStorage.set_income(target, source.latest_income())
+    MemoryStorage.set_savings_goal(target, source.savings_goal())
+
+def timed(fn, repeat: int) -> dict:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    result = summarize(durations)
+    del result['throughput_rps']
+    result['calls'] = result.pop('requests')
+    return result
+
+def run_backend(storage, category: str, writes: int, reads: int, scans: int) -> dict:
+    def add_expense():
+        with storage.transaction():
+            if storage.allocation_total() + 100 <= storage.latest_income():
+                storage.add_expense(100, category, 'benchmark', '2026-01-01 00:00:00')
+
+    def scan():
+        for _ in storage.rows('expenses'):
+            pass
+
+    return {
+        'add_expense': timed(add_expense, writes),
+        'latest_income': timed(storage.latest_income, reads),
+        'total': timed(lambda: storage.total('expenses'), reads),
+        'category_total': timed(lambda: storage.category_total('expenses', category), reads),
+        'allocation_total': timed(storage.allocation_total, reads),
+        'category_totals': timed(lambda: storage.category_totals('expenses'), reads),
+        'rows': timed(scan, scans),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=parse_size, default='10k', help='Expenses in the ledger')
+    parser.add_argument('--writes', type=int, default=200, help='Timed add_expense calls per backend')
+    parser.add_argument('--reads', type=int, default=1000, help='Timed calls per hot read')
+    parser.add_argument('--scans', type=int, default=3, help='Full passes over the expenses')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='finance-backends-')
+    results = {}
+    try:
+        database = os.path.join(workdir, 'finance.db')
+        generate(database, args.size, args.seed)
+        db = connect(database)
+        sqlite_storage = SQLiteStorage(db)
+        category = next(iter(sqlite_storage.budgets()))
+
+        memory = MemoryStorage()
+        copy_ledger(sqlite_storage, memory)
+        journal_path = os.path.join(workdir, 'finance_data')
+        journal = JournalStorage(journal_path)
+        journal.load()
+        copy_ledger(sqlite_storage, journal)
+        journal.compact()
+
+        for name, storage in (('memory', memory), ('journal', journal), ('sqlite', sqlite_storage)):
+            results[name] = run_backend(storage, category, args.writes, args.reads, args.scans)
+
+        def load():
+            fresh = JournalStorage(journal_path)
+            fresh.load()
+            fresh.close()
+        journal.compact()
+        results['journal']['load'] = timed(load, args.scans)
+        journal.close()
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({'size': args.size, 'peak_rss_mb': peak_rss_mb(), 'backends': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Build a deterministic synthetic ledger database for benchmarks.
+
+The same --size and --seed always produce the same rows: expenses spread in
+date order over five years across a long-tailed set of categories, about one
+investment per ten expenses, a budget per category and an income large enough
+that every allocation check passes.
+
+    python benchmarks/generate.py --size 1m --output /tmp/finance-bench/finance.db
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import bump_version
+from db import connect, write_transaction
+from migrations import migrate
+
+# Named sizes accepted by --size
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+CATEGORIES = 200
+INVESTMENT_TYPES = ('Stocks', 'Mutual Funds', 'Bonds', 'Gold', 'Real Estate', 'Fixed Deposit')
+INVESTMENT_RATIO = 10
+
+# Expense descriptions are "<merchant> <item>", long-tailed like the categories
+MERCHANTS = ('bigbasket', 'swiggy', 'zomato', 'amazon', 'flipkart', 'uber', 'ola', 'irctc', 'dmart',
+             'reliance fresh', 'apollo pharmacy', 'indian oil', 'bharat petroleum', 'airtel', 'jio',
+             'tata power', 'bescom', 'netflix', 'hotstar', 'myntra', 'nykaa', 'decathlon', 'croma',
+             'pvr cinemas', 'starbucks', 'chaayos', 'rapido', 'makemytrip', 'urban company', 'cult fit')
+ITEMS = ('groceries', 'dinner', 'lunch', 'breakfast', 'snacks', 'ride', 'fuel', 'train ticket',
+         'medicines', 'recharge', 'electricity bill', 'subscription', 'shoes', 'shirt', 'headphones',
+         'movie tickets', 'coffee', 'haircut', 'cleaning', 'membership', 'gift', 'books', 'stationery',
+         'vegetables', 'fruits', 'milk', 'flight', 'hotel', 'repairs', 'toys')
+
+START = datetime(2021, 1, 1)
+SPAN = timedelta(days=5 * 365)
+
+# Rows per insert transaction
+BATCH_SIZE = 50_000
+
+def parse_size(value: str) -> int:
+    """Accept a named size (10k, 1m, ...) or a plain row count."""
+    if value.lower() in SIZES:
+        return SIZES[value.lower()]
+    try:
+        return int(value.replace('_', ''))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Unknown size {value!r}; use one of {', '.join(SIZES)} or a number")
+
+def category_names(count: int = CATEGORIES) -> list:
+    return [f"category-{i:03d}" for i in range(count)]
+
+def _cum_weights(count: int) -> list:
+    cum_weights, total = [], 0.0
+    for rank in range(count):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    return cum_weights
+
+def _descriptions(rng: random.Random):
+    """Endless "<merchant> <item>" descriptions; a separate stream, so amounts and dates do not depend on it."""
+    merchants, items = _cum_weights(len(MERCHANTS)), _cum_weights(len(ITEMS))
+    while True:
+        yield f"{rng.choices(MERCHANTS, cum_weights=merchants)[0]} {rng.choices(ITEMS, cum_weights=items)[0]}"
+
+def _rows(rng: random.Random, expenses: int, categories: list):
+    """Yield (kind, amount, label, date) in date order; kind is 'expense' or 'investment'."""
+    # Long-tailed: a few categories take most of the spending, like real ledgers
+    cum_weights = _cum_weights(len(categories))
+    step = SPAN / expenses
+    for i in range(expenses):
+        when = (START + step * i).strftime('%Y-%m-%d %H:%M:%S.%f')
+        category = rng.choices(categories, cum_weights=cum_weights)[0]
+        yield 'expense', rng.randint(100, 500_000), category, when
+        if i % INVESTMENT_RATIO == 0:
+            yield 'investment', rng.randint(10_000, 5_000_000), rng.choice(INVESTMENT_TYPES), when
+
+def generate(path: str, expenses: int, seed: int = 42, categories: int = CATEGORIES,
+             batch_size: int = BATCH_SIZE) -> dict:
+    """Create path from scratch and fill it; returns a summary of what was written."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    descriptions = _descriptions(random.Random(seed + 1))
+    names = category_names(categories)
+    db = connect(path)
+    migrate(db)
+
+    spent = dict.fromkeys(names, 0)
+    invested = 0
+    counts = {'expense': 0, 'investment': 0}
+    expense_batch, investment_batch = [], []
+
+    def flush():
+        with write_transaction(db):
+            db.executemany('INSERT INTO expenses (amount, category, description, date) VALUES (?, ?, ?, ?)',
+                           expense_batch)
+            db.executemany('INSERT INTO investments (amount, type, date) VALUES (?, ?, ?)', investment_batch)
+        expense_batch.clear()
+        investment_batch.clear()
+
+    for kind, amount, label, when in _rows(rng, expenses, names):
+        counts[kind] += 1
+        if kind == 'expense':
+            spent[label] += amount
+            expense_batch.append((amount, label, next(descriptions), when))
+        else:
+            invested += amount
+            investment_batch.append((amount, label, when))
+        if len(expense_batch) >= batch_size:
+            flush()
+    flush()
+
+    # Budgets leave headroom for benchmark writes; income covers everything twice over
+    budgets = {name: max(amount * 2, 1_000_000) for name, amount in spent.items()}
+    income = (sum(budgets.values()) + sum(spent.values()) + invested) * 2
+    now = (START + SPAN).strftime('%Y-%m-%d %H:%M:%S.%f')
+    with write_transaction(db):
+        db.executemany('INSERT INTO budget (category, amount, date) VALUES (?, ?, ?)',
+                       [(name, amount, now) for name, amount in budgets.items()])
+        db.execute('INSERT INTO income (amount, date) VALUES (?, ?)', (income, now))
+        db.execute('INSERT INTO savings_goals (amount, target_date, date) VALUES (?, ?, ?)',
+                   (income // 10, (START + SPAN + timedelta(days=365)).strftime('%Y-%m-%d'), now))
+        bump_version(db)
+    db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+
+    return {
+        'path': path,
+        'seed': seed,
+        'expenses': counts['expense'],
+        'investments': counts['investment'],
+        'categories': categories,
+        'seconds': round(time.perf_counter() - started, 2),
+        'bytes': os.path.getsize(path),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=parse_size, default='10k',
+                        help=f"Expenses to generate: {', '.join(SIZES)} or a number")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--categories', type=int, default=CATEGORIES)
+    parser.add_argument('--output', default='finance.db')
+    args = parser.parse_args()
+    print(json.dumps(generate(args.output, args.size, args.seed, args.categories), indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""Benchmark the web routes and FinanceManager against a synthetic ledger.
+
+Generates (or reuses) a deterministic database of the requested size, copies
+it to a scratch directory, then measures:
+
+  * sequential requests through the Flask test client, with the response
+    cache cleared before every request unless the scenario is a cached one;
+  * concurrent GETs against a threaded local WSGI server;
+  * FinanceManager journal appends, save (compaction), load and view paths.
+
+Results are printed (or written with --output) as JSON with p50/p99 latency,
+throughput and peak RSS. --baseline compares against an earlier result and
+exits non-zero when a scenario's p50 regressed beyond --tolerance. Baselines
+are only comparable on the machine that recorded them; benchmarks/baselines/
+holds reference runs, regenerate them with --save-baseline on CI hardware.
+
+    python benchmarks/run.py --size 10k --baseline benchmarks/baselines/10k.json
+    python benchmarks/run.py --size 1m --output results-1m.json
+    python benchmarks/run.py --size 10k --save-baseline benchmarks/baselines/10k.json
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+from dashboard import FRAGMENTS
+from generate import SIZES, CATEGORIES, category_names, generate, parse_size
+
+# Regressions smaller than this many milliseconds are treated as noise
+NOISE_FLOOR_MS = 0.2
+
+# One investment per this many FinanceManager expenses, like the generator's ratio
+INVESTMENT_EVERY = 10
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+def summarize(durations: list, elapsed: float = None) -> dict:
+    durations = sorted(durations)
+    elapsed = elapsed if elapsed is not None else sum(durations)
+    return {
+        'requests': len(durations),
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3) if durations else 0.0,
+        'throughput_rps': round(len(durations) / elapsed, 1) if elapsed else 0.0,
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def prepare_database(args) -> str:
+    """Generate the ledger once per size and seed, then hand out a scratch copy."""
+    cached = os.path.join(args.data_dir, f"ledger-{args.size}-{args.seed}.db")
+    if not os.path.exists(cached):
+        print(f"Generating {args.size} expenses into {cached}...", file=sys.stderr)
+        generate(cached, args.size, args.seed)
+    scratch = os.path.join(args.workdir, 'finance.db')
+    shutil.copyfile(cached, scratch)
+    return scratch
+
+def web_scenarios(finance_app, flask_app, categories: list) -> list:
+    """(name, cached, callable(client, i)) for the sequential test-client runs."""
+    def get(path):
+        return lambda client, i: client.get(path)
+
+    def allocations(client, i):
+        with flask_app.app_context():
+            return finance_app.get_total_allocations()
+
+    def add_expense(client, i):
+        return client.post('/add_expense', data={
+            'amount': '1.00',
+            'category': categories[i % len(categories)],
+            'description': f"benchmark {i}",
+        })
+
+    def fragments(client, i):
+        for name in FRAGMENTS:
+            response = client.get(f'/dashboard/fragments/{name}')
+            if response.status_code != 200:
+                return response
+        return response
+
+    return [
+        ('dashboard', False, get('/dashboard')),
+        ('dashboard_cached', True, get('/dashboard')),
+        ('dashboard_fragments', False, fragments),
+        ('dashboard_fragments_cached', True, fragments),
+        ('api_dashboard', False, get('/api/dashboard')),
+        ('api_expenses_page', False, get('/api/expenses?limit=100')),
+        ('api_expenses_category', False, get(f'/api/expenses?limit=100&category={categories[3]}')),
+        ('api_expenses_range', False, get('/api/expenses?limit=100&start=2023-01-01&end=2023-03-31')),
+        ('api_investments_page', False, get('/api/investments?limit=100')),
+        ('search_rank', False, get('/api/expenses/search?q=swiggy+dinner&limit=50')),
+        ('search_recent', False, get('/api/expenses/search?q=gro*&order=recent&limit=50')),
+        ('search_range', False, get('/api/expenses/search?q=fuel&start=2023-01-01&end=2023-03-31&limit=50')),
+        ('reports_month', False, get('/api/reports/summary?period=month')),
+        ('reports_week', False, get('/api/reports/summary?period=week&start=2024-01-01&end=2024-12-31')),
+        ('get_total_allocations', False, allocations),
+        ('add_expense', False, add_expense),
+    ]
+
+def run_sequential(flask_app, scenarios: list, requests: int, warmup: int) -> dict:
+    client = flask_app.test_client()
+    results = {}
+    for name, cached, call in scenarios:
+        for i in range(warmup):
+            call(client, i)
+        gc.collect()
+        durations = []
+        for i in range(requests):
+            if not cached:
+                flask_app.extensions['response_cache'].clear()
+            started = time.perf_counter()
+            response = call(client, warmup + i)
+            durations.append(time.perf_counter() - started)
+            status = getattr(response, 'status_code', 200)
+            if status >= 400:
+                raise RuntimeError(f"{name} returned {status}")
+        results[name] = summarize(durations)
+        results[name]['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def run_concurrent(flask_app, requests: int, concurrency: int) -> dict:
+    server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def fetch(path):
+        started = time.perf_counter()
+        with urllib.request.urlopen(base + path, timeout=60) as response:
+            response.read()
+        return time.perf_counter() - started
+
+    results = {}
+    try:
+        for name, path in (('concurrent_api_dashboard', '/api/dashboard'),
+                           ('concurrent_api_expenses', '/api/expenses?limit=100'),
+                           ('concurrent_dashboard', '/dashboard')):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                durations = list(pool.map(lambda _: fetch(path), range(requests)))
+            results[name] = summarize(durations, time.perf_counter() - started)
+            results[name]['concurrency'] = concurrency
+            results[name]['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        server.shutdown()
+    return results
+
+def run_finance_manager(workdir: str, entries: int, appends: int, seed: int) -> dict:
+    """Time FinanceManager save/load/view over a journal-backed ledger of `entries` rows."""
+    from finance import FinanceManager
+    from journal import Journal
+    from storage import JournalStorage, MemoryStorage
+
+    rng = random.Random(seed)
+    names = category_names(CATEGORIES)
+    path = os.path.join(workdir, 'finance_data')
+    results = {}
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    storage = JournalStorage(journal=Journal(path, compact_every=entries + appends + 1))
+    manager = FinanceManager(storage)
+    with quiet:
+        manager.load_data()
+        # Seed straight into memory; only the timed appends go through the journal
+        for i in range(entries):
+            MemoryStorage.add_expense(storage, rng.randint(100, 500000), names[i % len(names)],
+                                      date=f"2024-01-01 00:00:{i % 60:02d}")
+            if i % INVESTMENT_EVERY == 0:
+                MemoryStorage.add_investment(storage, rng.randint(100, 5000000), "Stocks",
+                                             date="2024-01-01 00:00:00")
+
+        def timed(name, fn, repeat=1):
+            durations = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                durations.append(time.perf_counter() - started)
+            results[name] = summarize(durations)
+            results[name]['peak_rss_mb'] = peak_rss_mb()
+
+        timed('fm_save_data', storage.compact, repeat=3)
+        timed('fm_append', lambda: storage.add_expense(100, "bench", date="2024-01-02 00:00:00"), repeat=appends)
+
+        def load():
+            fresh = FinanceManager(JournalStorage(path))
+            fresh.load_data()
+            fresh.storage.close()
+        timed('fm_load_data', load, repeat=3)
+        timed('fm_view_expenses', manager.view_expenses, repeat=5)
+        timed('fm_view_transaction_history', manager.view_transaction_history, repeat=3)
+        timed('fm_view_investments', manager.view_investments, repeat=3)
+        storage.close()
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return (name, baseline p50, current p50, ratio) for every regressed scenario.
+
+    A scenario the baseline has no figure for is reported too, with None for
+    the baseline p50 and the ratio, so a stale baseline fails instead of passing.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or not before['p50_ms']:
+            regressions.append((name, None, current['p50_ms'], None))
+            continue
+        ratio = current['p50_ms'] / before['p50_ms']
+        if ratio > 1 + tolerance and current['p50_ms'] - before['p50_ms'] > NOISE_FLOOR_MS:
+            regressions.append((name, before['p50_ms'], current['p50_ms'], round(ratio, 2)))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=parse_size, default='10k',
+                        help=f"Expenses in the ledger: {', '.join(SIZES)} or a number")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--requests', type=int, default=200, help='Sequential requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrent-requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--fm-entries', type=int, default=None,
+                        help='FinanceManager ledger rows (default: the ledger size, capped at 1m)')
+    parser.add_argument('--fm-appends', type=int, default=50, help='Journaled appends to time')
+    parser.add_argument('--skip', action='append', default=[], choices=['web', 'concurrent', 'finance'],
+                        help='Skip a group of scenarios')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'finance-bench'),
+                        help='Where generated ledgers are cached between runs')
+    parser.add_argument('--output', help='Write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier results to compare p50 latencies against')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed p50 slowdown versus the baseline, as a fraction')
+    parser.add_argument('--save-baseline', help='Also write the results to this baseline file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Every statement in a bulk benchmark is "slow" by the production threshold
+    logging.getLogger('metrics').setLevel(logging.ERROR)
+
+    args.workdir = tempfile.mkdtemp(prefix='finance-bench-run-')
+    database = prepare_database(args)
+
+    import app as finance_app
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    flask_app = finance_app.create_app({
+        'DATABASE': database,
+        'LEDGER_DIR': os.path.join(args.workdir, 'ledgers'),
+    })
+
+    scenarios = {}
+    started = time.perf_counter()
+    if 'web' not in args.skip:
+        scenarios.update(run_sequential(flask_app, web_scenarios(finance_app, flask_app, category_names()),
+                                        args.requests, args.warmup))
+    if 'concurrent' not in args.skip:
+        scenarios.update(run_concurrent(flask_app, args.concurrent_requests, args.concurrency))
+    if 'finance' not in args.skip:
+        entries = args.fm_entries if args.fm_entries is not None else min(args.size, SIZES['1m'])
+        scenarios.update(run_finance_manager(args.workdir, entries, args.fm_appends, args.seed))
+
+    results = {
+        'meta': {
+            'size': args.size,
+            'seed': args.seed,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'seconds': round(time.perf_counter() - started, 2),
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'scenarios': scenarios,
+    }
+    shutil.rmtree(args.workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            f.write(text + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            if before is None:
+                print(f"MISSING {name}: not in the baseline; regenerate it with --save-baseline", file=sys.stderr)
+            else:
+                print(f"REGRESSION {name}: p50 {before} ms -> {after} ms ({ratio}x)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Measure cold start: a fresh interpreter from import to its first response.
+
+Each run spawns a new Python process against a pre-migrated ledger and times,
+inside that process, everything from the first import of the app to the
+first complete response, plus the wall time of the whole process (which
+adds interpreter start-up). Scenarios:
+
+  * asgi_api: import asgi, then answer /api/dashboard (what a uvicorn worker does);
+  * wsgi_api: import app, create_app() and answer /api/dashboard;
+  * wsgi_dashboard: the same for the rendered /dashboard page, which also
+    loads the templates (compiled ahead of time unless --no-compile).
+
+Exits non-zero when a scenario's p50 exceeds --target-ms and --check is given.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --check --target-ms 100 --scenario asgi_api
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate import generate
+from run import summarize
+
+TARGET_MS = 100
+
+# Child programs; each prints the milliseconds from its first app import to the first response
+_CHILD_PRELUDE = '''
+import time
+started = time.perf_counter()
+'''
+
+SCENARIOS = {
+    'asgi_api': _CHILD_PRELUDE + '''
+import asyncio
+import asgi
+
+async def first_response():
+    application = asgi.FinanceASGI(DATABASE, LEDGER_DIR)
+    application.start()
+    messages = []
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+    async def send(message):
+        messages.append(message)
+    scope = {'type': 'http', 'method': 'GET', 'path': '/api/dashboard', 'query_string': b'', 'headers': []}
+    await application(scope, receive, send)
+    application.stop()
+    return messages[0]['status']
+
+status = asyncio.run(first_response())
+''',
+    'wsgi_api': _CHILD_PRELUDE + '''
+import app
+status = app.create_app({'DATABASE': DATABASE, 'LEDGER_DIR': LEDGER_DIR}).test_client().get('/api/dashboard').status_code
+''',
+    'wsgi_dashboard': _CHILD_PRELUDE + '''
+import app
+status = app.create_app({'DATABASE': DATABASE, 'LEDGER_DIR': LEDGER_DIR}).test_client().get('/dashboard').status_code
+''',
+}
+
+_CHILD_EPILOGUE = '''
+assert status == 200, status
+print((time.perf_counter() - started) * 1000)
+'''
+
+def run_child(name: str, database: str, ledger_dir: str) -> tuple:
+    """Run one scenario in a fresh process; returns (in-process ms, wall ms)."""
+    source = (f"DATABASE = {database!r}\nLEDGER_DIR = {ledger_dir!r}\n"
+              + SCENARIOS[name] + _CHILD_EPILOGUE)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', source], cwd=ROOT, env=env,
+                               capture_output=True, text=True)
+    wall = (time.perf_counter() - started) * 1000
+    if completed.returncode:
+        raise RuntimeError(f"{name} failed:\n{completed.stderr}")
+    return float(completed.stdout.strip().splitlines()[-1]), wall
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per scenario')
+    parser.add_argument('--size', type=int, default=10_000, help='Expenses in the ledger')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run (default: all)')
+    parser.add_argument('--no-compile', action='store_true',
+                        help='Do not precompile the templates first')
+    parser.add_argument('--target-ms', type=float, default=TARGET_MS)
+    parser.add_argument('--check', action='store_true',
+                        help='Exit non-zero when a p50 exceeds --target-ms')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='finance-startup-')
+    database = os.path.join(workdir, 'finance.db')
+    ledger_dir = os.path.join(workdir, 'ledgers')
+    generate(database, args.size)
+    if not args.no_compile:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'compile-templates'],
+                       cwd=ROOT, check=True, capture_output=True)
+
+    results = {}
+    try:
+        for name in args.scenario or SCENARIOS:
+            # One untimed run so every scenario starts with warm bytecode and page caches
+            run_child(name, database, ledger_dir)
+            timings = [run_child(name, database, ledger_dir) for _ in range(args.runs)]
+            results[name] = summarize([inside / 1000 for inside, _ in timings])
+            results[name]['runs'] = results[name].pop('requests')
+            results[name]['wall_p50_ms'] = summarize([wall / 1000 for _, wall in timings])['p50_ms']
+            results[name]['within_target'] = results[name]['p50_ms'] <= args.target_ms
+            del results[name]['throughput_rps']
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({'target_ms': args.target_ms, 'precompiled': not args.no_compile,
+                      'scenarios': results}, indent=2))
+    missed = [name for name, result in results.items() if not result['within_target']]
+    if args.check and missed:
+        print(f"Over the {args.target_ms:g} ms target: {', '.join(missed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
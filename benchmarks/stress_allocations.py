@@ -0,0 +1,109 @@
+"""Fire concurrent POSTs at the allocation-checked routes and assert the income invariant.
+
+Starts the app on a local threaded (or forking) WSGI server against a fresh
+database, sets a small income, then sends far more /add_expense and
+/add_investment requests in parallel than the income can cover. Afterwards
+the total of accepted allocations must not exceed the income, must equal the
+number of accepted requests times their amount, and the running totals must
+match the raw rows.
+
+    python benchmarks/stress_allocations.py --requests 2000 --concurrency 64
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+
+import app as finance_app
+from db import connect
+from totals import allocation_total, verify_totals
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def _post(opener, url, fields):
+    data = urllib.parse.urlencode(fields).encode()
+    try:
+        with opener.open(url, data=data, timeout=60) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Serve with this many forked worker processes instead of threads')
+    parser.add_argument('--income', type=int, default=500, help='Income in rupees')
+    parser.add_argument('--amount', type=int, default=1, help='Rupees per POST')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='finance-stress-')
+    database = os.path.join(workdir, 'finance.db')
+    flask_app = finance_app.create_app({'DATABASE': database})
+    client = flask_app.test_client()
+    client.post('/set_income', data={'amount': str(args.income)})
+
+    if args.processes > 1:
+        server = make_server('127.0.0.1', 0, flask_app, processes=args.processes)
+    else:
+        server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    opener = urllib.request.build_opener(_NoRedirect)
+    def fire(i):
+        if i % 2:
+            return _post(opener, f"{base}/add_investment", {'amount': args.amount, 'type': 'Stocks'})
+        return _post(opener, f"{base}/add_expense",
+                     {'amount': args.amount, 'category': f"cat{i % 7}", 'description': f"stress {i}"})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        statuses = list(pool.map(fire, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    db = connect(database)
+    income = args.income * 100
+    allocated = allocation_total(db)
+    accepted = statuses.count(302)
+    mismatches = verify_totals(db)
+    result = {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'processes': args.processes,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'accepted': accepted,
+        'rejected': statuses.count(400),
+        'other_statuses': sorted({s for s in statuses if s not in (302, 400)}),
+        'income_paise': income,
+        'allocated_paise': allocated,
+        'totals_consistent': not mismatches,
+    }
+    print(json.dumps(result, indent=2))
+
+    ok = (allocated <= income
+          and allocated == accepted * args.amount * 100
+          and not mismatches
+          and not result['other_statuses'])
+    if not ok:
+        print("INVARIANT VIOLATED", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
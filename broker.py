@@ -0,0 +1,201 @@
+"""Fan-out of ledger changes to the clients of the live event stream.
+
+One broker thread per worker process checks, every POLL_INTERVAL seconds,
+the data version of each ledger that has subscribers; that is one indexed
+single-row read per ledger, however many clients are connected or however
+many other processes write to it. When the version has moved, the new alerts,
+transactions and totals are read once (events.read_changes) and the encoded
+events are put on every subscriber's queue. Subscribers are served from a
+thread (Flask) or an event loop (asgi.py); a client that falls QUEUE_SIZE
+events behind is disconnected and resumes with a fresh snapshot when its
+browser reconnects.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+from cache import data_version
+from db import close_pool, release_connection
+from events import format_event, live_totals, read_alerts, read_changes, read_marks
+from tenants import tenant_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for changes in subscribed ledgers
+POLL_INTERVAL = float(os.environ.get('FINANCE_EVENTS_POLL_INTERVAL', 0.5))
+
+# Seconds without events before a keep-alive comment is sent
+HEARTBEAT_SECONDS = 15
+
+# Events queued per client before it is dropped as too slow
+QUEUE_SIZE = 256
+
+# Sent on timeouts; proxies and browsers keep idle streams open while they see traffic
+HEARTBEAT = b': keep-alive\n\n'
+
+# Milliseconds a browser waits before reconnecting
+RETRY_MS = 3000
+
+class Subscription:
+    """One client's queue of encoded events, filled by the broker thread.
+
+    With loop set the queue belongs to that event loop and is read with
+    await next(); otherwise it is read with get() from a request thread.
+    """
+
+    def __init__(self, path: str, loop: asyncio.AbstractEventLoop = None):
+        self.path = path
+        self.loop = loop
+        self.closed = False
+        self._queue = asyncio.Queue() if loop is not None else queue.Queue()
+
+    def push(self, message) -> bool:
+        """Queue an event (None ends the stream); False once the client is closed or too far behind."""
+        if self.closed:
+            return False
+        if message is None or self._queue.qsize() >= QUEUE_SIZE:
+            self.closed = True
+            message = None
+        try:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self._queue.put_nowait, message)
+            else:
+                self._queue.put_nowait(message)
+        except RuntimeError:
+            # The client's event loop is gone
+            self.closed = True
+        return not self.closed
+
+    def close(self) -> None:
+        self.push(None)
+
+    def get(self, timeout: float = HEARTBEAT_SECONDS):
+        """Next event, HEARTBEAT after timeout seconds of silence, or None when the stream has ended."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return HEARTBEAT
+
+    async def next(self, timeout: float = HEARTBEAT_SECONDS):
+        """Like get(), for a subscription made with an event loop."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return HEARTBEAT
+
+class _Feed:
+    def __init__(self, marks: dict):
+        self.marks = marks
+        self.subscribers = set()
+
+class EventBroker:
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self._feeds = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, db, path: str, last_event_id: str = None, loop=None) -> Subscription:
+        """Subscribe to the ledger at path (db is a connection to it).
+
+        The subscription starts with the retry interval, the budget alerts
+        after last_event_id and the current totals; the broker then adds
+        every later change.
+        """
+        subscription = Subscription(path, loop)
+        with self._lock:
+            feed = self._feeds.get(path)
+            if feed is None:
+                feed = self._feeds[path] = _Feed(read_marks(db))
+            subscription.push(f'retry: {RETRY_MS}\n\n'.encode())
+            if last_event_id and last_event_id.isdigit():
+                for message in read_alerts(db, int(last_event_id), feed.marks['budget_alerts']):
+                    subscription.push(message)
+            subscription.push(format_event('totals', live_totals(db)))
+            # Under the lock, so the broker cannot deliver changes past marks this snapshot already covers
+            feed.subscribers.add(subscription)
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.closed = True
+        with self._lock:
+            feed = self._feeds.get(subscription.path)
+            if feed is not None:
+                feed.subscribers.discard(subscription)
+
+    def subscribers(self) -> int:
+        with self._lock:
+            return sum(len(feed.subscribers) for feed in self._feeds.values())
+
+    def poll_once(self) -> int:
+        """Push the changes of every subscribed ledger; returns the number of events sent."""
+        with self._lock:
+            # Ledgers nobody watches any more start from scratch when someone subscribes again
+            for path in [path for path, feed in self._feeds.items() if not feed.subscribers]:
+                del self._feeds[path]
+            feeds = list(self._feeds.items())
+        sent = 0
+        for path, feed in feeds:
+            db = None
+            try:
+                db = tenant_connection(path)
+                if data_version(db)[0] == feed.marks['version']:
+                    continue
+                messages, marks = read_changes(db, feed.marks)
+            except Exception as e:
+                # One broken ledger must not stop the others
+                logger.error(f"Reading events from {path} failed: {str(e)}")
+                continue
+            finally:
+                if db is not None:
+                    release_connection(db)
+            with self._lock:
+                feed.marks = marks
+                for subscription in list(feed.subscribers):
+                    for message in messages:
+                        if not subscription.push(message):
+                            feed.subscribers.discard(subscription)
+                            break
+                        sent += 1
+        return sent
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='finance-events', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling and end every open stream."""
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+            for feed in self._feeds.values():
+                for subscription in feed.subscribers:
+                    subscription.close()
+            self._feeds.clear()
+        if thread is not None:
+            thread.join()
+        self._stop.clear()
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                self.poll_once()
+        finally:
+            close_pool()
+
+_broker = None
+_lock = threading.Lock()
+
+def get_broker() -> EventBroker:
+    """This process's event broker; its thread starts with the first subscriber."""
+    global _broker
+    with _lock:
+        if _broker is None:
+            _broker = EventBroker()
+    return _broker
@@ -0,0 +1,52 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """Bounded LRU cache whose entries are tied to the data version they were built from.
+
+    An entry is only returned for the same data version it was stored
+    with, so a write anywhere (which bumps the version) invalidates every
+    entry at once. ttl bounds how long an entry lives even if nothing is
+    written, for views that also depend on the clock.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_version, expires, value = entry
+            if entry_version != version or expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, version: int, value) -> None:
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+def data_version(db: sqlite3.Connection) -> tuple:
+    """Return (version, modified_at epoch seconds) of the ledger data."""
+    row = db.execute('SELECT version, modified_at FROM data_version WHERE id = 1').fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+def bump_version(db: sqlite3.Connection) -> None:
+    """Mark the data as changed; call inside the writing transaction, before commit."""
+    db.execute('UPDATE data_version SET version = version + 1, modified_at = ? WHERE id = 1',
+               (time.time(),))
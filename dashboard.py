@@ -0,0 +1,94 @@
+import sqlite3
+
+from listing import serialize_expense, serialize_investment
+from validators import format_currency
+
+# Dashboard sections, each fetched, cached and revalidated on its own: the snapshot_json() keys each one shows
+FRAGMENTS = {
+    'totals': ('has_income', 'income', 'expenses', 'investments', 'savings', 'savings_target'),
+    'recent': ('recent_expenses', 'recent_investments'),
+    'budgets': ('budgets',),
+    # Not part of snapshot_json(); app.py simulates it on its own (forecast.py)
+    'forecast': ('forecast',),
+}
+
+def dashboard_snapshot(db: sqlite3.Connection) -> dict:
+    """Read every dashboard figure in one read transaction so they agree with each other."""
+    db.execute('BEGIN')
+    try:
+        income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
+        table_totals = {row['source']: row['amount'] for row in db.execute('''
+            SELECT source, amount
+            FROM totals
+            WHERE category = ''
+        ''')}
+        savings_goal = db.execute('SELECT amount FROM savings_goals ORDER BY date DESC LIMIT 1').fetchone()
+        recent_expenses = db.execute('''
+            SELECT id, amount, category, description, date
+            FROM expenses 
+            ORDER BY date DESC LIMIT 5
+        ''').fetchall()
+        recent_investments = db.execute('''
+            SELECT id, amount, type, date
+            FROM investments 
+            ORDER BY date DESC LIMIT 5
+        ''').fetchall()
+        # Spend per budget category comes from the running totals in the same pass
+        budgets = db.execute('''
+            SELECT b.category, b.amount, COALESCE(t.amount, 0) AS spent
+            FROM budget b
+            LEFT JOIN totals t ON t.source = 'expenses' AND t.category = b.category
+            ORDER BY b.category
+        ''').fetchall()
+    finally:
+        db.commit()
+
+    total_income = income[0] if income else 0
+    expenses = table_totals.get('expenses', 0)
+    return {
+        'income': total_income,
+        'expenses': expenses,
+        'investments': table_totals.get('investments', 0),
+        'savings': total_income - expenses,
+        'savings_target': savings_goal[0] if savings_goal else 0,
+        'recent_expenses': recent_expenses,
+        'recent_investments': recent_investments,
+        'budget_data': [{
+            'category': budget['category'],
+            'total': budget['amount'],
+            'spent': budget['spent'],
+            'remaining': budget['amount'] - budget['spent'],
+            'percentage': (budget['spent'] / budget['amount'] * 100) if budget['amount'] > 0 else 0
+        } for budget in budgets],
+        'has_income': income is not None,
+    }
+
+def snapshot_json(snapshot: dict) -> dict:
+    """JSON form of a dashboard snapshot, with raw paise next to every formatted amount.
+
+    Every amount is formatted here, once per snapshot; the dashboard
+    fragments render from this form too.
+    """
+    def money(paise):
+        return {"amount": format_currency(paise), "amount_paise": paise}
+    return {
+        "has_income": snapshot['has_income'],
+        "income": money(snapshot['income']),
+        "expenses": money(snapshot['expenses']),
+        "investments": money(snapshot['investments']),
+        "savings": money(snapshot['savings']),
+        "savings_target": money(snapshot['savings_target']),
+        "recent_expenses": [serialize_expense(row) for row in snapshot['recent_expenses']],
+        "recent_investments": [serialize_investment(row) for row in snapshot['recent_investments']],
+        "budgets": [{
+            "category": budget['category'],
+            "total": money(budget['total']),
+            "spent": money(budget['spent']),
+            "remaining": money(budget['remaining']),
+            "percentage": round(budget['percentage'], 1)
+        } for budget in snapshot['budget_data']]
+    }
+
+def fragment_json(data: dict, name: str) -> dict:
+    """The part of snapshot_json() output shown by one dashboard fragment."""
+    return {key: data[key] for key in FRAGMENTS[name]}
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import InstrumentedConnection
+
+logger = logging.getLogger(__name__)
+
+# Default database file
+DATABASE = 'finance.db'
+
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+# Pragmas applied once when a pooled connection is opened.
+# WAL lets readers run alongside the single writer, NORMAL sync is safe under WAL,
+# and a negative cache_size is expressed in KiB (~16 MB page cache).
+CONNECTION_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+# Attempts to take the write lock after busy_timeout has already expired, and the base backoff
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+
+SQLITE_BUSY = 5
+
+# Open connections kept per thread; with one database file per ledger the
+# least recently used handles are closed past this point
+POOL_SIZE = 64
+
+_local = threading.local()
+
+def connect(path: str = DATABASE) -> sqlite3.Connection:
+    """Open a new tuned SQLite connection."""
+    db = sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, factory=InstrumentedConnection)
+    db.row_factory = sqlite3.Row
+    for name, value in CONNECTION_PRAGMAS:
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+def pooled_connection(path: str = DATABASE) -> sqlite3.Connection:
+    """Return this thread's reusable connection for path, opening it on first use.
+
+    Each thread keeps at most POOL_SIZE connections, evicting the least
+    recently used one when a new path is opened.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = OrderedDict()
+    db = connections.get(path)
+    if db is not None:
+        connections.move_to_end(path)
+        return db
+    while len(connections) >= POOL_SIZE:
+        stale_path, stale = connections.popitem(last=False)
+        stale.close()
+        logger.debug(f"Closed idle pooled connection to {stale_path}")
+    db = connections[path] = connect(path)
+    logger.debug(f"Opened pooled connection to {path}")
+    return db
+
+def release_connection(db: sqlite3.Connection) -> None:
+    """Hand a pooled connection back, discarding any uncommitted work."""
+    if db.in_transaction:
+        db.rollback()
+
+def close_pool() -> None:
+    """Close every pooled connection owned by the calling thread."""
+    connections = getattr(_local, 'connections', {})
+    while connections:
+        _, db = connections.popitem()
+        db.close()
+
+def is_busy(error: sqlite3.OperationalError) -> bool:
+    """True if error is SQLITE_BUSY (or one of its extended codes)."""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff == SQLITE_BUSY
+    return 'database is locked' in str(error)
+
+def begin_immediate(db: sqlite3.Connection, retries: int = BUSY_RETRIES, backoff: float = BUSY_BACKOFF) -> None:
+    """BEGIN IMMEDIATE, retrying with jittered exponential backoff while the database is busy."""
+    for attempt in range(retries + 1):
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            break
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt) * (0.5 + random.random())
+            logger.warning(f"Database busy, retrying write in {delay:.3f}s")
+            time.sleep(delay)
+
+@contextmanager
+def write_transaction(db: sqlite3.Connection, retries: int = BUSY_RETRIES, backoff: float = BUSY_BACKOFF):
+    """Run a block as one BEGIN IMMEDIATE transaction; commit on success, roll back on error.
+
+    Taking the write lock up front means every read inside the block (e.g. an
+    allocation check) sees data no other writer can change before the
+    matching insert commits, while WAL readers carry on unblocked.
+    """
+    begin_immediate(db, retries, backoff)
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    else:
+        db.commit()
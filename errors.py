@@ -0,0 +1,15 @@
+# Custom exceptions shared by the web app and its helper modules
+class DatabaseError(Exception):
+    pass
+
+class ValidationError(Exception):
+    pass
+
+class InsufficientFundsError(Exception):
+    pass
+
+class DateValidationError(Exception):
+    pass
+
+class NotFoundError(Exception):
+    pass
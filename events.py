@@ -0,0 +1,140 @@
+"""What the live event stream (/api/events) sends, read from a ledger after it changes.
+
+Budget threshold crossings are recorded at write time by the triggers in
+events.sql. Everything else is read incrementally: new transactions are the
+rows past the highest ids already seen, and the totals come from the running
+totals table, so one read per change serves every connected client whatever
+the ledger's size. broker.py runs the reads and fans the results out.
+
+Events go out in the server-sent events format:
+
+- budget: a category crossed an alert threshold. Its SSE id is the alert id,
+  so a reconnecting browser's Last-Event-ID gets the alerts it missed.
+- transactions: rows added to expenses, investments or income; at most
+  MAX_TRANSACTIONS of the newest per source, with the full count.
+- totals: income, table totals, savings and budget progress after the change.
+"""
+import json
+import sqlite3
+
+from cache import data_version
+from listing import serialize_expense, serialize_investment
+from validators import format_currency
+
+EVENTS_SCHEMA = 'events.sql'
+
+# Transactions listed per source in one event; a bulk import is reported by count beyond this
+MAX_TRANSACTIONS = 50
+
+# Tables whose new rows are pushed, with the columns sent
+TRANSACTION_SOURCES = {
+    'expenses': 'id, amount, category, description, date',
+    'investments': 'id, amount, type, date',
+    'income': 'id, amount, date',
+}
+
+def format_event(event: str, data: dict, id: int = None) -> bytes:
+    """Encode one server-sent event."""
+    head = f'id: {id}\n' if id is not None else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'.encode()
+
+def read_marks(db: sqlite3.Connection) -> dict:
+    """The data version and highest id of every pushed table, where a feed starts from."""
+    marks = {'version': data_version(db)[0]}
+    for table in (*TRANSACTION_SOURCES, 'budget_alerts'):
+        marks[table] = db.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+    return marks
+
+def read_changes(db: sqlite3.Connection, marks: dict) -> tuple:
+    """Encoded events for everything written after marks, and the marks to continue from.
+
+    All reads happen in one read transaction, so the totals agree with the
+    transactions and alerts sent alongside them.
+    """
+    db.execute('BEGIN')
+    try:
+        new_marks = {'version': data_version(db)[0]}
+        messages = []
+        for alert in db.execute('SELECT * FROM budget_alerts WHERE id > ? ORDER BY id', (marks['budget_alerts'],)):
+            messages.append(format_event('budget', serialize_alert(alert), alert['id']))
+            new_marks['budget_alerts'] = alert['id']
+        new_marks.setdefault('budget_alerts', marks['budget_alerts'])
+        for source, columns in TRANSACTION_SOURCES.items():
+            rows = db.execute(f'SELECT {columns} FROM {source} WHERE id > ? ORDER BY id DESC LIMIT ?',
+                              (marks[source], MAX_TRANSACTIONS)).fetchall()
+            new_marks[source] = rows[0]['id'] if rows else marks[source]
+            if rows:
+                count = len(rows) if len(rows) < MAX_TRANSACTIONS else db.execute(
+                    f'SELECT COUNT(*) FROM {source} WHERE id > ?', (marks[source],)).fetchone()[0]
+                messages.append(format_event('transactions', {
+                    "source": source,
+                    "count": count,
+                    "items": [serialize_transaction(source, row) for row in reversed(rows)],
+                }))
+        messages.append(format_event('totals', live_totals(db)))
+    finally:
+        db.commit()
+    return messages, new_marks
+
+def read_alerts(db: sqlite3.Connection, after: int, through: int) -> list:
+    """Encoded budget events with ids in (after, through], for a client resuming from after."""
+    return [format_event('budget', serialize_alert(alert), alert['id']) for alert in db.execute(
+        'SELECT * FROM budget_alerts WHERE id > ? AND id <= ? ORDER BY id', (after, through))]
+
+def live_totals(db: sqlite3.Connection) -> dict:
+    """Income, table totals, savings and budget progress, all from the running totals."""
+    def money(paise):
+        return {"amount": format_currency(paise), "amount_paise": paise}
+
+    income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
+    table_totals = {row['source']: row['amount'] for row in db.execute('''
+        SELECT source, amount
+        FROM totals
+        WHERE category = ''
+    ''')}
+    budgets = db.execute('''
+        SELECT b.category, b.amount, COALESCE(t.amount, 0) AS spent
+        FROM budget b
+        LEFT JOIN totals t ON t.source = 'expenses' AND t.category = b.category
+        ORDER BY b.category
+    ''').fetchall()
+    total_income = income[0] if income else 0
+    expenses = table_totals.get('expenses', 0)
+    return {
+        "version": data_version(db)[0],
+        "income": money(total_income),
+        "expenses": money(expenses),
+        "investments": money(table_totals.get('investments', 0)),
+        "savings": money(total_income - expenses),
+        "budgets": [{
+            "category": budget['category'],
+            "total": money(budget['amount']),
+            "spent": money(budget['spent']),
+            "percentage": round(budget['spent'] / budget['amount'] * 100, 1) if budget['amount'] > 0 else 0
+        } for budget in budgets]
+    }
+
+def serialize_alert(alert) -> dict:
+    """JSON form of a budget_alerts row."""
+    return {
+        "id": alert['id'],
+        "category": alert['category'],
+        "threshold": alert['threshold'],
+        "spent": format_currency(alert['spent']),
+        "spent_paise": alert['spent'],
+        "budget": format_currency(alert['budget']),
+        "budget_paise": alert['budget'],
+        "date": alert['date']
+    }
+
+def serialize_transaction(source: str, row) -> dict:
+    if source == 'expenses':
+        return serialize_expense(row)
+    if source == 'investments':
+        return serialize_investment(row)
+    return {
+        "id": row['id'],
+        "amount": format_currency(row['amount']),
+        "amount_paise": row['amount'],
+        "date": row['date']
+    }
@@ -0,0 +1,60 @@
+-- Budget alerts for the live event stream (events.py, broker.py). The triggers below
+-- compare a category's running spend (totals) with its budget at write time and, in
+-- the same transaction, record the highest alert threshold the write carries it across.
+
+-- Percentages of a budget that raise an alert; edit the rows to change them
+CREATE TABLE IF NOT EXISTS alert_thresholds (
+    percent INTEGER PRIMARY KEY CHECK (percent > 0)
+);
+
+INSERT OR IGNORE INTO alert_thresholds (percent) VALUES (50), (80), (100);
+
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    threshold INTEGER NOT NULL,
+    spent INTEGER NOT NULL,
+    budget INTEGER NOT NULL,
+    date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- BEFORE, so the totals row still holds the spend without this expense
+-- whichever order the AFTER triggers run in
+CREATE TRIGGER IF NOT EXISTS expenses_budget_alert BEFORE INSERT ON expenses
+BEGIN
+    INSERT INTO budget_alerts (category, threshold, spent, budget)
+    SELECT b.category, MAX(a.percent), COALESCE(t.amount, 0) + NEW.amount, b.amount
+    FROM budget b
+    JOIN alert_thresholds a
+    LEFT JOIN totals t ON t.source = 'expenses' AND t.category = b.category
+    WHERE b.category = NEW.category
+      AND COALESCE(t.amount, 0) * 100 < a.percent * b.amount
+      AND (COALESCE(t.amount, 0) + NEW.amount) * 100 >= a.percent * b.amount
+    GROUP BY b.category;
+END;
+
+-- A new budget below what the category has already spent
+CREATE TRIGGER IF NOT EXISTS budget_alert_insert AFTER INSERT ON budget
+BEGIN
+    INSERT INTO budget_alerts (category, threshold, spent, budget)
+    SELECT NEW.category, MAX(a.percent), t.amount, NEW.amount
+    FROM totals t
+    JOIN alert_thresholds a
+    WHERE t.source = 'expenses' AND t.category = NEW.category
+      AND t.amount * 100 >= a.percent * NEW.amount
+    GROUP BY t.category;
+END;
+
+-- A lowered budget
+CREATE TRIGGER IF NOT EXISTS budget_alert_update AFTER UPDATE OF amount ON budget
+WHEN NEW.amount < OLD.amount
+BEGIN
+    INSERT INTO budget_alerts (category, threshold, spent, budget)
+    SELECT NEW.category, MAX(a.percent), t.amount, NEW.amount
+    FROM totals t
+    JOIN alert_thresholds a
+    WHERE t.source = 'expenses' AND t.category = NEW.category
+      AND t.amount * 100 < a.percent * OLD.amount
+      AND t.amount * 100 >= a.percent * NEW.amount
+    GROUP BY t.category;
+END;
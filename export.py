@@ -0,0 +1,207 @@
+"""Streaming export of a ledger's tables to CSV, NDJSON or Parquet.
+
+Rows are read from the SQLite cursor CHUNK_SIZE at a time and encoded (and
+optionally gzipped) chunk by chunk, so memory stays flat however large the
+table is. Expenses and investments moved out by archive.py are exported too,
+ahead of the live rows. A whole export reads one snapshot of the ledger.
+
+Amounts are exported as integer paise (amount_paise), not formatted currency.
+Parquet needs pyarrow, which is optional.
+"""
+import csv
+import importlib.util
+import io
+import json
+import sqlite3
+import zlib
+from datetime import timedelta
+
+from archive import read_archive
+from errors import ValidationError
+from validators import validate_date
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+# Exported tables and their columns, in output order; amount is renamed amount_paise
+TABLES = {
+    'expenses': ('id', 'amount', 'category', 'description', 'date'),
+    'investments': ('id', 'amount', 'type', 'date'),
+    'income': ('id', 'amount', 'date'),
+    'budget': ('id', 'category', 'amount', 'date'),
+    'savings_goals': ('id', 'amount', 'target_date', 'date'),
+}
+
+# Tables whose old rows may live in archive_chunks
+ARCHIVED_TABLES = ('expenses', 'investments')
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'parquet': 'parquet'}
+
+# Rows fetched from SQLite and encoded per step
+CHUNK_SIZE = 5000
+
+# Rows per Parquet row group; larger groups compress and scan better
+PARQUET_ROW_GROUP = 64 * 1024
+
+_INTEGER_COLUMNS = ('id', 'amount')
+
+def header(table: str) -> list:
+    return ['amount_paise' if column == 'amount' else column for column in TABLES[table]]
+
+def check_export(table: str, fmt: str, compress: bool = False, start: str = None, end: str = None) -> None:
+    """Reject a bad export request before any output is produced."""
+    if table not in TABLES:
+        raise ValidationError(f"Unknown table. Must be one of: {', '.join(TABLES)}")
+    if fmt not in FORMATS:
+        raise ValidationError(f"Unsupported format. Must be one of: {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ValidationError("Parquet export needs pyarrow; install it or use csv or ndjson")
+        if compress:
+            raise ValidationError("Parquet files are compressed internally; drop gzip")
+    for value in (start, end):
+        if value:
+            validate_date(value)
+
+def filename(table: str, fmt: str, compress: bool = False) -> str:
+    return f"{table}.{EXTENSIONS[fmt]}{'.gz' if compress else ''}"
+
+def iter_export_batches(db: sqlite3.Connection, table: str, start: str = None, end: str = None):
+    """Yield lists of up to CHUNK_SIZE row tuples in TABLES order, archived rows first, then by (date, id).
+
+    start and end are inclusive YYYY-MM-DD dates on the date column.
+    """
+    columns = TABLES[table]
+    low = validate_date(start).strftime('%Y-%m-%d') if start else None
+    high = (validate_date(end) + timedelta(days=1)).strftime('%Y-%m-%d') if end else None
+
+    if table in ARCHIVED_TABLES:
+        batch = []
+        for row in read_archive(db, table, low, high):
+            if (low and row['date'] < low) or (high and row['date'] >= high):
+                continue
+            batch.append(tuple(row[column] for column in columns))
+            if len(batch) >= CHUNK_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    clauses, params = [], []
+    if low:
+        clauses.append('date >= ?')
+        params.append(low)
+    if high:
+        clauses.append('date < ?')
+        params.append(high)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    # Plain tuples: cheaper than sqlite3.Row and all every encoder needs
+    cursor = db.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY date, id", params)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        yield rows
+
+def export_table(db: sqlite3.Connection, table: str, fmt: str, start: str = None, end: str = None,
+                 compress: bool = False):
+    """Yield the encoded export of table as a sequence of bytes chunks.
+
+    Call check_export() first. The rows come from one read transaction, so
+    the file is consistent even while writes go on.
+    """
+    owns_transaction = not db.in_transaction
+    if owns_transaction:
+        db.execute('BEGIN')
+    try:
+        batches = iter_export_batches(db, table, start, end)
+        if fmt == 'parquet':
+            chunks = _parquet_chunks(table, batches)
+        else:
+            chunks = _text_chunks(table, fmt, batches)
+        if compress:
+            chunks = _gzip(chunks)
+        yield from chunks
+    finally:
+        if owns_transaction:
+            db.commit()
+
+def _text_chunks(table: str, fmt: str, batches):
+    names = header(table)
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(names)
+    for batch in batches:
+        if fmt == 'csv':
+            writer.writerows(batch)
+        else:
+            buffer.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if fmt == 'csv' and buffer.tell():
+        # Header only: an empty table
+        yield buffer.getvalue().encode()
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands written bytes back to the caller instead of keeping them."""
+
+    def __init__(self):
+        self.pending = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = b''.join(self.pending)
+        self.pending.clear()
+        return data
+
+def _parquet_chunks(table: str, batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = TABLES[table]
+    schema = pa.schema([(name, pa.int64() if column in _INTEGER_COLUMNS else pa.string())
+                        for name, column in zip(header(table), columns)])
+    sink = _Drain()
+    # Row groups are buffered as Arrow batches, a fraction of the size of the Python rows
+    pending, pending_rows = [], 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            pending.append(pa.RecordBatch.from_arrays(
+                [pa.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)],
+                schema=schema))
+            pending_rows += len(batch)
+            if pending_rows >= PARQUET_ROW_GROUP:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema))
+                pending, pending_rows = [], 0
+                yield sink.take()
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+    yield sink.take()
@@ -1,118 +1,114 @@
-import json
-import datetime
+from datetime import datetime
+
+from storage import MONTHLY_BUDGET, JournalStorage
+
+# Pretty-printed file written by earlier versions; imported once if no journal exists yet
+LEGACY_DATA_FILE = "finance_data.json"
+
+def to_paise(text):
+    """Parse a rupee amount typed at the prompt into integer paise; raises ValueError."""
+    return int(round(float(text) * 100))
+
+def rupees(paise):
+    return paise / 100
 
 class FinanceManager:
-    def __init__(self):
-        self.data = {
-            "income": 0,
-            "expenses": {},
-            "budget": 0,
-            "investments": [],
-            "savings_goal": 0,
-            "transaction_history": []
-        }
+    def __init__(self, storage=None):
+        # Any storage.Storage works; the default journals to finance_data.log/.snapshot
+        self.storage = storage or JournalStorage("finance_data", legacy_file=LEGACY_DATA_FILE)
 
     def set_income(self):
         try:
-            income = float(input("What's your monthly income? "))
-            self.data["income"] = income
-            print(f"Great! Your monthly income is set to {income}.")
+            income = to_paise(input("What's your monthly income? "))
+            self.storage.set_income(income)
+            print(f"Great! Your monthly income is set to {rupees(income)}.")
         except ValueError:
             print("Oops! Please enter a valid number.")
 
-     def set_budget(self):
-    try:
-        budget = float(input("How much do you want to allocate as your monthly budget? "))
-        if budget > self.data["income"]:
-            print("Error: Your budget cannot exceed your monthly income.")
-        else:
-            self.data["budget"] = budget
-            print(f"Your budget of {budget} has been successfully saved.")
-    except ValueError:
-        print("Oops! Please enter a valid number.")
+    def set_budget(self):
+        try:
+            budget = to_paise(input("How much do you want to allocate as your monthly budget? "))
+            with self.storage.transaction():
+                if budget > (self.storage.latest_income() or 0):
+                    print("Error: Your budget cannot exceed your monthly income.")
+                    return
+                self.storage.set_budget(MONTHLY_BUDGET, budget)
+            print(f"Your budget of {rupees(budget)} has been successfully saved.")
+        except ValueError:
+            print("Oops! Please enter a valid number.")
 
     def set_savings_goal(self):
         try:
-            goal = float(input("What is your savings goal for this month? "))
-            self.data["savings_goal"] = goal
-            print(f"Savings goal of {goal} is now set.")
+            goal = to_paise(input("What is your savings goal for this month? "))
+            self.storage.set_savings_goal(goal)
+            print(f"Savings goal of {rupees(goal)} is now set.")
         except ValueError:
             print("Oops! Please enter a valid number.")
 
     def add_expense(self):
         category = input("Enter the category of your expense (e.g., food, rent): ").strip()
         try:
-            amount = float(input(f"How much did you spend on {category}? "))
-            if category in self.data["expenses"]:
-                self.data["expenses"][category] += amount
-            else:
-                self.data["expenses"][category] = amount
-            print(f"Expense of {amount} added to {category}.")
-
-            # Log the transaction
-            self.data["transaction_history"].append({
-                "type": "expense",
-                "category": category,
-                "amount": amount,
-                "date": str(datetime.datetime.now())
-            })
+            amount = to_paise(input(f"How much did you spend on {category}? "))
+            # The storage has made the expense durable before we confirm
+            self.storage.add_expense(amount, category, date=datetime.now())
+            print(f"Expense of {rupees(amount)} added to {category}.")
         except ValueError:
             print("Oops! Please enter a valid number.")
 
     def view_expenses(self):
         print("\nHere are your expenses so far:")
-        for category, amount in self.data["expenses"].items():
-            print(f"  - {category}: {amount}")
+        for category, amount in self.storage.category_totals("expenses").items():
+            print(f"  - {category}: {rupees(amount)}")
 
-        total_expenses = sum(self.data["expenses"].values())
-        print(f"Total Expenses: {total_expenses}")
+        total_expenses = self.storage.total("expenses")
+        print(f"Total Expenses: {rupees(total_expenses)}")
 
-        if total_expenses > self.data["budget"]:
+        budget = self.storage.budget(MONTHLY_BUDGET) or 0
+        if total_expenses > budget:
             print("Heads up! You've exceeded your budget.")
         else:
-            remaining_budget = self.data["budget"] - total_expenses
-            print(f"You still have {remaining_budget} left in your budget.")
+            print(f"You still have {rupees(budget - total_expenses)} left in your budget.")
 
     def add_investment(self):
         investment = input("What kind of investment did you make (e.g., mutual fund, stock)? ").strip()
         try:
-            amount = float(input(f"How much did you invest in {investment}? "))
-            self.data["investments"].append({"type": investment, "amount": amount, "date": str(datetime.datetime.now())})
-            print(f"Your investment of {amount} in {investment} has been recorded.")
+            amount = to_paise(input(f"How much did you invest in {investment}? "))
+            self.storage.add_investment(amount, investment, date=datetime.now())
+            print(f"Your investment of {rupees(amount)} in {investment} has been recorded.")
         except ValueError:
             print("Oops! Please enter a valid number.")
 
     def view_investments(self):
         print("\nHere are your investments:")
-        for inv in self.data["investments"]:
-            print(f"  - {inv['type']}: {inv['amount']} (Date: {inv['date']})")
+        for inv in self.storage.rows("investments"):
+            print(f"  - {inv['type']}: {rupees(inv['amount'])} (Date: {inv['date']})")
 
     def view_transaction_history(self):
         print("\nTransaction History:")
-        for transaction in self.data["transaction_history"]:
-            print(f"  {transaction['date']} - {transaction['type'].capitalize()} - {transaction['category'] if 'category' in transaction else transaction['type']}: {transaction['amount']}")
+        for transaction in self.storage.rows("expenses"):
+            print(f"  {transaction['date']} - Expense - {transaction['category']}: {rupees(transaction['amount'])}")
 
     def calculate_savings(self):
-        total_expenses = sum(self.data["expenses"].values())
-        savings = self.data["income"] - total_expenses
-        print(f"\nYour current savings amount to: {savings}")
-        if savings < self.data["savings_goal"]:
-            print(f"You're {self.data['savings_goal'] - savings} short of your savings goal.")
+        savings = (self.storage.latest_income() or 0) - self.storage.total("expenses")
+        goal = self.storage.savings_goal() or 0
+        print(f"\nYour current savings amount to: {rupees(savings)}")
+        if savings < goal:
+            print(f"You're {rupees(goal - savings)} short of your savings goal.")
         else:
             print("Fantastic! You've achieved your savings goal.")
 
     def save_data(self):
-        with open("finance_data.json", "w") as file:
-            json.dump(self.data, file, indent=4)
+        # Every change is already durable; compacting just keeps the next load short
+        if hasattr(self.storage, "compact"):
+            self.storage.compact()
+        self.storage.close()
         print("All your data has been saved securely.")
 
     def load_data(self):
-        try:
-            with open("finance_data.json", "r") as file:
-                self.data = json.load(file)
-            print("Previous data loaded successfully.")
-        except FileNotFoundError:
+        if hasattr(self.storage, "load") and not self.storage.load():
             print("No previous data found. Starting fresh.")
+            return
+        print("Previous data loaded successfully.")
 
     def run(self):
         self.load_data()
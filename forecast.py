@@ -0,0 +1,152 @@
+"""Monte Carlo forecast of whether a savings goal will be reached by its target date.
+
+Each simulated path starts from today's savings (latest income minus total
+expenses, as on the dashboard) and adds one day's net flow at a time until
+the target date. Every simulated day replays a randomly chosen day of the
+ledger's recent history (bootstrap resampling): the monthly income in effect
+that day, spread evenly over the days of a year, minus what was spent. Paths
+are advanced together in blocks of CHECKPOINT_DAYS with NumPy, so 10,000 paths
+over five years stay well under a second. The simulation is seeded, so the
+same ledger always gives the same forecast.
+
+Needs numpy, which is optional.
+"""
+import importlib.util
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from errors import ValidationError
+from reports import summary
+from validators import format_currency
+
+# Simulated paths per forecast
+PATHS = 10_000
+
+# Days of history resampled
+HISTORY_DAYS = 365
+
+# Days between the balance percentiles reported
+CHECKPOINT_DAYS = 30
+
+# Percentiles of the simulated balance reported at every checkpoint
+BANDS = (5, 25, 50, 75, 95)
+
+SEED = 20240101
+
+def available() -> bool:
+    return importlib.util.find_spec('numpy') is not None
+
+def check_forecast() -> None:
+    if not available():
+        raise ValidationError("Savings forecasts need numpy; install it to enable them")
+
+def latest_goal(db: sqlite3.Connection, goal_id: int = None):
+    """The goal with goal_id, or the most recently set one; None when there is none."""
+    if goal_id is not None:
+        return db.execute('SELECT id, amount, target_date FROM savings_goals WHERE id = ?', (goal_id,)).fetchone()
+    return db.execute('SELECT id, amount, target_date FROM savings_goals ORDER BY date DESC LIMIT 1').fetchone()
+
+def daily_history(db: sqlite3.Connection, today: date, days: int = HISTORY_DAYS):
+    """Net paise per day (income in effect minus spending) over the history window, oldest first.
+
+    The window starts no earlier than the ledger's first income or expense,
+    and days before the first income count the first income. Today, still in
+    progress, is left out unless it is the only day there is.
+    """
+    import numpy as np
+
+    incomes = db.execute('SELECT date, amount FROM income ORDER BY date').fetchall()
+    if not incomes:
+        return None
+    earliest = min(str(incomes[0][0]), db.execute('SELECT MIN(date) FROM expenses').fetchone()[0] or '9999')
+    first = max(today - timedelta(days=days), date.fromisoformat(earliest[:10]))
+    end = max(first, today - timedelta(days=1))
+    count = (end - first).days + 1
+    offsets = np.arange(count)
+
+    # Monthly income in effect at the end of each day, as a daily amount
+    changed = np.array([(date.fromisoformat(str(when)[:10]) - first).days for when, _ in incomes])
+    monthly = np.array([amount for _, amount in incomes], dtype=np.int64)
+    in_effect = monthly[np.clip(np.searchsorted(changed, offsets, side='right') - 1, 0, None)]
+    income = np.rint(in_effect * 12 / 365).astype(np.int64)
+
+    spent = np.zeros(count, dtype=np.int64)
+    for period in summary(db, 'day', first, end, today):
+        spent[(date.fromisoformat(period['period']) - first).days] = period['expenses']['total']
+    return income - spent
+
+def simulate(history, start: int, goal: int, days: int, paths: int = PATHS, seed: int = SEED) -> dict:
+    """Bootstrap paths of daily net flows from history; every amount is in paise.
+
+    Returns the share of paths ending at or above goal, the median ending
+    balance and the BANDS percentiles every CHECKPOINT_DAYS (and on the last day).
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    balance = np.full(paths, start, dtype=np.int64)
+    checkpoints, snapshots = [], []
+    elapsed = 0
+    while elapsed < days:
+        block = min(CHECKPOINT_DAYS, days - elapsed)
+        # One block for every path at once; each simulated day is a random historical day
+        balance += history[rng.integers(0, len(history), size=(paths, block))].sum(axis=1)
+        elapsed += block
+        checkpoints.append(elapsed)
+        snapshots.append(balance.copy())
+
+    bands = np.percentile(np.stack(snapshots), BANDS, axis=1) if snapshots else np.empty((len(BANDS), 0))
+    return {
+        'probability': float(np.mean(balance >= goal)),
+        'median': int(np.median(balance)),
+        'checkpoints': [{
+            'day': day,
+            'percentiles': {str(band): int(round(bands[i][j])) for i, band in enumerate(BANDS)},
+        } for j, day in enumerate(checkpoints)],
+    }
+
+def forecast_goal(db: sqlite3.Connection, goal_id: int = None, today: date = None, paths: int = PATHS):
+    """Forecast of one savings goal (the latest by default); None when there is no goal or no income."""
+    today = today or datetime.utcnow().date()
+    goal = latest_goal(db, goal_id)
+    if goal is None:
+        return None
+    history = daily_history(db, today)
+    if history is None:
+        return None
+
+    income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()[0]
+    expenses = db.execute("SELECT amount FROM totals WHERE source = 'expenses' AND category = ''").fetchone()
+    start = income - (expenses[0] if expenses else 0)
+    target = date.fromisoformat(str(goal['target_date'])[:10])
+    days = max(0, (target - today).days)
+    result = simulate(history, start, goal['amount'], days, paths, SEED + goal['id'])
+    for checkpoint in result['checkpoints']:
+        checkpoint['date'] = (today + timedelta(days=checkpoint['day'])).isoformat()
+    result.update({
+        'goal_id': goal['id'],
+        'goal': goal['amount'],
+        'target_date': target.isoformat(),
+        'start': start,
+        'days': days,
+        'paths': paths,
+        'history_days': len(history),
+    })
+    return result
+
+def forecast_json(result: dict) -> dict:
+    """JSON form of forecast_goal() output; band percentiles stay in raw paise for charting."""
+    def money(paise):
+        return {"amount": format_currency(paise), "amount_paise": paise}
+    return {
+        "goal_id": result['goal_id'],
+        "goal": money(result['goal']),
+        "target_date": result['target_date'],
+        "start": money(result['start']),
+        "median": money(result['median']),
+        "probability": round(result['probability'], 4),
+        "days": result['days'],
+        "paths": result['paths'],
+        "history_days": result['history_days'],
+        "bands_paise": result['checkpoints'],
+    }
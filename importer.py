@@ -0,0 +1,210 @@
+import csv
+import json
+import sqlite3
+import logging
+from datetime import datetime
+
+from errors import ValidationError
+from validators import validate_amount, validate_date
+from totals import allocation_total
+from cache import bump_version
+from db import begin_immediate
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson')
+
+# Rows validated and inserted per executemany() call
+BATCH_SIZE = 10000
+
+# Cap on per-row errors returned, so a bad file can't produce an unbounded report
+MAX_REPORTED_ERRORS = 1000
+
+_MIMETYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+def detect_format(requested: str = None, mimetype: str = None, filename: str = None) -> str:
+    """Pick the input format from an explicit choice, a file extension or a mimetype."""
+    if requested:
+        if requested not in FORMATS:
+            raise ValidationError(f"Unsupported format. Must be one of: {', '.join(FORMATS)}")
+        return requested
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+        if extension == 'csv':
+            return 'csv'
+    if mimetype in _MIMETYPES:
+        return _MIMETYPES[mimetype]
+    raise ValidationError("Could not tell the import format; pass format=csv or format=ndjson")
+
+def decode_lines(stream):
+    """Yield the lines of a binary stream as text; raises ValidationError naming the first line that is not UTF-8.
+
+    A byte-order mark before the first line, as spreadsheet exports often
+    write, is dropped so it does not end up in the first column's name.
+    """
+    for number, line in enumerate(stream, start=1):
+        try:
+            yield line.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            raise ValidationError(f"Line {number} is not valid UTF-8; save the file as UTF-8 and retry")
+
+def read_rows(stream, fmt: str):
+    """Yield (row_number, record) pairs from text lines; record is None for unparsable lines."""
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            yield number, record
+        return
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+def _validate(record, now: datetime, dates: dict) -> tuple:
+    """Turn one input record into an (amount, category, description, date) row.
+
+    Statements repeat the same few dates many times, so parsed dates are
+    memoized in dates for the whole import instead of re-parsed per row.
+    """
+    if record is None:
+        raise ValidationError("Malformed row")
+    amount = validate_amount(record.get('amount'))
+    category = str(record.get('category') or '').strip()
+    if not category:
+        raise ValidationError("Category cannot be empty")
+    description = str(record.get('description') or '').strip()
+    day = record.get('date')
+    if not day:
+        return amount, category, description, now
+    day = str(day).strip()[:10]
+    date = dates.get(day)
+    if date is None:
+        date = dates[day] = validate_date(day)
+    return amount, category, description, date
+
+def import_expenses(db: sqlite3.Connection, rows, dry_run: bool = False) -> dict:
+    """Validate and insert expense records in one transaction, returning a per-row report.
+
+    Rows are read and validated first, with no lock held, into a TEMP table
+    (its own file, so other writers to the ledger never wait on a slow
+    upload). Only then is the write lock taken: income, total allocations and
+    per-category budget headroom are read once and tracked as running totals,
+    so each row costs a few comparisons instead of the queries a form POST
+    makes, and the rows within the limits are copied over with one INSERT.
+    Rows that fail validation or would break a limit are skipped and
+    reported. With dry_run nothing is written.
+    """
+    report = {"imported": 0, "rejected": 0, "errors": [], "dry_run": dry_run}
+    if not _income(db):
+        raise ValidationError("Please set your income first")
+
+    def reject(errors, number, message):
+        report["rejected"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": number, "error": message})
+
+    invalid, over_limit = [], []
+    db.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS import_rows (
+            number INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            date DATETIME NOT NULL
+        )
+    ''')
+    try:
+        now = datetime.utcnow()
+        dates = {}
+        batch = []
+        for number, record in rows:
+            try:
+                batch.append((number, *_validate(record, now, dates)))
+            except ValidationError as e:
+                reject(invalid, number, str(e))
+                continue
+            if len(batch) >= BATCH_SIZE:
+                _spool(db, batch)
+        _spool(db, batch)
+        db.commit()
+
+        # Take the write lock before reading the limits, so they can't move underneath us
+        begin_immediate(db)
+        try:
+            income = _income(db)
+            if not income:
+                raise ValidationError("Please set your income first")
+            allocated = allocation_total(db)
+            budgets = {row['category']: [row['amount'], row['spent']] for row in db.execute('''
+                SELECT b.category, b.amount, COALESCE(t.amount, 0) AS spent
+                FROM budget b
+                LEFT JOIN totals t ON t.source = 'expenses' AND t.category = b.category
+            ''')}
+            skipped = []
+            for rowid, number, amount, category in db.execute(
+                    'SELECT rowid, number, amount, category FROM temp.import_rows ORDER BY rowid'):
+                if allocated + amount > income:
+                    reject(over_limit, number, "Total allocations cannot exceed your income")
+                    skipped.append((rowid,))
+                    continue
+                budget = budgets.get(category)
+                if budget and budget[1] + amount > budget[0]:
+                    reject(over_limit, number, f"Expense exceeds budget for category: {category}")
+                    skipped.append((rowid,))
+                    continue
+                allocated += amount
+                if budget:
+                    budget[1] += amount
+            db.executemany('DELETE FROM temp.import_rows WHERE rowid = ?', skipped)
+            if not dry_run:
+                report["imported"] = db.execute('''
+                    INSERT INTO expenses (amount, category, description, date)
+                    SELECT amount, category, description, date FROM temp.import_rows ORDER BY rowid
+                ''').rowcount
+            else:
+                report["imported"] = db.execute('SELECT COUNT(*) FROM temp.import_rows').fetchone()[0]
+
+            if dry_run:
+                db.rollback()
+            else:
+                if report["imported"]:
+                    bump_version(db)
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    finally:
+        db.execute('DROP TABLE IF EXISTS temp.import_rows')
+        db.commit()
+
+    # Each list holds its earliest rows, so together they hold the earliest of all
+    report["errors"] = sorted(invalid + over_limit, key=lambda error: error["row"])[:MAX_REPORTED_ERRORS]
+    report["errors_truncated"] = report["rejected"] > len(report["errors"])
+    logger.info(f"Imported {report['imported']} expenses, rejected {report['rejected']}"
+                f"{' (dry run)' if dry_run else ''}")
+    return report
+
+def _income(db: sqlite3.Connection):
+    income = db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
+    return income[0] if income else None
+
+def _spool(db: sqlite3.Connection, batch: list) -> None:
+    """Write validated rows to the TEMP table; the ledger itself stays unlocked."""
+    if batch:
+        db.executemany('''
+            INSERT INTO temp.import_rows (number, amount, category, description, date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', batch)
+        batch.clear()
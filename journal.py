@@ -0,0 +1,172 @@
+import json
+import os
+import struct
+import sys
+from array import array
+
+SNAPSHOT_FORMATS = ('json', 'binary')
+
+# First bytes of a binary snapshot; the JSON header's length, the header and the packed columns follow
+BINARY_MAGIC = b'FJSNAP1\n'
+
+# Numeric lists shorter than this stay in the JSON header
+MIN_PACKED = 16
+
+class Journal:
+    """Append-only transaction log with periodic compacted snapshots.
+
+    Every change is appended to <path>.log as one JSON line and fsynced, so a
+    write costs O(1) no matter how long the history is. compact() folds the
+    whole state into <path>.snapshot and empties the log. Entries carry a
+    sequence number and the snapshot records the last one it includes, so a
+    crash between writing the snapshot and truncating the log never replays
+    an entry twice. Snapshots are compact JSON or, with snapshot_format
+    'binary', a JSON header with the numeric columns packed as arrays.
+    """
+
+    def __init__(self, path: str = 'finance_data', snapshot_format: str = 'json',
+                 compact_every: int = 1000):
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        self.log_path = f"{path}.log"
+        self.snapshot_path = f"{path}.snapshot"
+        self.snapshot_format = snapshot_format
+        self.compact_every = compact_every
+        self.seq = 0
+        self.pending = 0
+        self._log = None
+
+    def load(self):
+        """Return (snapshot_state, entries_after_snapshot); state is None when there is no snapshot."""
+        state, self.seq = None, 0
+        if os.path.exists(self.snapshot_path):
+            snapshot = self._read_snapshot()
+            state, self.seq = snapshot['state'], snapshot['seq']
+
+        entries = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-write; everything before it is intact
+                        break
+                    if entry['seq'] > self.seq:
+                        entries.append(entry)
+                        self.seq = entry['seq']
+        self.pending = len(entries)
+        return state, entries
+
+    def append(self, entry: dict) -> None:
+        """Durably append one entry to the log."""
+        if self._log is None:
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+        self.seq += 1
+        self._log.write(json.dumps(dict(entry, seq=self.seq), separators=(',', ':')) + '\n')
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self.pending += 1
+
+    def should_compact(self) -> bool:
+        return self.pending >= self.compact_every
+
+    def compact(self, state: dict) -> None:
+        """Write state as the new snapshot and start an empty log."""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        snapshot = {'seq': self.seq, 'state': state}
+        if self.snapshot_format == 'binary':
+            with open(tmp_path, 'wb') as f:
+                f.write(_pack(snapshot))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self.close()
+        with open(self.log_path, 'w', encoding='utf-8'):
+            pass
+        self.pending = 0
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _read_snapshot(self) -> dict:
+        with open(self.snapshot_path, 'rb') as f:
+            data = f.read()
+        if data.startswith(BINARY_MAGIC):
+            return _unpack(data)
+        if data.lstrip()[:1] != b'{':
+            raise ValueError(f"{self.snapshot_path} is neither a binary ({BINARY_MAGIC.strip().decode()}) nor a JSON snapshot")
+        return json.loads(data.decode('utf-8'))
+
+def _pack(snapshot: dict) -> bytes:
+    """Binary snapshot: a JSON header in which long numeric lists are references to packed arrays."""
+    columns = []
+
+    def fold(value):
+        if isinstance(value, dict):
+            return {key: fold(item) for key, item in value.items()}
+        if isinstance(value, list):
+            typecode = _typecode(value)
+            if typecode is None:
+                return [fold(item) for item in value]
+            columns.append(array(typecode, value))
+            return {'$array': typecode, 'length': len(value)}
+        return value
+
+    header = json.dumps(fold(snapshot), separators=(',', ':')).encode('utf-8')
+    parts = [BINARY_MAGIC, struct.pack('<Q', len(header)), header]
+    for column in columns:
+        if sys.byteorder != 'little':
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b''.join(parts)
+
+def _unpack(data: bytes) -> dict:
+    offset = len(BINARY_MAGIC)
+    (header_size,) = struct.unpack_from('<Q', data, offset)
+    offset += 8
+    header = json.loads(data[offset:offset + header_size].decode('utf-8'))
+    offset += header_size
+
+    def unfold(value):
+        nonlocal offset
+        if isinstance(value, dict):
+            if '$array' in value:
+                column = array(value['$array'])
+                end = offset + value['length'] * column.itemsize
+                column.frombytes(data[offset:end])
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                offset = end
+                return column.tolist()
+            return {key: unfold(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [unfold(item) for item in value]
+        return value
+
+    # Columns were appended in the order fold() met them, which unfold() repeats
+    return unfold(header)
+
+def _typecode(values: list):
+    """Array typecode for a list of ints or of floats, None when it is not worth packing."""
+    if len(values) < MIN_PACKED:
+        return None
+    if all(type(value) is float for value in values):
+        return 'd'
+    if not all(type(value) is int for value in values):
+        return None
+    low, high = min(values), max(values)
+    # The narrowest signed type holding every value
+    for typecode in ('b', 'h', 'i', 'q'):
+        bits = array(typecode).itemsize * 8
+        if -2 ** (bits - 1) <= low and high < 2 ** (bits - 1):
+            return typecode
+    return None
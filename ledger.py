@@ -0,0 +1,165 @@
+from array import array
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+@lru_cache(maxsize=None)
+def _numpy():
+    """numpy, imported on first use so loading this module stays cheap; None when it is not installed."""
+    try:
+        import numpy
+    except ImportError:  # numpy is optional; the pure-Python paths give the same results
+        return None
+    return numpy
+
+def to_micros(date) -> int:
+    """Convert a naive datetime or its str() form to microseconds since 1970-01-01."""
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    return (date - _EPOCH) // _MICROSECOND
+
+def from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)
+
+class Ledger:
+    """Column-oriented list of transactions with a dict-compatible row view.
+
+    Each row is stored as a float amount, an int64 timestamp in microseconds
+    and small integer ids into interned label and kind tables, roughly 21
+    bytes per row instead of a dict with its own key and date strings.
+    Iterating or indexing still yields the familiar dicts, e.g.
+    {"type": "expense", "category": "food", "amount": 12.5, "date": "..."};
+    label_key names the label field ("category" or "type") and rows without
+    a kind simply omit the "type" key.
+    """
+
+    def __init__(self, label_key: str = "category", records=()):
+        self.label_key = label_key
+        self._amounts = array('d')
+        self._times = array('q')
+        self._label_ids = array('I')
+        self._kind_ids = array('B')
+        self._labels, self._label_index = [], {}
+        self._kinds, self._kind_index = [None], {None: 0}
+        for record in records:
+            self.append(record)
+
+    @staticmethod
+    def _intern(value, table: list, index: dict) -> int:
+        ident = index.get(value)
+        if ident is None:
+            ident = index[value] = len(table)
+            table.append(value)
+        return ident
+
+    def append(self, record: dict) -> None:
+        """Append one transaction given in the dict form."""
+        self._amounts.append(float(record["amount"]))
+        self._times.append(to_micros(record["date"]))
+        self._label_ids.append(self._intern(record[self.label_key], self._labels, self._label_index))
+        kind = record.get("type") if self.label_key != "type" else None
+        self._kind_ids.append(self._intern(kind, self._kinds, self._kind_index))
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("ledger index out of range")
+        row = {}
+        kind = self._kinds[self._kind_ids[i]]
+        if kind is not None:
+            row["type"] = kind
+        row[self.label_key] = self._labels[self._label_ids[i]]
+        row["amount"] = self._amounts[i]
+        row["date"] = str(from_micros(self._times[i]))
+        return row
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _mask(self, start=None, end=None):
+        """Indices (or a numpy mask) of rows with start <= date < end."""
+        lo = to_micros(start) if start is not None else None
+        hi = to_micros(end) if end is not None else None
+        np = _numpy()
+        if np is not None:
+            times = np.frombuffer(self._times, dtype=np.int64)
+            mask = np.ones(len(times), dtype=bool)
+            if lo is not None:
+                mask &= times >= lo
+            if hi is not None:
+                mask &= times < hi
+            return mask
+        return [i for i, t in enumerate(self._times)
+                if (lo is None or t >= lo) and (hi is None or t < hi)]
+
+    def total(self, start=None, end=None) -> float:
+        """Sum of amounts, optionally limited to start <= date < end."""
+        np = _numpy()
+        if start is None and end is None:
+            if np is not None:
+                return float(np.frombuffer(self._amounts, dtype=np.float64).sum()) if len(self) else 0.0
+            return sum(self._amounts)
+        mask = self._mask(start, end)
+        if np is not None:
+            return float(np.frombuffer(self._amounts, dtype=np.float64)[mask].sum())
+        return sum(self._amounts[i] for i in mask)
+
+    def totals_by_label(self, start=None, end=None) -> dict:
+        """Sum of amounts per category (or type), optionally limited to a date range."""
+        if not len(self):
+            return {}
+        np = _numpy()
+        if np is not None:
+            amounts = np.frombuffer(self._amounts, dtype=np.float64)
+            ids = np.frombuffer(self._label_ids, dtype=np.uint32)
+            if start is not None or end is not None:
+                mask = self._mask(start, end)
+                amounts, ids = amounts[mask], ids[mask]
+            sums = np.bincount(ids, weights=amounts, minlength=len(self._labels))
+            counts = np.bincount(ids, minlength=len(self._labels))
+            return {label: float(sums[i]) for i, label in enumerate(self._labels) if counts[i]}
+        rows = range(len(self)) if start is None and end is None else self._mask(start, end)
+        totals = {}
+        for i in rows:
+            label = self._labels[self._label_ids[i]]
+            totals[label] = totals.get(label, 0) + self._amounts[i]
+        return totals
+
+    def to_columns(self) -> dict:
+        """Compact, JSON-serializable column form used by snapshots."""
+        return {
+            "label_key": self.label_key,
+            "labels": list(self._labels),
+            "kinds": list(self._kinds),
+            "amount": self._amounts.tolist(),
+            "time": self._times.tolist(),
+            "label_id": self._label_ids.tolist(),
+            "kind_id": self._kind_ids.tolist(),
+        }
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "Ledger":
+        ledger = cls(columns["label_key"])
+        ledger._labels = list(columns["labels"])
+        ledger._label_index = {label: i for i, label in enumerate(ledger._labels)}
+        ledger._kinds = list(columns["kinds"])
+        ledger._kind_index = {kind: i for i, kind in enumerate(ledger._kinds)}
+        ledger._amounts = array('d', columns["amount"])
+        ledger._times = array('q', columns["time"])
+        ledger._label_ids = array('I', columns["label_id"])
+        ledger._kind_ids = array('B', columns["kind_id"])
+        return ledger
+
+    @classmethod
+    def load(cls, value, label_key: str) -> "Ledger":
+        """Build a ledger from snapshot columns or a legacy list of dicts."""
+        if isinstance(value, dict):
+            return cls.from_columns(value)
+        return cls(label_key, value)
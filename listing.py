@@ -0,0 +1,124 @@
+import base64
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+from validators import format_currency
+
+# Listable tables: the column filtered by ?category= and the columns returned
+LISTINGS = {
+    'expenses': ('category', 'id, amount, category, description, date'),
+    'investments': ('type', 'id, amount, type, date'),
+}
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 500
+
+def encode_token(values: list) -> str:
+    """Pack JSON-serializable sort key values into an opaque URL-safe cursor."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_token(token: str):
+    """Unpack a cursor produced by encode_token(); raises ValueError when it is not one."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def encode_cursor(row) -> str:
+    """Build the opaque cursor that resumes a listing after row."""
+    return encode_token([row['date'], row['id']])
+
+def decode_cursor(token: str) -> tuple:
+    """Decode a cursor produced by encode_cursor() into (date, id)."""
+    try:
+        date, row_id = decode_token(token)
+        if not isinstance(date, str) or not isinstance(row_id, int):
+            raise TypeError
+        return date, row_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def parse_limit(value, default: int = DEFAULT_LIMIT) -> int:
+    """Parse a page size, clamped to MAX_LIMIT."""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("Invalid limit")
+    if limit <= 0:
+        raise ValueError("Limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+def build_query(table: str, category: str = None, start: str = None, end: str = None,
+                cursor: str = None) -> tuple:
+    """Return (sql, params) listing table newest first, filtered and resumed after cursor.
+
+    start and end are inclusive YYYY-MM-DD dates. Rows are ordered by (date, id)
+    so the idx_*_date indexes serve both the sort and the keyset seek.
+    """
+    column, columns = LISTINGS[table]
+    clauses, params = [], []
+    if category:
+        clauses.append(f'{column} = ?')
+        params.append(category)
+    if start:
+        clauses.append('date >= ?')
+        params.append(_parse_day(start).strftime('%Y-%m-%d'))
+    if end:
+        clauses.append('date < ?')
+        params.append((_parse_day(end) + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if cursor:
+        clauses.append('(date, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return f'SELECT {columns} FROM {table} {where} ORDER BY date DESC, id DESC', params
+
+def fetch_page(db: sqlite3.Connection, table: str, limit: int, **filters) -> tuple:
+    """Return (rows, next_cursor) for one page; next_cursor is None on the last page."""
+    sql, params = build_query(table, **filters)
+    rows = db.execute(f'{sql} LIMIT ?', params + [limit + 1]).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+def iter_rows(db: sqlite3.Connection, table: str, **filters):
+    """Yield every matching row, reading the cursor in fixed-size chunks."""
+    sql, params = build_query(table, **filters)
+    cursor = db.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+        if not rows:
+            break
+        yield from rows
+
+def serialize_expense(expense) -> dict:
+    """JSON form of an expense row, with the raw paise next to the formatted amount."""
+    return {
+        "id": expense['id'],
+        "amount": format_currency(expense['amount']),
+        "amount_paise": expense['amount'],
+        "category": expense['category'],
+        "description": expense['description'],
+        "date": expense['date']
+    }
+
+def serialize_investment(investment) -> dict:
+    """JSON form of an investment row, with the raw paise next to the formatted amount."""
+    return {
+        "id": investment['id'],
+        "amount": format_currency(investment['amount']),
+        "amount_paise": investment['amount'],
+        "type": investment['type'],
+        "date": investment['date']
+    }
+
+def _parse_day(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
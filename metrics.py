@@ -0,0 +1,195 @@
+"""In-process request and query instrumentation, rendered in the Prometheus text format.
+
+Every connection opened by db.connect() is an InstrumentedConnection, which
+times each execute()/executemany() and attributes it to the RequestStats the
+web tier attaches for the duration of a request. Statements slower than
+SLOW_QUERY_SECONDS are logged with their EXPLAIN QUERY PLAN. Figures are per
+process; with several workers, scrape each one.
+"""
+import os
+import sqlite3
+import threading
+import time
+import logging
+from bisect import bisect_left
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Statements at least this slow are logged with their query plan
+SLOW_QUERY_SECONDS = float(os.environ.get('FINANCE_SLOW_QUERY_MS', 100)) / 1000
+
+# Slow statements kept for /metrics/slow-queries
+SLOW_QUERY_LOG_SIZE = 100
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+# Statements EXPLAIN QUERY PLAN says something useful about
+_PLANNED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+class Histogram:
+    """Fixed-bucket histogram; counts are per bucket and made cumulative when rendered."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestStats:
+    """Queries issued on behalf of one request."""
+    __slots__ = ('route', 'queries', 'query_seconds')
+
+    def __init__(self, route: str):
+        self.route = route
+        self.queries = 0
+        self.query_seconds = 0.0
+
+class Registry:
+    """Process-wide metric store."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = {}
+        self.request_queries = {}
+        self.query_latency = {}
+        self.slow_queries = {}
+        self.recent_slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def observe_request(self, route: str, method: str, status: int, seconds: float,
+                        stats: RequestStats) -> None:
+        with self._lock:
+            key = (route, method, str(status))
+            histogram = self.request_latency.get(key)
+            if histogram is None:
+                histogram = self.request_latency[key] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            histogram = self.request_queries.get(route)
+            if histogram is None:
+                histogram = self.request_queries[route] = Histogram(QUERY_COUNT_BUCKETS)
+            histogram.observe(stats.queries)
+
+    def observe_query(self, route: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.query_latency.get(route)
+            if histogram is None:
+                histogram = self.query_latency[route] = Histogram(QUERY_BUCKETS)
+            histogram.observe(seconds)
+
+    def record_slow(self, route: str, entry: dict) -> None:
+        with self._lock:
+            self.slow_queries[route] = self.slow_queries.get(route, 0) + 1
+            self.recent_slow.append(entry)
+
+    def slow_log(self) -> list:
+        with self._lock:
+            return list(reversed(self.recent_slow))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            _render_histograms(lines, 'finance_request_duration_seconds',
+                               'Request latency by route, method and status.',
+                               ('route', 'method', 'status'), self.request_latency)
+            _render_histograms(lines, 'finance_request_queries',
+                               'SQL statements issued per request, by route.',
+                               ('route',), {(route,): h for route, h in self.request_queries.items()})
+            _render_histograms(lines, 'finance_query_duration_seconds',
+                               'SQL statement latency by the route that issued it (empty outside requests).',
+                               ('route',), {(route,): h for route, h in self.query_latency.items()})
+            lines.append('# HELP finance_slow_queries_total SQL statements slower than the slow-query threshold.')
+            lines.append('# TYPE finance_slow_queries_total counter')
+            for route, count in sorted(self.slow_queries.items()):
+                lines.append(f'finance_slow_queries_total{_labels(("route",), (route,))} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        with self._lock:
+            self.request_latency.clear()
+            self.request_queries.clear()
+            self.query_latency.clear()
+            self.slow_queries.clear()
+            self.recent_slow.clear()
+
+REGISTRY = Registry()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that times every statement; pass as factory= to sqlite3.connect()."""
+
+    # Set by the web tier while a request owns this (pooled) connection
+    stats = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self._observe(sql, parameters, time.perf_counter() - started)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        self._observe(sql, None, time.perf_counter() - started)
+        return cursor
+
+    def _observe(self, sql: str, parameters, seconds: float) -> None:
+        stats = self.stats
+        route = stats.route if stats is not None else ''
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += seconds
+        REGISTRY.observe_query(route, seconds)
+        if seconds >= SLOW_QUERY_SECONDS:
+            self._log_slow(route, sql, parameters, seconds)
+
+    def _log_slow(self, route: str, sql: str, parameters, seconds: float) -> None:
+        statement = ' '.join(sql.split())
+        plan = []
+        # executemany() parameters are already consumed, so only single statements get a plan
+        if parameters is not None and statement.upper().startswith(_PLANNED):
+            try:
+                plan = [row[3] for row in super().execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+            except sqlite3.Error as e:
+                plan = [f'unavailable: {e}']
+        REGISTRY.record_slow(route, {
+            'route': route,
+            'seconds': round(seconds, 6),
+            'sql': statement,
+            'plan': plan,
+            'at': time.time(),
+        })
+        logger.warning(f"Slow query ({seconds * 1000:.1f} ms) in {route or 'background'}: {statement}"
+                       + ''.join(f"\n    {step}" for step in plan))
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _render_histograms(lines: list, name: str, help_text: str, label_names: tuple, histograms: dict) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for values in sorted(histograms):
+        histogram = histograms[values]
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            labels = _labels(label_names, values, f'le="{bound}"')
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _labels(label_names, values, 'le="+Inf"')
+        lines.append(f'{name}_bucket{labels} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(label_names, values)} {histogram.sum}')
+        lines.append(f'{name}_count{_labels(label_names, values)} {histogram.count}')
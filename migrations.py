@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import logging
+
+from totals import TOTALS_SCHEMA, write_totals
+from reports import REPORTS_SCHEMA
+from archive import ARCHIVE_SCHEMA
+from recurring import RECURRING_SCHEMA
+from search import SEARCH_SCHEMA, write_index
+from events import EVENTS_SCHEMA
+from db import begin_immediate
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'schema.sql'
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def read_script(name: str) -> str:
+    """Read a SQL script shipped next to this module."""
+    with open(os.path.join(SCHEMA_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def run_script(db: sqlite3.Connection, script: str) -> None:
+    """Execute a multi-statement script inside the caller's transaction.
+
+    Unlike executescript() this never issues an implicit COMMIT, so a failed
+    migration rolls back as a whole.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            db.execute(statement)
+            statement = ''
+    if statement.strip() and not statement.strip().startswith('--'):
+        db.execute(statement)
+
+def _add_totals(db: sqlite3.Connection) -> None:
+    """Version 1: running totals table and triggers."""
+    run_script(db, read_script(TOTALS_SCHEMA))
+    write_totals(db)
+
+_PAISE_TABLES = {
+    'income': '''
+        CREATE TABLE income_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount INTEGER NOT NULL,
+            date DATETIME NOT NULL
+        )''',
+    'expenses': '''
+        CREATE TABLE expenses_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT,
+            date DATETIME NOT NULL
+        )''',
+    'budget': '''
+        CREATE TABLE budget_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT UNIQUE NOT NULL,
+            amount INTEGER NOT NULL,
+            date DATETIME NOT NULL
+        )''',
+    'investments': '''
+        CREATE TABLE investments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            date DATETIME NOT NULL
+        )''',
+    'savings_goals': '''
+        CREATE TABLE savings_goals_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount INTEGER NOT NULL,
+            target_date DATE NOT NULL,
+            date DATETIME NOT NULL
+        )''',
+}
+
+def _amounts_to_paise(db: sqlite3.Connection) -> None:
+    """Version 2: rebuild the ledger tables with INTEGER amounts in paise."""
+    for table, create in _PAISE_TABLES.items():
+        columns = [row[1] for row in db.execute(f'PRAGMA table_info({table})')]
+        selected = ', '.join('CAST(ROUND(amount * 100) AS INTEGER)' if c == 'amount' else c
+                             for c in columns)
+        db.execute(create)
+        db.execute(f'INSERT INTO {table}_new ({", ".join(columns)}) SELECT {selected} FROM {table}')
+        db.execute(f'DROP TABLE {table}')
+        db.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    # Dropping the old tables dropped their triggers as well
+    run_script(db, read_script(TOTALS_SCHEMA))
+    write_totals(db)
+
+def _add_indexes(db: sqlite3.Connection) -> None:
+    """Version 3: covering indexes for the category and date query paths."""
+    for line in read_script(SCHEMA).splitlines():
+        if line.startswith('CREATE INDEX'):
+            db.execute(line)
+
+def _add_rollups(db: sqlite3.Connection) -> None:
+    """Version 4: period rollups for reports."""
+    run_script(db, read_script(REPORTS_SCHEMA))
+
+def _add_data_version(db: sqlite3.Connection) -> None:
+    """Version 5: data version counter for response caching."""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            modified_at REAL NOT NULL
+        )''')
+    db.execute("INSERT OR IGNORE INTO data_version (id, version, modified_at) VALUES (1, 0, strftime('%s', 'now'))")
+
+def _add_archive(db: sqlite3.Connection) -> None:
+    """Version 6: archive chunks and archived-period rollups."""
+    run_script(db, read_script(ARCHIVE_SCHEMA))
+
+def _add_recurring(db: sqlite3.Connection) -> None:
+    """Version 7: recurring transaction rules."""
+    run_script(db, read_script(RECURRING_SCHEMA))
+
+def _add_search(db: sqlite3.Connection) -> None:
+    """Version 8: full-text search index over expenses."""
+    run_script(db, read_script(SEARCH_SCHEMA))
+    write_index(db)
+
+def _add_events(db: sqlite3.Connection) -> None:
+    """Version 9: budget alert thresholds and triggers for the live event stream."""
+    run_script(db, read_script(EVENTS_SCHEMA))
+
+# Ordered (version, step) pairs; a database at user_version N runs every step above N
+MIGRATIONS = [
+    (1, _add_totals),
+    (2, _amounts_to_paise),
+    (3, _add_indexes),
+    (4, _add_rollups),
+    (5, _add_data_version),
+    (6, _add_archive),
+    (7, _add_recurring),
+    (8, _add_search),
+    (9, _add_events),
+]
+
+# Scripts that together create the current schema on a new database
+SCHEMA_SCRIPTS = (SCHEMA, TOTALS_SCHEMA, REPORTS_SCHEMA, ARCHIVE_SCHEMA, RECURRING_SCHEMA, SEARCH_SCHEMA,
+                  EVENTS_SCHEMA)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(db: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database header."""
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(db: sqlite3.Connection) -> int:
+    """Create a new database or upgrade an existing one in place; returns the final version."""
+    if db.in_transaction:
+        db.commit()
+    has_tables = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses'").fetchone()
+    if not has_tables:
+        # auto_vacuum can only change while the file has no tables; VACUUM applies it
+        db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.execute('VACUUM')
+        begin_immediate(db)
+        try:
+            # Another process may have created it while we waited for the lock
+            if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses'").fetchone():
+                db.rollback()
+                return migrate(db)
+            for script in SCHEMA_SCRIPTS:
+                run_script(db, read_script(script))
+            db.execute(f'PRAGMA user_version = {LATEST_VERSION}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        logger.info(f"Created database schema at version {LATEST_VERSION}")
+        return LATEST_VERSION
+
+    version = schema_version(db)
+    for target, step in MIGRATIONS:
+        if target <= version:
+            continue
+        begin_immediate(db)
+        try:
+            # Another connection may have applied this step while we waited for the lock
+            version = schema_version(db)
+            if target <= version:
+                db.rollback()
+                continue
+            step(db)
+            db.execute(f'PRAGMA user_version = {target}')
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        logger.info(f"Migrated database to version {target}: {step.__doc__.split(':', 1)[1].strip()}")
+        version = target
+    return version
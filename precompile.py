@@ -0,0 +1,71 @@
+"""Compile the Jinja templates to Python modules ahead of time.
+
+Without this every worker parses and compiles each template on its first
+render. Run it at build or deploy time (serve.py does it before starting
+workers):
+
+    flask --app app compile-templates
+
+create_app() loads the compiled modules only while the manifest written
+alongside them matches the templates' modification times, so an edited
+template is never served from a stale module.
+"""
+import json
+import logging
+import os
+
+from jinja2 import Environment, ModuleLoader
+
+logger = logging.getLogger(__name__)
+
+# Output directory, relative to the app root
+COMPILED_TEMPLATES = 'compiled_templates'
+
+# Template source modification times at compile time
+MANIFEST = 'manifest.json'
+
+TEMPLATES = (
+    'base.html',
+    'index.html',
+    'error.html',
+    'dashboard_totals.html',
+    'dashboard_recent.html',
+    'dashboard_budgets.html',
+    'dashboard_forecast.html',
+    'add_expense.html',
+    'add_investment.html',
+    'set_budget.html',
+    'set_income.html',
+    'set_savings_goal.html',
+)
+
+def compile_templates(env: Environment, source_dir: str, target_dir: str) -> list:
+    """Compile TEMPLATES from source_dir into target_dir using env's settings; returns their names."""
+    os.makedirs(target_dir, exist_ok=True)
+    manifest = {}
+    for name in TEMPLATES:
+        path = os.path.join(source_dir, name)
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        # raw, defer_init: the module form ModuleLoader imports
+        code = env.compile(source, name, path, True, True)
+        with open(os.path.join(target_dir, ModuleLoader.get_module_filename(name)), 'w', encoding='utf-8') as f:
+            f.write(code)
+        manifest[name] = os.stat(path).st_mtime_ns
+    # Written last, so an interrupted run leaves no manifest claiming fresh modules
+    with open(os.path.join(target_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return list(TEMPLATES)
+
+def compiled_loader(target_dir: str, source_dir: str):
+    """A ModuleLoader over target_dir, or None when nothing is compiled or any template changed since."""
+    try:
+        with open(os.path.join(target_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        for name in TEMPLATES:
+            if os.stat(os.path.join(source_dir, name)).st_mtime_ns != manifest.get(name):
+                logger.info(f"Compiled templates are stale ({name} changed); compiling on first render")
+                return None
+    except (OSError, ValueError):
+        return None
+    return ModuleLoader(target_dir)
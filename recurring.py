@@ -0,0 +1,250 @@
+"""Recurring expenses, investments and income, inserted as their occurrences come due.
+
+Rules live in the recurring_rules table (recurring.sql). materialize_due()
+inserts every occurrence up to today in transactions of up to BATCH_SIZE
+rows, so a ledger that has not been looked at for months catches up in a
+few executemany() calls. Like import_expenses(), each transaction reads
+income, total allocations and budget headroom once and checks the generated
+rows against running totals in date order. A rule whose next occurrence
+would break a limit is paused with the reason in last_error instead of
+skipping it; resume_rule() retries from that occurrence.
+"""
+import calendar
+import logging
+import sqlite3
+from datetime import date, datetime, time
+
+from cache import bump_version
+from db import write_transaction
+from errors import ValidationError
+from totals import allocation_total
+from validators import format_currency
+
+logger = logging.getLogger(__name__)
+
+RECURRING_SCHEMA = 'recurring.sql'
+
+KINDS = ('expense', 'investment', 'income')
+
+# Days per step for the day-based frequencies; monthly rules step in calendar months
+FREQUENCIES = {'daily': 1, 'weekly': 7, 'monthly': None, 'custom': 1}
+
+# Occurrences inserted per transaction
+BATCH_SIZE = 5000
+
+# Most periods between occurrences (about 83 years of monthly steps)
+MAX_EVERY = 1000
+
+# last_error of a rule whose schedule runs past what datetime.date can represent
+OUT_OF_RANGE = "The rule's next occurrence is past the last supported date"
+
+def occurrence(start: date, frequency: str, every: int, k: int) -> date:
+    """Date of occurrence k (from 0) of a rule."""
+    if frequency == 'monthly':
+        month = start.month - 1 + k * every
+        year, month = start.year + month // 12, month % 12 + 1
+        return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+    return date.fromordinal(start.toordinal() + k * every * FREQUENCIES[frequency])
+
+def occurrences_through(start: date, frequency: str, every: int, through: date) -> int:
+    """How many occurrences of a rule fall on or before through, without listing them."""
+    if frequency == 'monthly':
+        count = ((through.year - start.year) * 12 + through.month - start.month) // every
+        if count >= 0 and occurrence(start, frequency, every, count) > through:
+            count -= 1
+        return max(count + 1, 0)
+    days = (through - start).days
+    return days // (every * FREQUENCIES[frequency]) + 1 if days >= 0 else 0
+
+def _schedule(rule) -> tuple:
+    start = date.fromisoformat(rule['start_date'])
+    end = date.fromisoformat(rule['end_date']) if rule['end_date'] else None
+    return start, end, rule['frequency'], rule['every']
+
+def _next_date(rule, materialized: int):
+    """The first occurrence after materialized ones, or None once the rule has ended."""
+    start, end, frequency, every = _schedule(rule)
+    if end is not None and materialized >= occurrences_through(start, frequency, every, end):
+        return None
+    return occurrence(start, frequency, every, materialized).isoformat()
+
+def add_rule(db: sqlite3.Connection, kind: str, amount: int, frequency: str, start: date,
+             category: str = '', description: str = '', every: int = 1, end: date = None) -> int:
+    """Store a new rule (amount in paise); its occurrences are inserted by materialize_due()."""
+    if kind not in KINDS:
+        raise ValidationError(f"Invalid kind. Must be one of: {', '.join(KINDS)}")
+    if frequency not in FREQUENCIES:
+        raise ValidationError(f"Invalid frequency. Must be one of: {', '.join(FREQUENCIES)}")
+    if every < 1:
+        raise ValidationError("A rule must repeat at least every 1 period")
+    if every > MAX_EVERY:
+        raise ValidationError(f"A rule can repeat at most every {MAX_EVERY} periods")
+    if kind != 'income' and not category:
+        raise ValidationError("Category cannot be empty" if kind == 'expense' else "Investment type cannot be empty")
+    if end is not None and end < start:
+        raise ValidationError("End date must not be before start date")
+    with write_transaction(db):
+        rule_id = db.execute('''
+            INSERT INTO recurring_rules
+                (kind, amount, category, description, frequency, every, start_date, end_date, next_date, created)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, amount, category if kind != 'income' else '', description, frequency, every,
+              start.isoformat(), end.isoformat() if end else None, start.isoformat(),
+              datetime.utcnow())).lastrowid
+        bump_version(db)
+    return rule_id
+
+def list_rules(db: sqlite3.Connection) -> list:
+    return [dict(row) for row in db.execute('''
+        SELECT id, kind, amount, category, description, frequency, every, start_date, end_date,
+               materialized, next_date, active, last_error
+        FROM recurring_rules
+        ORDER BY id
+    ''')]
+
+def serialize_rule(rule) -> dict:
+    """JSON form of a rule, with the raw paise next to the formatted amount."""
+    return {
+        "id": rule['id'],
+        "kind": rule['kind'],
+        "amount": format_currency(rule['amount']),
+        "amount_paise": rule['amount'],
+        "category": rule['category'],
+        "description": rule['description'],
+        "frequency": rule['frequency'],
+        "every": rule['every'],
+        "start_date": rule['start_date'],
+        "end_date": rule['end_date'],
+        "materialized": rule['materialized'],
+        "next_date": rule['next_date'],
+        "active": bool(rule['active']),
+        "last_error": rule['last_error']
+    }
+
+def delete_rule(db: sqlite3.Connection, rule_id: int) -> bool:
+    """Delete a rule; what it already inserted stays. Returns False if there was no such rule."""
+    with write_transaction(db):
+        deleted = db.execute('DELETE FROM recurring_rules WHERE id = ?', (rule_id,)).rowcount
+        if deleted:
+            bump_version(db)
+    return bool(deleted)
+
+def resume_rule(db: sqlite3.Connection, rule_id: int) -> bool:
+    """Reactivate a paused rule; its pending occurrences are retried on the next materialize_due()."""
+    with write_transaction(db):
+        resumed = db.execute('UPDATE recurring_rules SET active = 1, last_error = NULL WHERE id = ?',
+                             (rule_id,)).rowcount
+        if resumed:
+            bump_version(db)
+    return bool(resumed)
+
+def materialize_due(db: sqlite3.Connection, today: date = None, batch_size: int = BATCH_SIZE) -> dict:
+    """Insert every occurrence due by today, batch_size rows per transaction; returns a report."""
+    today = today or datetime.utcnow().date()
+    report = {"materialized": 0, "paused": [], "batches": 0}
+    # Checked without the write lock first: most calls find nothing due
+    if not db.execute('SELECT 1 FROM recurring_rules WHERE active = 1 AND next_date <= ? LIMIT 1',
+                      (today.isoformat(),)).fetchone():
+        return report
+
+    more = True
+    while more:
+        with write_transaction(db):
+            inserted, paused, more = _materialize_batch(db, today, batch_size)
+            if inserted or paused:
+                bump_version(db)
+        report["materialized"] += inserted
+        report["paused"].extend(paused)
+        report["batches"] += 1
+    logger.info(f"Materialized {report['materialized']} recurring transactions in {report['batches']} batches"
+                + (f"; paused rules {report['paused']}" if report['paused'] else ''))
+    return report
+
+def _materialize_batch(db: sqlite3.Connection, today: date, batch_size: int) -> tuple:
+    """Insert up to batch_size due occurrences; returns (inserted, paused rule ids, more due)."""
+    rules = db.execute('''
+        SELECT * FROM recurring_rules WHERE active = 1 AND next_date <= ? ORDER BY next_date, id
+    ''', (today.isoformat(),)).fetchall()
+    pending, more, errors = [], False, {}
+    for rule in rules:
+        start, end, frequency, every = _schedule(rule)
+        try:
+            due = occurrences_through(start, frequency, every, min(today, end) if end else today)
+            count = min(due - rule['materialized'], batch_size - len(pending))
+            dates = [occurrence(start, frequency, every, k)
+                     for k in range(rule['materialized'], rule['materialized'] + count)]
+        except (OverflowError, ValueError):
+            # Paused on its own; one broken schedule must not hold up the ledger's other rules
+            errors[rule['id']] = OUT_OF_RANGE
+            continue
+        pending.extend((day, rule['id'], k) for k, day in enumerate(dates, start=rule['materialized']))
+        if len(pending) >= batch_size:
+            more = True
+            break
+    if not pending and not errors:
+        return 0, [], False
+
+    # Limits are read once per batch and then tracked as running totals
+    latest = db.execute('SELECT amount, date FROM income ORDER BY date DESC LIMIT 1').fetchone()
+    income, income_date = (latest[0], str(latest[1])) if latest else (None, '')
+    allocated = allocation_total(db)
+    budgets = {row['category']: [row['amount'], row['spent']] for row in db.execute('''
+        SELECT b.category, b.amount, COALESCE(t.amount, 0) AS spent
+        FROM budget b
+        LEFT JOIN totals t ON t.source = 'expenses' AND t.category = b.category
+    ''')}
+
+    by_id = {rule['id']: rule for rule in rules}
+    rows = {kind: [] for kind in KINDS}
+    accepted = dict.fromkeys(by_id, 0)
+    # Date order, so an income that starts mid-batch only covers what comes after it
+    for day, rule_id, k in sorted(pending):
+        if rule_id in errors:
+            continue
+        rule = by_id[rule_id]
+        amount, category, when = rule['amount'], rule['category'], datetime.combine(day, time())
+        if rule['kind'] == 'income':
+            if amount < allocated:
+                errors[rule_id] = "New income cannot be less than current allocations"
+                continue
+            # An income set by hand later than this occurrence stays the latest
+            if str(when) >= income_date:
+                income, income_date = amount, str(when)
+            rows['income'].append((amount, when))
+        else:
+            budget = budgets.get(category) if rule['kind'] == 'expense' else None
+            if income is None:
+                errors[rule_id] = "Please set your income first"
+                continue
+            if allocated + amount > income:
+                errors[rule_id] = "Total allocations cannot exceed your income"
+                continue
+            if budget and budget[1] + amount > budget[0]:
+                errors[rule_id] = f"Expense exceeds budget for category: {category}"
+                continue
+            allocated += amount
+            if budget:
+                budget[1] += amount
+            if rule['kind'] == 'expense':
+                rows['expense'].append((amount, category, rule['description'], when))
+            else:
+                rows['investment'].append((amount, category, when))
+        accepted[rule_id] += 1
+
+    db.executemany('INSERT INTO income (amount, date) VALUES (?, ?)', rows['income'])
+    db.executemany('INSERT INTO expenses (amount, category, description, date) VALUES (?, ?, ?, ?)',
+                   rows['expense'])
+    db.executemany('INSERT INTO investments (amount, type, date) VALUES (?, ?, ?)', rows['investment'])
+    updates = []
+    for rule_id, rule in by_id.items():
+        if accepted[rule_id] or rule_id in errors:
+            materialized = rule['materialized'] + accepted[rule_id]
+            try:
+                next_date = _next_date(rule, materialized)
+            except (OverflowError, ValueError):
+                next_date, errors[rule_id] = None, OUT_OF_RANGE
+            updates.append((materialized, next_date, 0 if rule_id in errors else 1, errors.get(rule_id), rule_id))
+    db.executemany('''
+        UPDATE recurring_rules SET materialized = ?, next_date = ?, active = ?, last_error = ? WHERE id = ?
+    ''', updates)
+    return sum(accepted.values()), sorted(errors), more
@@ -0,0 +1,23 @@
+-- Recurring expenses, investments and income. Occurrence k of a rule falls k * every
+-- days, weeks or months after start_date (monthly rules keep start_date's day of the
+-- month, clamped to shorter months; custom rules repeat every N days). recurring.py
+-- inserts the occurrences that have come due; materialized counts them and next_date
+-- is the first one not inserted yet, NULL once the rule has ended.
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL CHECK (kind IN ('expense', 'investment', 'income')),
+    amount INTEGER NOT NULL,
+    category TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    frequency TEXT NOT NULL CHECK (frequency IN ('daily', 'weekly', 'monthly', 'custom')),
+    every INTEGER NOT NULL DEFAULT 1 CHECK (every > 0),
+    start_date DATE NOT NULL,
+    end_date DATE,
+    materialized INTEGER NOT NULL DEFAULT 0,
+    next_date DATE,
+    active INTEGER NOT NULL DEFAULT 1,
+    last_error TEXT,
+    created DATETIME NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_recurring_rules_due ON recurring_rules (next_date) WHERE active = 1;
@@ -0,0 +1,189 @@
+import sqlite3
+import logging
+from datetime import date, datetime, timedelta
+
+from db import begin_immediate
+
+logger = logging.getLogger(__name__)
+
+REPORTS_SCHEMA = 'reports.sql'
+
+# SQL expression giving the first day of the period containing `date`
+GRAINS = {
+    'day': "date(date)",
+    'week': "date(date, '-6 days', 'weekday 1')",
+    'month': "date(date, 'start of month')",
+}
+
+# Sources rolled up and the column each one is broken down by
+SOURCES = {
+    'expenses': 'category',
+    'investments': 'type',
+}
+
+# Periods returned when no start date is given
+DEFAULT_PERIODS = 12
+
+def bucket_start(day: date, grain: str) -> date:
+    """First day of the period containing day; mirrors the SQL in GRAINS."""
+    if grain == 'day':
+        return day
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def shift(bucket: date, grain: str, periods: int) -> date:
+    """Move a bucket start by a (possibly negative) number of periods."""
+    if grain == 'day':
+        return bucket + timedelta(days=periods)
+    if grain == 'week':
+        return bucket + timedelta(weeks=periods)
+    month = bucket.year * 12 + bucket.month - 1 + periods
+    return date(month // 12, month % 12 + 1, 1)
+
+def refresh(db: sqlite3.Connection, grain: str, source: str, today: date = None) -> bool:
+    """Materialize every closed bucket not yet in the rollups table; returns True if it did work.
+
+    Only buckets from the watermark up to the current (open) bucket are
+    recomputed, with one grouped scan over that date range.
+    """
+    open_bucket = bucket_start(today or datetime.utcnow().date(), grain).isoformat()
+    row = db.execute('SELECT closed_through FROM rollup_watermarks WHERE grain = ? AND source = ?',
+                     (grain, source)).fetchone()
+    if row and row[0] >= open_bucket:
+        return False
+
+    begin_immediate(db)
+    try:
+        # Re-read under the write lock in case another worker got here first
+        row = db.execute('SELECT closed_through FROM rollup_watermarks WHERE grain = ? AND source = ?',
+                         (grain, source)).fetchone()
+        if row:
+            watermark = row[0]
+        else:
+            # Archived periods count too; they may be all that is left of the oldest ones
+            earliest = db.execute(f'''
+                SELECT MIN(first) FROM (
+                    SELECT MIN(date) AS first FROM {source}
+                    UNION ALL
+                    SELECT MIN(bucket) FROM archived_rollups WHERE grain = ? AND source = ?
+                )
+            ''', (grain, source)).fetchone()[0]
+            watermark = earliest[:10] if earliest else open_bucket
+        if watermark >= open_bucket:
+            start = open_bucket
+        else:
+            start = bucket_start(date.fromisoformat(watermark), grain).isoformat()
+            column, bucket = SOURCES[source], GRAINS[grain]
+            db.execute('DELETE FROM rollups WHERE grain = ? AND source = ? AND bucket >= ?',
+                       (grain, source, start))
+            # Live rows plus whatever archive.py has moved out of these periods
+            db.execute(f'''
+                INSERT INTO rollups (grain, source, bucket, category, amount, entries)
+                SELECT ?, ?, bucket, category, SUM(amount), SUM(entries)
+                FROM (
+                    SELECT {bucket} AS bucket, {column} AS category, SUM(amount) AS amount, COUNT(*) AS entries
+                    FROM {source}
+                    WHERE date >= ? AND date < ?
+                    GROUP BY bucket, category
+                    UNION ALL
+                    SELECT bucket, category, amount, entries
+                    FROM archived_rollups
+                    WHERE grain = ? AND source = ? AND bucket >= ? AND bucket < ?
+                )
+                GROUP BY bucket, category
+            ''', (grain, source, start, open_bucket, grain, source, start, open_bucket))
+        db.execute('''
+            INSERT INTO rollup_watermarks (grain, source, closed_through) VALUES (?, ?, ?)
+            ON CONFLICT (grain, source) DO UPDATE SET closed_through = excluded.closed_through
+        ''', (grain, source, open_bucket))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info(f"Refreshed {grain} rollups for {source} from {start} to {open_bucket}")
+    return True
+
+def verify_rollups(db: sqlite3.Connection, today: date = None) -> list:
+    """Refresh, then compare every closed bucket with live plus archived rows.
+
+    Returns (grain, source, bucket, category, stored, actual) mismatches;
+    a period missing from the rollups shows up with stored 0.
+    """
+    today = today or datetime.utcnow().date()
+    mismatches = []
+    for grain, bucket in GRAINS.items():
+        open_bucket = bucket_start(today, grain).isoformat()
+        for source, column in SOURCES.items():
+            refresh(db, grain, source, today)
+            stored = {(row[0], row[1]): row[2] for row in db.execute(
+                'SELECT bucket, category, amount FROM rollups WHERE grain = ? AND source = ? AND bucket < ?',
+                (grain, source, open_bucket))}
+            actual = {}
+            for period, category, amount in db.execute(f'''
+                SELECT {bucket} AS bucket, {column}, SUM(amount)
+                FROM {source}
+                WHERE date < ?
+                GROUP BY bucket, {column}
+                UNION ALL
+                SELECT bucket, category, amount
+                FROM archived_rollups
+                WHERE grain = ? AND source = ? AND bucket < ?
+            ''', (open_bucket, grain, source, open_bucket)):
+                actual[period, category] = actual.get((period, category), 0) + amount
+            for key in sorted(set(stored) | set(actual)):
+                if stored.get(key, 0) != actual.get(key, 0):
+                    mismatches.append((grain, source, *key, stored.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+def summary(db: sqlite3.Connection, grain: str, start: date = None, end: date = None,
+            today: date = None) -> list:
+    """Per-period totals by category and investment type for start..end (inclusive).
+
+    Closed periods are read from the rollups table; only the open period is
+    aggregated from raw rows.
+    """
+    if grain not in GRAINS:
+        raise ValueError(f"Invalid period. Must be one of: {', '.join(GRAINS)}")
+    today = today or datetime.utcnow().date()
+    for source in SOURCES:
+        refresh(db, grain, source, today)
+
+    end = end or today
+    first = bucket_start(start, grain) if start else shift(bucket_start(end, grain), grain, -(DEFAULT_PERIODS - 1))
+    end_exclusive = (end + timedelta(days=1)).isoformat()
+    open_bucket = bucket_start(today, grain).isoformat()
+
+    periods = {}
+    def add(source, bucket, category, amount, entries):
+        period = periods.setdefault(bucket, {
+            source_name: {'total': 0, 'entries': 0, 'breakdown': {}} for source_name in SOURCES
+        })
+        figures = period[source]
+        figures['total'] += amount
+        figures['entries'] += entries
+        figures['breakdown'][category] = figures['breakdown'].get(category, 0) + amount
+
+    db.execute('BEGIN')
+    try:
+        for row in db.execute('''
+            SELECT source, bucket, category, amount, entries
+            FROM rollups
+            WHERE grain = ? AND bucket >= ? AND bucket < ? AND bucket < ?
+        ''', (grain, first.isoformat(), end_exclusive, open_bucket)):
+            add(*row)
+        # The open period, plus anything in a range that runs past today
+        live_from = max(first.isoformat(), open_bucket)
+        if live_from < end_exclusive:
+            for source, column in SOURCES.items():
+                for row in db.execute(f'''
+                    SELECT {GRAINS[grain]} AS bucket, {column}, SUM(amount), COUNT(*)
+                    FROM {source}
+                    WHERE date >= ? AND date < ?
+                    GROUP BY bucket, {column}
+                ''', (live_from, end_exclusive)):
+                    add(source, *row)
+    finally:
+        db.commit()
+
+    return [dict(period=bucket, **periods[bucket]) for bucket in sorted(periods)]
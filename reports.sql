@@ -0,0 +1,62 @@
+-- Materialized per-period rollups for closed buckets. A bucket is closed once its
+-- period has ended; rollup_watermarks.closed_through is the first date that is not
+-- materialized yet for a (grain, source). The triggers pull the watermark back when
+-- a write lands in an already materialized period, so the next refresh redoes it.
+CREATE TABLE IF NOT EXISTS rollups (
+    grain TEXT NOT NULL,
+    source TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    entries INTEGER NOT NULL,
+    PRIMARY KEY (grain, source, bucket, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    grain TEXT NOT NULL,
+    source TEXT NOT NULL,
+    closed_through TEXT NOT NULL,
+    PRIMARY KEY (grain, source)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollups_insert AFTER INSERT ON expenses
+WHEN NEW.date < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'expenses')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(NEW.date)
+        WHERE source = 'expenses' AND closed_through > date(NEW.date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollups_delete AFTER DELETE ON expenses
+WHEN OLD.date < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'expenses')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(OLD.date)
+        WHERE source = 'expenses' AND closed_through > date(OLD.date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollups_update AFTER UPDATE OF amount, category, date ON expenses
+WHEN min(OLD.date, NEW.date) < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'expenses')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(min(OLD.date, NEW.date))
+        WHERE source = 'expenses' AND closed_through > date(min(OLD.date, NEW.date));
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_rollups_insert AFTER INSERT ON investments
+WHEN NEW.date < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'investments')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(NEW.date)
+        WHERE source = 'investments' AND closed_through > date(NEW.date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_rollups_delete AFTER DELETE ON investments
+WHEN OLD.date < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'investments')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(OLD.date)
+        WHERE source = 'investments' AND closed_through > date(OLD.date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_rollups_update AFTER UPDATE OF amount, type, date ON investments
+WHEN min(OLD.date, NEW.date) < (SELECT MAX(closed_through) FROM rollup_watermarks WHERE source = 'investments')
+BEGIN
+    UPDATE rollup_watermarks SET closed_through = date(min(OLD.date, NEW.date))
+        WHERE source = 'investments' AND closed_through > date(min(OLD.date, NEW.date));
+END;
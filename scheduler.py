@@ -0,0 +1,84 @@
+"""Background thread materializing recurring transactions in every ledger.
+
+One scheduler runs per worker process, started by the first request (or the
+ASGI app's startup). Every RECURRING_INTERVAL seconds it visits the default
+ledger and each file under the ledger directory and calls materialize_due();
+the first pass runs straight away, so a worker that was down catches up as
+soon as it is back. Workers may overlap: each batch re-reads what is due
+under the ledger's write lock, so nothing is inserted twice.
+"""
+import logging
+import os
+import threading
+
+from db import close_pool, release_connection
+from recurring import materialize_due
+from tenants import DEFAULT_TENANT, iter_ledgers, tenant_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds between passes; 0 turns the scheduler off
+RECURRING_INTERVAL = float(os.environ.get('FINANCE_RECURRING_INTERVAL', 60))
+
+class RecurringScheduler:
+    def __init__(self, database: str, ledger_dir: str, interval: float = RECURRING_INTERVAL):
+        self.database = database
+        self.ledger_dir = ledger_dir
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ledgers(self):
+        """(tenant, path) of every ledger that exists; the default one is not created just to be scanned."""
+        if os.path.exists(self.database):
+            yield DEFAULT_TENANT, self.database
+        yield from iter_ledgers(self.ledger_dir)
+
+    def run_once(self, today=None) -> int:
+        """One pass over every ledger; returns the number of transactions inserted."""
+        inserted = 0
+        for tenant, path in self.ledgers():
+            if self._stop.is_set():
+                break
+            db = None
+            try:
+                db = tenant_connection(path)
+                inserted += materialize_due(db, today)['materialized']
+            except Exception as e:
+                # One broken ledger must not stop the others
+                logger.error(f"Recurring transactions failed for ledger {tenant}: {str(e)}")
+            finally:
+                if db is not None:
+                    release_connection(db)
+        return inserted
+
+    def start(self) -> None:
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='finance-recurring', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(self.interval)
+        finally:
+            close_pool()
+
+_schedulers = {}
+_lock = threading.Lock()
+
+def start_scheduler(database: str, ledger_dir: str, interval: float = RECURRING_INTERVAL) -> RecurringScheduler:
+    """This process's running scheduler for database and ledger_dir, started on first call."""
+    with _lock:
+        scheduler = _schedulers.get((database, ledger_dir))
+        if scheduler is None:
+            scheduler = _schedulers[database, ledger_dir] = RecurringScheduler(database, ledger_dir, interval)
+            scheduler.start()
+    return scheduler
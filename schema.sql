@@ -1,40 +1,53 @@
-DROP TABLE IF EXISTS income;
-DROP TABLE IF EXISTS expenses;
-DROP TABLE IF EXISTS budget;
-DROP TABLE IF EXISTS investments;
-DROP TABLE IF EXISTS savings_goals;
+-- Current schema for a new database. Existing databases are upgraded in place
+-- by the migrations in migrations.py; amounts are stored in paise.
 
-CREATE TABLE income (
+CREATE TABLE IF NOT EXISTS income (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    amount DECIMAL(10,2) NOT NULL,
+    amount INTEGER NOT NULL,
     date DATETIME NOT NULL
 );
 
-CREATE TABLE expenses (
+CREATE TABLE IF NOT EXISTS expenses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    amount DECIMAL(10,2) NOT NULL,
+    amount INTEGER NOT NULL,
     category TEXT NOT NULL,
     description TEXT,
     date DATETIME NOT NULL
 );
 
-CREATE TABLE budget (
+CREATE TABLE IF NOT EXISTS budget (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     category TEXT UNIQUE NOT NULL,
-    amount DECIMAL(10,2) NOT NULL,
+    amount INTEGER NOT NULL,
     date DATETIME NOT NULL
 );
 
-CREATE TABLE investments (
+CREATE TABLE IF NOT EXISTS investments (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    amount DECIMAL(10,2) NOT NULL,
+    amount INTEGER NOT NULL,
     type TEXT NOT NULL,
     date DATETIME NOT NULL
 );
 
-CREATE TABLE savings_goals (
+CREATE TABLE IF NOT EXISTS savings_goals (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    amount DECIMAL(10,2) NOT NULL,
+    amount INTEGER NOT NULL,
     target_date DATE NOT NULL,
     date DATETIME NOT NULL
-); 
+);
+
+CREATE INDEX IF NOT EXISTS idx_income_date ON income (date, amount);
+CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses (category, amount);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+CREATE INDEX IF NOT EXISTS idx_investments_type ON investments (type, amount);
+CREATE INDEX IF NOT EXISTS idx_investments_date ON investments (date);
+CREATE INDEX IF NOT EXISTS idx_savings_goals_date ON savings_goals (date, amount);
+
+-- Bumped by every write so cached views know when they are stale
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    modified_at REAL NOT NULL
+);
+
+INSERT OR IGNORE INTO data_version (id, version, modified_at) VALUES (1, 0, strftime('%s', 'now'));
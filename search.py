@@ -0,0 +1,238 @@
+"""Full-text search over expense descriptions and categories.
+
+The expenses_fts index (search.sql) is an external-content FTS5 table kept in
+step with expenses by triggers, so a search never scans the expenses table.
+Every word of a query must match; a trailing * makes a word a prefix
+('groc*'). Results come in one of two orders:
+
+- 'rank' (the default): relevance within windows of RANK_WINDOW matches,
+  newest window first, as matched words per character of each column,
+  description matches counting double category ones. Paging past the end of
+  a window continues with the next older one, so every match is reachable.
+- 'recent': newest entered first, read straight off the index in rowid
+  order, so a page costs the same however many rows match.
+
+Ranking does not use bm25(): its document frequencies are counted over every
+match in the index on each query, which takes hundreds of milliseconds for a
+word found in most of a 10M-row ledger.
+
+Both paginate by keyset: the cursor holds the sort key of the last row (and,
+in rank order, the window it came from). Archived expenses are no longer in
+the expenses table and are not searched.
+"""
+import logging
+import re
+import sqlite3
+from datetime import timedelta
+
+from cache import bump_version
+from errors import ValidationError
+from listing import decode_token, encode_token
+from validators import validate_date
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SCHEMA = 'search.sql'
+
+ORDERS = ('rank', 'recent')
+
+# Newest matches scored when ranking by relevance
+RANK_WINDOW = 5_000
+
+# Relevance weights of a match in the description and in the category
+WEIGHTS = (2.0, 1.0)
+
+# Shorter prefixes match too many index terms to merge quickly
+MIN_PREFIX = 2
+
+MAX_TERMS = 16
+
+_TERM = re.compile(r'(\w+)(\*?)')
+
+def match_expression(query: str) -> str:
+    """FTS5 MATCH expression for a user's query: every word quoted, prefixes kept."""
+    words = _TERM.findall(query or '')
+    if any(star and len(word) < MIN_PREFIX for word, star in words):
+        raise ValidationError(f"Prefix searches need at least {MIN_PREFIX} letters")
+    terms = [f'"{word}"{star}' for word, star in words]
+    if not terms:
+        raise ValidationError("Search query cannot be empty")
+    if len(terms) > MAX_TERMS:
+        raise ValidationError(f"Search query can have at most {MAX_TERMS} words")
+    return ' '.join(terms)
+
+def build_filters(db: sqlite3.Connection, query: str, category: str = None, start: str = None,
+                  end: str = None) -> tuple:
+    """Return (conditions, params) selecting the index rows that match query and the filters.
+
+    start and end are inclusive YYYY-MM-DD dates. Filters are applied while
+    the index is read, so they never empty a page, and narrow the read
+    itself: the category becomes a column phrase in the MATCH expression
+    and the dates a rowid range, found by scanning idx_expenses_date over
+    the dates (so wide ranges cost more than narrow ones).
+    """
+    expression = match_expression(query)
+    clauses, params = [], []
+    if category:
+        words = [word for word, _ in _TERM.findall(category)]
+        if words:
+            expression = f'({expression}) AND category : "{" ".join(words)}"'
+        clauses.append('e.category = ?')
+        params.append(category)
+    if start or end:
+        bounds, bound_params = [], []
+        if start:
+            bounds.append('date >= ?')
+            bound_params.append(validate_date(start).strftime('%Y-%m-%d'))
+        if end:
+            bounds.append('date < ?')
+            bound_params.append((validate_date(end) + timedelta(days=1)).strftime('%Y-%m-%d'))
+        clauses.extend(f'e.{bound}' for bound in bounds)
+        params.extend(bound_params)
+        first, last = db.execute(f"SELECT MIN(id), MAX(id) FROM expenses WHERE {' AND '.join(bounds)}",
+                                 bound_params).fetchone()
+        clauses.append('expenses_fts.rowid BETWEEN ? AND ?')
+        params.extend([first or 0, last or -1])
+    return ['expenses_fts MATCH ?'] + clauses, [expression] + params
+
+def build_recent(conditions: list, params: list, limit: int, before: int = None) -> tuple:
+    """Return (sql, params) for up to limit matches, newest first, with ids below before."""
+    if before is not None:
+        conditions = conditions + ['expenses_fts.rowid < ?']
+        params = params + [before]
+    return f'''
+        SELECT e.id, e.amount, e.category, e.description, e.date, NULL AS score
+        FROM expenses_fts
+        JOIN expenses e ON e.id = expenses_fts.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY expenses_fts.rowid DESC
+        LIMIT ?
+    ''', params + [limit]
+
+def build_ranked(conditions: list, params: list, limit: int, top: int = None, after: list = None) -> tuple:
+    """Return (sql, params) for up to limit matches of the window below top, by relevance.
+
+    The window is the RANK_WINDOW newest matches with ids up to top (the
+    newest matches when top is None); after is the [score, id] of the last
+    row already returned from it.
+    """
+    conditions, params = _window(conditions, params, top)
+    seek, seek_params = '', []
+    if after:
+        seek = 'WHERE score < ? OR (score = ? AND id < ?)'
+        seek_params = [after[0], after[0], after[1]]
+    return f'''
+        SELECT e.id, e.amount, e.category, e.description, e.date, ranked.score
+        FROM (
+            SELECT * FROM (
+                SELECT id, {_density('description', WEIGHTS[0])} + {_density('category', WEIGHTS[1])} AS score
+                FROM (
+                    SELECT expenses_fts.rowid AS id,
+                           highlight(expenses_fts, 0, char(1), '') AS description,
+                           highlight(expenses_fts, 1, char(1), '') AS category
+                    FROM expenses_fts
+                    {_window_join(conditions)}
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY expenses_fts.rowid DESC
+                    LIMIT {RANK_WINDOW}
+                )
+            )
+            {seek}
+            ORDER BY score DESC, id DESC
+            LIMIT ?
+        ) ranked
+        JOIN expenses e ON e.id = ranked.id
+        ORDER BY ranked.score DESC, ranked.id DESC
+    ''', params + seek_params + [limit]
+
+def _window(conditions: list, params: list, top: int = None) -> tuple:
+    if top is None:
+        return conditions, params
+    return conditions + ['expenses_fts.rowid <= ?'], params + [top]
+
+def _window_join(conditions: list) -> str:
+    # Without filters on expenses columns the window is read from the index alone
+    return 'JOIN expenses e ON e.id = expenses_fts.rowid' if len(conditions) > 1 else ''
+
+def _next_window(db: sqlite3.Connection, conditions: list, params: list, top: int = None):
+    """Top of the window after the one below top, or None when that window holds every older match."""
+    conditions, params = _window(conditions, params, top)
+    count, oldest = db.execute(f'''
+        SELECT COUNT(*), MIN(id) FROM (
+            SELECT expenses_fts.rowid AS id
+            FROM expenses_fts
+            {_window_join(conditions)}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY expenses_fts.rowid DESC
+            LIMIT {RANK_WINDOW}
+        )
+    ''', params).fetchone()
+    return oldest - 1 if count == RANK_WINDOW else None
+
+def _density(column: str, weight: float) -> str:
+    """SQL for weight x matched words per character of a highlight()ed column (char(1) before each match)."""
+    return (f"{weight} * COALESCE(length({column}) - length(replace({column}, char(1), '')), 0)"
+            f" / (1.0 + COALESCE(length({column}), 0))")
+
+def search_expenses(db: sqlite3.Connection, query: str, limit: int, order: str = 'rank', cursor: str = None,
+                    **filters) -> tuple:
+    """Return (rows, next_cursor) for one page of matches; next_cursor is None on the last page.
+
+    In rank order a page that runs past the end of one window continues
+    with the best matches of the next older one.
+    """
+    if order not in ORDERS:
+        raise ValidationError(f"Invalid order. Must be one of: {', '.join(ORDERS)}")
+    conditions, params = build_filters(db, query, **filters)
+    key = _decode_cursor(cursor, order) if cursor else None
+
+    if order == 'recent':
+        rows = db.execute(*build_recent(conditions, params, limit + 1, key[0] if key else None)).fetchall()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_token([rows[-1]['id']])
+        return rows, None
+
+    top, after = (key[0], key[1:] or None) if key else (None, None)
+    page = []
+    while True:
+        sql, sql_params = build_ranked(conditions, params, limit + 1 - len(page), top, after)
+        page.extend((row, top) for row in db.execute(sql, sql_params))
+        if len(page) > limit:
+            row, row_top = page[limit - 1]
+            return [row for row, _ in page[:limit]], encode_token([row_top, row['score'], row['id']])
+        top, after = _next_window(db, conditions, params, top), None
+        if top is None:
+            return [row for row, _ in page], None
+        if len(page) == limit:
+            return [row for row, _ in page], encode_token([top])
+
+def _decode_cursor(token: str, order: str) -> list:
+    try:
+        key = decode_token(token)
+    except ValueError as e:
+        raise ValidationError(str(e))
+    if order == 'rank':
+        # [window top] at the start of a window, else [window top, score, id]
+        valid = (isinstance(key, list) and len(key) in (1, 3) and (key[0] is None or isinstance(key[0], int))
+                 and (len(key) == 1 or (isinstance(key[1], (int, float)) and isinstance(key[2], int))))
+    else:
+        valid = isinstance(key, list) and len(key) == 1 and isinstance(key[0], int)
+    if not valid:
+        raise ValidationError("Invalid cursor")
+    return key
+
+def write_index(db: sqlite3.Connection) -> int:
+    """Re-read every expense into the search index, without committing; returns rows indexed."""
+    db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('optimize')")
+    return db.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+
+def rebuild_index(db: sqlite3.Connection) -> int:
+    """Rebuild and commit the search index; returns rows indexed."""
+    rows = write_index(db)
+    # Cached search responses may have come from the stale index
+    bump_version(db)
+    db.commit()
+    logger.info(f"Rebuilt the search index over {rows} expenses")
+    return rows
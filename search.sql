@@ -0,0 +1,30 @@
+-- Full-text index over expense descriptions and categories. It is an external-content
+-- FTS5 table: it stores only the index and reads the text back from expenses, so the
+-- triggers below must keep it in step with every insert, delete and edit. The prefix
+-- indexes make two- and three-letter prefix queries ('gr*', 'gro*') index lookups.
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+    description,
+    category,
+    content = 'expenses',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses
+BEGIN
+    INSERT INTO expenses_fts (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses
+BEGIN
+    INSERT INTO expenses_fts (expenses_fts, rowid, description, category)
+        VALUES ('delete', OLD.id, OLD.description, OLD.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF description, category ON expenses
+BEGIN
+    INSERT INTO expenses_fts (expenses_fts, rowid, description, category)
+        VALUES ('delete', OLD.id, OLD.description, OLD.category);
+    INSERT INTO expenses_fts (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+END;
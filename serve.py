@@ -0,0 +1,78 @@
+"""Production launcher: migrate the database and compile templates once, then start a multi-worker server.
+
+    python serve.py                      # uvicorn, ASGI read API + Flask fallback
+    python serve.py --server gunicorn    # gunicorn, plain WSGI Flask app
+    python serve.py --workers 8 --port 8000
+
+Neither server runs the debug reloader. uvicorn and gunicorn are optional
+dependencies; install the one you use, and asgiref with uvicorn.
+"""
+import argparse
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+def prepare() -> None:
+    """Migrate the database and compile the templates once, before any worker starts.
+
+    Workers would otherwise each do both on their first request.
+    """
+    from app import create_app, init_db
+    from precompile import compile_templates
+    app = create_app()
+    with app.app_context():
+        init_db()
+    compile_templates(app.jinja_env, app.root_path, app.config['COMPILED_TEMPLATES'])
+
+def run_uvicorn(args) -> None:
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is not installed; run 'pip install uvicorn' or use --server gunicorn")
+    try:
+        import asgiref  # noqa: F401
+    except ImportError:
+        sys.exit("asgiref is not installed; run 'pip install asgiref' (asgi.py serves the pages through it)"
+                 " or use --server gunicorn")
+    uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                lifespan='on', reload=False, log_level='info')
+
+def run_gunicorn(args) -> None:
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is not installed; run 'pip install gunicorn' or use --server uvicorn")
+    argv = [sys.executable, '-m', 'gunicorn', '--bind', f"{args.host}:{args.port}",
+            '--workers', str(args.workers), '--threads', str(args.threads), 'app:create_app()']
+    os.execv(sys.executable, argv)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['uvicorn', 'gunicorn'], default='uvicorn')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 3000)))
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='Worker processes (default: one per CPU)')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='Threads per gunicorn worker')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        prepare()
+    except Exception as e:
+        logger.error(f"Failed to initialize database: {str(e)}")
+        raise
+    logger.info(f"Starting {args.server} with {args.workers} workers on {args.host}:{args.port}")
+    if args.server == 'uvicorn':
+        run_uvicorn(args)
+    else:
+        run_gunicorn(args)
+
+if __name__ == '__main__':
+    main()
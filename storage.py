@@ -0,0 +1,380 @@
+"""Storage backends shared by the web app and the FinanceManager CLI.
+
+Every backend keeps amounts in integer paise and answers the hot reads
+(latest income, whole-table totals, per-category spend, total allocations)
+from running totals rather than by scanning rows:
+
+  * SQLiteStorage: a ledger database; totals come from the trigger-maintained
+    totals table (totals.py). Used by the web app.
+  * MemoryStorage: running totals over column-oriented Ledger rows, for tests
+    and benchmarks.
+  * JournalStorage: MemoryStorage made durable by the append-only Journal
+    (journal.py). Used by the CLI; it also reads the CLI's older files.
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+
+from cache import bump_version
+from db import write_transaction
+from journal import Journal
+from ledger import Ledger
+from totals import allocation_total, category_total, table_total
+
+# Row sources with a label column: category for expenses, type for investments
+SOURCES = {'expenses': 'category', 'investments': 'type'}
+
+# Budget category the CLI's single monthly budget is kept under
+MONTHLY_BUDGET = 'monthly'
+
+# Version of the MemoryStorage state written into journal snapshots
+STATE_FORMAT = 2
+
+class Storage(ABC):
+    """Operations every backend provides. Amounts are integer paise; dates are datetimes or their str() form.
+
+    A backend missing any abstract operation fails when it is constructed.
+    """
+
+    @contextmanager
+    def transaction(self):
+        """Group a check-then-write sequence so no other writer interleaves with it."""
+        yield self
+
+    @abstractmethod
+    def add_expense(self, amount: int, category: str, description: str = '', date=None) -> None:
+        ...
+
+    @abstractmethod
+    def add_investment(self, amount: int, type: str, date=None) -> None:
+        ...
+
+    @abstractmethod
+    def set_income(self, amount: int, date=None) -> None:
+        ...
+
+    @abstractmethod
+    def set_budget(self, category: str, amount: int, date=None) -> None:
+        """Set (or replace) the budget of one category."""
+
+    @abstractmethod
+    def set_savings_goal(self, amount: int, target_date=None, date=None) -> None:
+        ...
+
+    @abstractmethod
+    def latest_income(self):
+        """The most recently set income, or None when none was set."""
+
+    @abstractmethod
+    def savings_goal(self):
+        """The most recently set savings goal, or None."""
+
+    @abstractmethod
+    def budget(self, category: str):
+        """The budget of one category, or None."""
+
+    @abstractmethod
+    def budgets(self) -> dict:
+        ...
+
+    @abstractmethod
+    def total(self, source: str) -> int:
+        """Sum of every row of source ('expenses' or 'investments')."""
+
+    @abstractmethod
+    def category_total(self, source: str, category: str) -> int:
+        ...
+
+    @abstractmethod
+    def category_totals(self, source: str) -> dict:
+        """{category (or investment type): sum} for every label with rows."""
+
+    def allocation_total(self) -> int:
+        """Expenses + investments + budgets, the figure every allocation is checked against."""
+        return self.total('expenses') + self.total('investments') + sum(self.budgets().values())
+
+    @abstractmethod
+    def rows(self, source: str):
+        """Yield the rows of source as dicts, oldest first."""
+
+    def close(self) -> None:
+        pass
+
+class SQLiteStorage(Storage):
+    """A ledger database. Writes bump the data version so cached views notice them."""
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    @contextmanager
+    def transaction(self):
+        # Joins a transaction the caller already opened
+        if self.db.in_transaction:
+            yield self
+            return
+        with write_transaction(self.db):
+            yield self
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self.transaction():
+            self.db.execute(sql, params)
+            bump_version(self.db)
+
+    def add_expense(self, amount, category, description='', date=None):
+        self._write('INSERT INTO expenses (amount, category, description, date) VALUES (?, ?, ?, ?)',
+                    (amount, category, description, date or datetime.utcnow()))
+
+    def add_investment(self, amount, type, date=None):
+        self._write('INSERT INTO investments (amount, type, date) VALUES (?, ?, ?)',
+                    (amount, type, date or datetime.utcnow()))
+
+    def set_income(self, amount, date=None):
+        self._write('INSERT INTO income (amount, date) VALUES (?, ?)', (amount, date or datetime.utcnow()))
+
+    def set_budget(self, category, amount, date=None):
+        self._write('''
+            INSERT INTO budget (category, amount, date) VALUES (?, ?, ?)
+            ON CONFLICT (category) DO UPDATE SET amount = excluded.amount, date = excluded.date
+        ''', (category, amount, date or datetime.utcnow()))
+
+    def set_savings_goal(self, amount, target_date=None, date=None):
+        self._write('INSERT INTO savings_goals (amount, target_date, date) VALUES (?, ?, ?)',
+                    (amount, target_date, date or datetime.utcnow()))
+
+    def latest_income(self):
+        row = self.db.execute('SELECT amount FROM income ORDER BY date DESC LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def savings_goal(self):
+        row = self.db.execute('SELECT amount FROM savings_goals ORDER BY date DESC LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def budget(self, category):
+        row = self.db.execute('SELECT amount FROM budget WHERE category = ?', (category,)).fetchone()
+        return row[0] if row else None
+
+    def budgets(self):
+        return {row[0]: row[1] for row in self.db.execute('SELECT category, amount FROM budget')}
+
+    def total(self, source):
+        return table_total(self.db, source)
+
+    def category_total(self, source, category):
+        return category_total(self.db, source, category)
+
+    def category_totals(self, source):
+        return {row[0]: row[1] for row in self.db.execute('''
+            SELECT category, amount FROM totals WHERE source = ? AND category != '' AND entries > 0
+        ''', (source,))}
+
+    def allocation_total(self):
+        return allocation_total(self.db)
+
+    def rows(self, source):
+        columns = 'id, amount, category, description, date' if source == 'expenses' else 'id, amount, type, date'
+        cursor = self.db.execute(f'SELECT {columns} FROM {source} ORDER BY date, id')
+        while True:
+            chunk = cursor.fetchmany(1000)
+            if not chunk:
+                break
+            for row in chunk:
+                yield dict(row)
+
+class MemoryStorage(Storage):
+    """Everything in process memory: rows in compact Ledger columns, totals in dicts.
+
+    The latest income and savings goal are the last ones set.
+    """
+
+    def __init__(self):
+        self.ledgers = {source: Ledger(label) for source, label in SOURCES.items()}
+        self.descriptions = []
+        self.income = None
+        self.goal = None
+        self.budget_amounts = {}
+        self._totals = {source: {} for source in SOURCES}
+        self._table_totals = dict.fromkeys(SOURCES, 0)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self
+
+    def _add(self, source: str, amount: int, label: str, date) -> None:
+        ledger = self.ledgers[source]
+        ledger.append({ledger.label_key: label, 'amount': amount, 'date': date or datetime.utcnow()})
+        totals = self._totals[source]
+        totals[label] = totals.get(label, 0) + amount
+        self._table_totals[source] += amount
+
+    def add_expense(self, amount, category, description='', date=None):
+        with self._lock:
+            self._add('expenses', amount, category, date)
+            self.descriptions.append(description or '')
+
+    def add_investment(self, amount, type, date=None):
+        with self._lock:
+            self._add('investments', amount, type, date)
+
+    def set_income(self, amount, date=None):
+        self.income = amount
+
+    def set_budget(self, category, amount, date=None):
+        self.budget_amounts[category] = amount
+
+    def set_savings_goal(self, amount, target_date=None, date=None):
+        self.goal = amount
+
+    def latest_income(self):
+        return self.income
+
+    def savings_goal(self):
+        return self.goal
+
+    def budget(self, category):
+        return self.budget_amounts.get(category)
+
+    def budgets(self):
+        return dict(self.budget_amounts)
+
+    def total(self, source):
+        return self._table_totals[source]
+
+    def category_total(self, source, category):
+        return self._totals[source].get(category, 0)
+
+    def category_totals(self, source):
+        return dict(self._totals[source])
+
+    def rows(self, source):
+        for i, row in enumerate(self.ledgers[source]):
+            row['id'] = i + 1
+            row['amount'] = int(row['amount'])
+            if source == 'expenses':
+                row['description'] = self.descriptions[i]
+            yield row
+
+    def to_state(self) -> dict:
+        """JSON-serializable copy of everything stored."""
+        return {
+            'format': STATE_FORMAT,
+            'income': self.income,
+            'savings_goal': self.goal,
+            'budgets': dict(self.budget_amounts),
+            'expenses': self.ledgers['expenses'].to_columns(),
+            'descriptions': list(self.descriptions),
+            'investments': self.ledgers['investments'].to_columns(),
+        }
+
+    def load_state(self, state: dict) -> None:
+        """Replace the contents with a to_state() copy, recomputing the totals from the rows."""
+        self.income = state['income']
+        self.goal = state['savings_goal']
+        self.budget_amounts = dict(state['budgets'])
+        self.descriptions = list(state['descriptions'])
+        for source in SOURCES:
+            ledger = self.ledgers[source] = Ledger.from_columns(state[source])
+            # Paise are whole numbers, exact in the float64 column
+            self._totals[source] = {label: int(round(amount)) for label, amount in ledger.totals_by_label().items()}
+            self._table_totals[source] = sum(self._totals[source].values())
+
+class JournalStorage(MemoryStorage):
+    """MemoryStorage made durable: each write is appended to a Journal before it is applied.
+
+    Call load() first. Snapshots hold to_state(); the CLI's older snapshots,
+    journal entries and legacy_file (amounts in rupees, one overall budget)
+    are converted as they are read.
+    """
+
+    def __init__(self, path: str = 'finance_data', journal: Journal = None, legacy_file: str = None):
+        super().__init__()
+        self.journal = journal or Journal(path)
+        self.legacy_file = legacy_file
+
+    def load(self) -> bool:
+        """Read the snapshot and replay the journal; returns False when there was no data."""
+        state, entries = self.journal.load()
+        legacy = state is None and self.legacy_file is not None and os.path.exists(self.legacy_file)
+        if legacy:
+            with open(self.legacy_file, 'r') as f:
+                state = json.load(f)
+        if state is None and not entries:
+            return False
+        if state is not None:
+            if state.get('format') == STATE_FORMAT:
+                self.load_state(state)
+            else:
+                self._load_legacy_state(state)
+        for entry in entries:
+            self._apply(entry)
+        if legacy:
+            # Fold the old file into a snapshot so it is only imported once
+            self.compact()
+        return True
+
+    def _record(self, entry: dict) -> None:
+        with self._lock:
+            self.journal.append(entry)
+            self._apply(entry)
+            if self.journal.should_compact():
+                self.compact()
+
+    def _apply(self, entry: dict) -> None:
+        op = entry['op']
+        amount = entry['amount_paise'] if 'amount_paise' in entry else _rupees_to_paise(entry['amount'])
+        if op == 'income':
+            super().set_income(amount)
+        elif op == 'budget':
+            super().set_budget(entry.get('category', MONTHLY_BUDGET), amount)
+        elif op == 'savings_goal':
+            super().set_savings_goal(amount)
+        elif op == 'expense':
+            super().add_expense(amount, entry['category'], entry.get('description', ''), entry['date'])
+        elif op == 'investment':
+            super().add_investment(amount, entry['type'], entry['date'])
+
+    def _load_legacy_state(self, state: dict) -> None:
+        """Convert a snapshot written before storage backends existed."""
+        if state.get('income'):
+            super().set_income(_rupees_to_paise(state['income']))
+        if state.get('budget'):
+            super().set_budget(MONTHLY_BUDGET, _rupees_to_paise(state['budget']))
+        if state.get('savings_goal'):
+            super().set_savings_goal(_rupees_to_paise(state['savings_goal']))
+        for row in Ledger.load(state.get('transaction_history', []), 'category'):
+            super().add_expense(_rupees_to_paise(row['amount']), row['category'], '', row['date'])
+        for row in Ledger.load(state.get('investments', []), 'type'):
+            super().add_investment(_rupees_to_paise(row['amount']), row['type'], row['date'])
+
+    def add_expense(self, amount, category, description='', date=None):
+        self._record({'op': 'expense', 'category': category, 'amount_paise': amount,
+                      'description': description or '', 'date': str(date or datetime.utcnow())})
+
+    def add_investment(self, amount, type, date=None):
+        self._record({'op': 'investment', 'type': type, 'amount_paise': amount,
+                      'date': str(date or datetime.utcnow())})
+
+    def set_income(self, amount, date=None):
+        self._record({'op': 'income', 'amount_paise': amount})
+
+    def set_budget(self, category, amount, date=None):
+        self._record({'op': 'budget', 'category': category, 'amount_paise': amount})
+
+    def set_savings_goal(self, amount, target_date=None, date=None):
+        self._record({'op': 'savings_goal', 'amount_paise': amount})
+
+    def compact(self) -> None:
+        """Snapshot the current state and empty the journal, so the next load is short."""
+        with self._lock:
+            self.journal.compact(self.to_state())
+
+    def close(self) -> None:
+        self.journal.close()
+
+def _rupees_to_paise(amount) -> int:
+    return int(round(float(amount) * 100))
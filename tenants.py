@@ -0,0 +1,104 @@
+import hashlib
+import hmac
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from db import pooled_connection
+from errors import NotFoundError, ValidationError
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+# Ledger used when a request names none; it lives in the legacy single database file
+DEFAULT_TENANT = 'default'
+
+# Request header carrying the ledger name, set by an authenticating proxy in front of the app
+TENANT_HEADER = 'X-Tenant'
+
+# The header is ignored unless the deployment says a proxy sets it; clients could otherwise name any ledger
+TRUST_TENANT_HEADER = os.environ.get('FINANCE_TRUST_TENANT_HEADER', '') == '1'
+
+# Directory holding one SQLite file per ledger, fanned out over SHARD_DIRS subdirectories
+LEDGER_DIR = os.environ.get('FINANCE_LEDGER_DIR', 'ledgers')
+SHARD_DIRS = 256
+
+TENANT_NAME = re.compile(r'[a-z0-9][a-z0-9_-]{0,63}')
+
+# Ledger files remembered as migrated; the least recently used are forgotten and re-checked on next use
+READY_SIZE = 4096
+
+# Locks serializing migrations, shared by ledgers whose paths hash to the same slot
+MIGRATION_LOCKS = 64
+
+_ready = OrderedDict()
+_ready_lock = threading.Lock()
+_migration_locks = [threading.Lock() for _ in range(MIGRATION_LOCKS)]
+
+def normalize_tenant(name: str) -> str:
+    """Validate a ledger name and return its canonical (lower-case) form."""
+    tenant = (name or '').strip().lower()
+    if not TENANT_NAME.fullmatch(tenant):
+        raise ValidationError("Invalid ledger name. Use up to 64 letters, digits, '-' or '_'")
+    return tenant
+
+def ledger_path(tenant: str, default_path: str, root: str = LEDGER_DIR) -> str:
+    """Database file for a ledger: <root>/<shard>/<tenant>.db, or default_path for the default ledger.
+
+    The shard directory comes from a hash of the name so tens of thousands of
+    ledgers never pile up in one directory.
+    """
+    if tenant == DEFAULT_TENANT:
+        return default_path
+    shard = int(hashlib.sha1(tenant.encode()).hexdigest()[:4], 16) % SHARD_DIRS
+    return os.path.join(root, f'{shard:02x}', f'{tenant}.db')
+
+def ledger_key(secret_key, tenant: str) -> str:
+    """Key a browser must present to switch its session to a ledger; derived from the app's secret key."""
+    secret = secret_key.encode() if isinstance(secret_key, str) else secret_key
+    return hmac.new(secret, tenant.encode(), hashlib.sha256).hexdigest()[:32]
+
+def tenant_connection(path: str, create: bool = True) -> sqlite3.Connection:
+    """Pooled connection to a ledger file, migrating its schema on first use.
+
+    A missing file is created unless create is False, when NotFoundError is
+    raised instead; requests pass False for every ledger but the default,
+    so only 'flask create-ledger' adds one.
+    """
+    with _ready_lock:
+        if path in _ready:
+            _ready.move_to_end(path)
+            return pooled_connection(path)
+    if not create and not os.path.exists(path):
+        raise NotFoundError("No such ledger")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = pooled_connection(path)
+    # Migrations only wait on the few ledgers sharing a lock slot; migrate()
+    # re-reads the schema version under the file's write lock, so other
+    # threads and processes never apply a step twice
+    with _migration_locks[hash(path) % MIGRATION_LOCKS]:
+        if path not in _ready:
+            version = migrate(db)
+            logger.debug(f"Ledger {path} ready at schema version {version}")
+    with _ready_lock:
+        _ready[path] = True
+        while len(_ready) > READY_SIZE:
+            _ready.popitem(last=False)
+    return db
+
+def iter_ledgers(root: str = LEDGER_DIR):
+    """Yield (tenant, path) for every ledger file under root."""
+    if not os.path.isdir(root):
+        return
+    for shard in sorted(os.listdir(root)):
+        directory = os.path.join(root, shard)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.db'):
+                yield name[:-3], os.path.join(directory, name)
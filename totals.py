@@ -0,0 +1,94 @@
+import sqlite3
+import logging
+
+from cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+# Source tables tracked in the totals table and the column each one groups by
+SOURCES = {
+    'expenses': 'category',
+    'investments': 'type',
+    'budget': 'category',
+}
+
+# Category key of the whole-table total row
+TABLE_TOTAL = ''
+
+TOTALS_SCHEMA = 'totals.sql'
+
+def table_total(db: sqlite3.Connection, source: str) -> int:
+    """Return the running total of a whole source table, in paise."""
+    return category_total(db, source, TABLE_TOTAL)
+
+def category_total(db: sqlite3.Connection, source: str, category: str) -> int:
+    """Return the running total of one category (or investment type) in a source table."""
+    row = db.execute('SELECT amount FROM totals WHERE source = ? AND category = ?',
+                     (source, category)).fetchone()
+    return row[0] if row else 0
+
+def allocation_total(db: sqlite3.Connection) -> int:
+    """Return expenses + investments + budgets from the whole-table total rows."""
+    return db.execute('''
+        SELECT COALESCE(SUM(amount), 0)
+        FROM totals
+        WHERE category = ? AND source IN ('expenses', 'investments', 'budget')
+    ''', (TABLE_TOTAL,)).fetchone()[0]
+
+def _recomputed(db: sqlite3.Connection) -> dict:
+    """Recompute every totals row from the raw source tables and the archived sums."""
+    computed = {}
+    for source, column in SOURCES.items():
+        row = db.execute(f'SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM {source}').fetchone()
+        computed[(source, TABLE_TOTAL)] = (row[0], row[1])
+        for row in db.execute(f'''
+            SELECT {column}, SUM(amount), COUNT(*)
+            FROM {source}
+            GROUP BY {column}
+        '''):
+            computed[(source, row[0])] = (row[1], row[2])
+    # Rows moved out by archive.py still count; their monthly sums cover every archived row.
+    # (Older schema versions being migrated have no archive yet.)
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archived_rollups'").fetchone():
+        return computed
+    for source, category, amount, entries in db.execute('''
+        SELECT source, category, SUM(amount), SUM(entries)
+        FROM archived_rollups
+        WHERE grain = 'month'
+        GROUP BY source, category
+    '''):
+        for key in ((source, TABLE_TOTAL), (source, category)):
+            total, count = computed.get(key, (0, 0))
+            computed[key] = (total + amount, count + entries)
+    return computed
+
+def write_totals(db: sqlite3.Connection) -> int:
+    """Replace the totals rows with sums recomputed from raw rows, without committing."""
+    computed = _recomputed(db)
+    db.execute('DELETE FROM totals')
+    db.executemany('INSERT INTO totals (source, category, amount, entries) VALUES (?, ?, ?, ?)',
+                   [(source, category, amount, entries)
+                    for (source, category), (amount, entries) in computed.items()])
+    return len(computed)
+
+def rebuild_totals(db: sqlite3.Connection) -> int:
+    """Recompute and commit the totals table; returns rows written."""
+    rows = write_totals(db)
+    # Cached responses and ETags may carry the totals from before the rebuild
+    bump_version(db)
+    db.commit()
+    logger.info(f"Rebuilt {rows} totals rows")
+    return rows
+
+def verify_totals(db: sqlite3.Connection) -> list:
+    """Compare stored totals with raw rows and return (source, category, stored, actual) mismatches."""
+    computed = _recomputed(db)
+    stored = {(row['source'], row['category']): row['amount']
+              for row in db.execute('SELECT source, category, amount FROM totals')}
+    mismatches = []
+    for key in sorted(set(computed) | set(stored)):
+        actual = computed.get(key, (0, 0))[0]
+        recorded = stored.get(key, 0)
+        if recorded != actual:
+            mismatches.append((key[0], key[1], recorded, actual))
+    return mismatches
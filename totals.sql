@@ -0,0 +1,82 @@
+-- Running totals per source table, kept in step with every write by the triggers below.
+-- category '' holds the whole-table total; every other row is a per-category sum
+-- (investment type for investments).
+CREATE TABLE IF NOT EXISTS totals (
+    source TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 0,
+    entries INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS expenses_totals_insert AFTER INSERT ON expenses
+BEGIN
+    INSERT INTO totals (source, category, amount, entries) VALUES ('expenses', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('expenses', NEW.category, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_totals_delete AFTER DELETE ON expenses
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'expenses' AND category IN ('', OLD.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_totals_update AFTER UPDATE OF amount, category ON expenses
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'expenses' AND category IN ('', OLD.category);
+    INSERT INTO totals (source, category, amount, entries) VALUES ('expenses', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('expenses', NEW.category, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_totals_insert AFTER INSERT ON investments
+BEGIN
+    INSERT INTO totals (source, category, amount, entries) VALUES ('investments', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('investments', NEW.type, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_totals_delete AFTER DELETE ON investments
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'investments' AND category IN ('', OLD.type);
+END;
+
+CREATE TRIGGER IF NOT EXISTS investments_totals_update AFTER UPDATE OF amount, type ON investments
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'investments' AND category IN ('', OLD.type);
+    INSERT INTO totals (source, category, amount, entries) VALUES ('investments', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('investments', NEW.type, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS budget_totals_insert AFTER INSERT ON budget
+BEGIN
+    INSERT INTO totals (source, category, amount, entries) VALUES ('budget', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('budget', NEW.category, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS budget_totals_delete AFTER DELETE ON budget
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'budget' AND category IN ('', OLD.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS budget_totals_update AFTER UPDATE OF amount, category ON budget
+BEGIN
+    UPDATE totals SET amount = amount - OLD.amount, entries = entries - 1
+        WHERE source = 'budget' AND category IN ('', OLD.category);
+    INSERT INTO totals (source, category, amount, entries) VALUES ('budget', '', NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+    INSERT INTO totals (source, category, amount, entries) VALUES ('budget', NEW.category, NEW.amount, 1)
+        ON CONFLICT (source, category) DO UPDATE SET amount = amount + excluded.amount, entries = entries + 1;
+END;
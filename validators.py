@@ -0,0 +1,40 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
+
+from errors import ValidationError
+
+# Largest amount accepted, in paise (₹1 lakh crore); keeps amounts and their
+# running totals well inside SQLite's 64-bit INTEGER
+MAX_AMOUNT = 10 ** 14
+
+def format_currency(amount: int) -> str:
+    """Format an amount in paise as Indian Rupees with proper formatting."""
+    sign = '-' if amount < 0 else ''
+    rupees, paise = divmod(abs(int(amount)), 100)
+    return f"₹{sign}{rupees:,}.{paise:02d}"
+
+def validate_amount(amount) -> int:
+    """Validate an amount in rupees and return it in whole paise, rounding down."""
+    try:
+        value = Decimal(str(amount).strip())
+    except (InvalidOperation, ValueError, TypeError):
+        raise ValidationError("Invalid amount format")
+    if not value.is_finite():
+        raise ValidationError("Invalid amount format")
+    if value <= 0:
+        raise ValidationError("Amount must be positive")
+    # Checked before quantize(), which raises on more digits than the context holds
+    if value > Decimal(MAX_AMOUNT).scaleb(-2):
+        raise ValidationError(f"Amount cannot exceed {format_currency(MAX_AMOUNT)}")
+    paise = int(value.quantize(Decimal('0.01'), rounding=ROUND_DOWN) * 100)
+    if paise == 0:
+        raise ValidationError("Amount must be positive")
+    return paise
+
+def validate_date(date_str: str) -> datetime:
+    """Validate and parse date string."""
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d')
+    except (ValueError, TypeError):
+        # TypeError: not a string, e.g. a JSON number
+        raise ValidationError("Invalid date format. Use YYYY-MM-DD")
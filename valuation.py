@@ -0,0 +1,249 @@
+"""Mark-to-market valuation of investments against a local price history.
+
+Investments record only a type and the amount paid, so each investment type
+is valued against one daily price series (an index or fund NAV), kept as
+<PRICES_DIR>/<type>.csv with a 'date,close' header, e.g. prices/mutual_funds.csv.
+Every purchase buys amount / close-on-that-day units, and holdings are worth
+units x close on any later day. Types without a price file keep their cost.
+
+Purchases are summed per (type, day) in SQL, archived ones included, so the
+arithmetic runs over at most one figure per type and day whatever the number
+of lots; the holdings, values and time-weighted returns for every day of a
+range are then a handful of NumPy cumulative sums and binary searches.
+
+Needs numpy, which is optional.
+"""
+import csv
+import importlib.util
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from errors import ValidationError
+from validators import format_currency
+
+# Directory holding one price CSV per investment type
+PRICES_DIR = os.environ.get('FINANCE_PRICES_DIR', 'prices')
+
+# Compiled price series: days since 1970-01-01 and the close, sorted by day
+PRICE_DTYPE = [('day', '<i8'), ('close', '<f8')]
+
+# Windows shorter than this are not annualized
+YEAR_DAYS = 365
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def available() -> bool:
+    return importlib.util.find_spec('numpy') is not None
+
+def check_valuation() -> None:
+    if not available():
+        raise ValidationError("Investment valuation needs numpy; install it to enable it")
+
+def price_file(directory: str, type: str) -> str:
+    """CSV path of an investment type's prices: 'Mutual Funds' -> <directory>/mutual_funds.csv."""
+    return os.path.join(directory, re.sub(r'[^a-z0-9]+', '_', type.lower()).strip('_') + '.csv')
+
+def to_day(value) -> int:
+    """Days since 1970-01-01 of a date, datetime or YYYY-MM-DD[...] string."""
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() - _EPOCH_ORDINAL
+
+class PriceStore:
+    """Daily closes per investment type, read from the CSV files under directory.
+
+    Each CSV is compiled once into a sorted binary .npy beside it and then
+    memory-mapped, so workers share the pages and a lookup is a binary
+    search. A CSV edited after its .npy was written is compiled again on
+    the next lookup.
+    """
+
+    def __init__(self, directory: str = PRICES_DIR):
+        self.directory = directory
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def series(self, type: str):
+        """The (day, close) record array of type, or None when it has no price file."""
+        path = price_file(self.directory, type)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            cached = self._series.get(type)
+            if cached is None or cached[0] != mtime:
+                cached = self._series[type] = (mtime, self._load(path, mtime))
+        return cached[1]
+
+    def stamp(self, types) -> tuple:
+        """Modification times of the price files of types; changes whenever any price does."""
+        stamps = []
+        for type in sorted(types):
+            try:
+                stamps.append(os.stat(price_file(self.directory, type)).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def prices_at(self, type: str, days):
+        """Close of type on or before each of days (the first close for days before it); None without prices."""
+        import numpy as np
+
+        series = self.series(type)
+        if series is None or not len(series):
+            return None
+        index = np.searchsorted(series['day'], days, side='right') - 1
+        return series['close'][np.clip(index, 0, None)]
+
+    @staticmethod
+    def _load(path: str, mtime: int):
+        import numpy as np
+
+        compiled = path[:-len('.csv')] + '.npy'
+        try:
+            if os.stat(compiled).st_mtime_ns >= mtime:
+                return np.load(compiled, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+        closes = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                # A later line for the same day wins
+                closes[to_day(row['date'].strip())] = float(row['close'])
+        series = np.array(sorted(closes.items()), dtype=PRICE_DTYPE)
+        if (series['close'] <= 0).any():
+            raise ValidationError(f"Prices in {path} must be positive")
+        tmp_path = f"{compiled}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, series)
+        # Atomic, so a concurrent worker never maps a half-written file
+        os.replace(tmp_path, compiled)
+        return np.load(compiled, mmap_mode='r')
+
+def purchases(db: sqlite3.Connection) -> dict:
+    """{type: (days, amounts)} of money invested per day, oldest first, archived investments included."""
+    import numpy as np
+
+    rows = db.execute('''
+        SELECT type, day, SUM(amount)
+        FROM (
+            SELECT type, date(date) AS day, amount FROM investments
+            UNION ALL
+            SELECT category, bucket, amount
+            FROM archived_rollups
+            WHERE grain = 'day' AND source = 'investments'
+        )
+        GROUP BY type, day
+        ORDER BY type, day
+    ''').fetchall()
+    if not rows:
+        return {}
+    types = np.array([row[0] for row in rows], dtype=object)
+    days = np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int64)
+    amounts = np.array([row[2] for row in rows], dtype=np.int64)
+    # Rows are ordered by type, so each type is one contiguous run
+    starts = np.flatnonzero(np.r_[True, types[1:] != types[:-1]])
+    ends = np.r_[starts[1:], len(rows)]
+    return {types[start]: (days[start:end], amounts[start:end]) for start, end in zip(starts, ends)}
+
+def holdings(flows: tuple, prices_at, days):
+    """(cost, value) of one type's holdings at the end of each of days, in paise."""
+    import numpy as np
+
+    buy_days, amounts = flows
+    if prices_at is None:
+        # No prices: units of one paisa each, worth what they cost
+        units = amounts.astype(np.float64)
+        closes = np.ones(len(days))
+    else:
+        units = amounts / prices_at(buy_days)
+        closes = prices_at(days)
+    bought = np.searchsorted(buy_days, days, side='right')
+    held = np.r_[0.0, np.cumsum(units)][bought]
+    cost = np.r_[0, np.cumsum(amounts)][bought]
+    return cost, held * closes
+
+def time_weighted_return(cost, value) -> float:
+    """Compound the daily returns of a value series, taking out each day's new money.
+
+    Money invested on a day is bought at that day's close, so it is
+    subtracted from the closing value before comparing with the day before.
+    """
+    import numpy as np
+
+    flows = np.diff(cost)
+    previous = value[:-1]
+    growth = np.divide(value[1:] - flows, previous, out=np.ones(len(flows)), where=previous > 0)
+    return float(np.prod(growth) - 1)
+
+def performance(db: sqlite3.Connection, store: PriceStore, start: date = None, end: date = None) -> dict:
+    """Cost, market value and time-weighted return of the investments from start to end (inclusive).
+
+    start defaults to the first investment and end to today.
+    """
+    import numpy as np
+
+    flows = purchases(db)
+    end_day = to_day(end or datetime.utcnow().date())
+    first_day = min((days[0] for days, _ in flows.values()), default=end_day)
+    start_day = to_day(start) if start else first_day
+    # The day before start is the base every return is measured from
+    days = np.arange(start_day - 1, end_day + 1)
+
+    by_type = {}
+    total_cost, total_value = np.zeros(len(days)), np.zeros(len(days))
+    for type, type_flows in flows.items():
+        prices_at = None
+        series = store.series(type)
+        if series is not None and len(series):
+            prices_at = lambda when, type=type: store.prices_at(type, when)
+        cost, value = holdings(type_flows, prices_at, days)
+        total_cost += cost
+        total_value += value
+        by_type[type] = _figures(cost, value, prices_at is not None)
+
+    result = _figures(total_cost, total_value, all(entry['priced'] for entry in by_type.values()))
+    result.update({
+        'start': _iso(start_day),
+        'end': _iso(end_day),
+        'by_type': by_type,
+    })
+    return result
+
+def _figures(cost, value, priced: bool) -> dict:
+    days = len(cost) - 1
+    twr = time_weighted_return(cost, value)
+    return {
+        'cost': int(cost[-1]),
+        'value': int(round(value[-1])),
+        'priced': priced,
+        'time_weighted_return': twr,
+        'annualized_return': (1 + twr) ** (YEAR_DAYS / days) - 1 if days >= YEAR_DAYS and twr > -1 else None,
+    }
+
+def _iso(day: int) -> str:
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+def performance_json(result: dict) -> dict:
+    """JSON form of performance() output, with raw paise next to every formatted amount."""
+    def money(paise):
+        return {"amount": format_currency(paise), "amount_paise": paise}
+
+    def figures(entry):
+        return {
+            "cost": money(entry['cost']),
+            "value": money(entry['value']),
+            "gain": money(entry['value'] - entry['cost']),
+            "priced": entry['priced'],
+            "time_weighted_return": round(entry['time_weighted_return'], 6),
+            "annualized_return": (round(entry['annualized_return'], 6)
+                                  if entry['annualized_return'] is not None else None),
+        }
+    return dict(figures(result), start=result['start'], end=result['end'],
+                by_type={type: figures(entry) for type, entry in result['by_type'].items()})